@@ -0,0 +1,94 @@
+"""
+Compares the NumPy LHE tokenizer (lhe/LHEclass.py, parse_block) with the
+pylhe reader on an LHE file, e.g.
+
+    python -m benchmarks.lhe <events.lhe.gz> --repeat 3
+
+Reports the best events/s and peak memory of each and checks that both give
+the same event array. A synthetic file can be written with
+python -m tools.synthetic_delphes <events.lhe.gz> --lhe.
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+import pylhe
+import awkward as ak
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"lhe"))
+from LHEclass import LHEparse, iterate_lhe
+from delphes.profiling import rss
+
+
+def read_pylhe(inname:str):
+    return pylhe.to_awkward(LHEparse.read_events(inname))
+
+
+def read_fast(inname:str):
+    return next(iterate_lhe(inname))
+
+
+READERS = {"pylhe": read_pylhe, "numpy": read_fast}
+
+
+def measure(reader:str, inname:str, queue):
+
+    """
+    Runs in a fresh process so that the peak RSS is the reader's own
+    """
+
+    start = time.perf_counter()
+    events = READERS[reader](inname)
+    queue.put((time.perf_counter()-start,rss()[1],len(events)))
+
+
+def best(reader:str, inname:str, repeat:int):
+    results = []
+    for _ in range(repeat):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure,args=(reader,inname,queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return min(results)
+
+
+def equivalent(a, b):
+
+    """
+    Whether two event arrays have the same type and values, comparing
+    floating point columns to the last bit
+    """
+
+    if str(a.type)!=str(b.type):
+        return False
+    return all(ak.array_equal(a[field],b[field]) for field in a.fields)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy LHE tokenizer against pylhe")
+    parser.add_argument("infile", type=str, help="LHE file, optionally gzipped")
+    parser.add_argument("-r","--repeat", type=int, default=3)
+    parser.add_argument("--no-check", action="store_true", help="Skip the equivalence check")
+    args = parser.parse_args()
+
+    times = {}
+    for reader in READERS:
+        elapsed, peak, n_events = best(reader,args.infile,args.repeat)
+        times[reader] = elapsed
+        print(f"{reader:6s}: {elapsed:.3f} s ({n_events/elapsed:.3g} events/s, peak RSS {peak:.0f} MB)")
+    print(f"speed-up: {times['pylhe']/times['numpy']:.2f}x")
+
+    if not args.no_check:
+        same = equivalent(read_fast(args.infile),read_pylhe(args.infile))
+        print("outputs are identical" if same else "outputs DIFFER")
+        if not same:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compares the uproot skimmer (condor/skim_uproot.py) with the skim_delphes
+binary on a Delphes file, e.g.
+
+    python -m benchmarks.skim <delphes.root> --branches Light --repeat 3
+
+The binary needs ROOT in the environment (lsetup root); without it only the
+uproot skimmer is timed. Reports the best events/s of each and checks that
+both outputs hold the same branches and entries.
+"""
+
+import os
+import io
+import time
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+import uproot
+import awkward as ak
+
+from condor.skim_uproot import skim
+from condor.delphes_branches import branches as DB, light_branches
+
+BINARY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"condor","skim_delphes")
+
+
+def branch_list(choice:str):
+    if choice=="Light":
+        return light_branches
+    if choice=="HighLevel":
+        return [b for k in ["Event","Jet","Muon","Electron","MissingET"] for b in DB[k]]
+    return choice.split(",")
+
+
+def best_time(function,repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+
+def run_binary(inname,outname,branches):
+    process = subprocess.run([BINARY,inname,outname,*branches],capture_output=True,text=True)
+    if process.returncode!=0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the uproot skimmer against skim_delphes")
+    parser.add_argument("infile", type=str, help="Delphes ROOT file")
+    parser.add_argument("-b","--branches", type=str, default="Light", help="Light, HighLevel or a comma-separated list")
+    parser.add_argument("-r","--repeat", type=int, default=3)
+    parser.add_argument("--compression", type=str, default="zlib")
+    parser.add_argument("--level", type=int, default=1)
+    args = parser.parse_args()
+
+    branches = branch_list(args.branches)
+    n_events = uproot.open(f"{args.infile}:Delphes").num_entries
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_uproot = os.path.join(tmp,"uproot.root")
+        out_binary = os.path.join(tmp,"binary.root")
+
+        def uproot_skim():
+            with contextlib.redirect_stdout(io.StringIO()):
+                skim(args.infile,out_uproot,branches,compression=args.compression,level=args.level)
+
+        t_uproot = best_time(uproot_skim,args.repeat)
+        print(f"{n_events} events, {len(branches)} branches requested")
+        print(f"uproot skimmer : {t_uproot:.3f} s ({n_events/t_uproot:.3g} events/s, {os.path.getsize(out_uproot)/2**20:.1f} MB)")
+
+        try:
+            t_binary = best_time(lambda: run_binary(args.infile,out_binary,branches),args.repeat)
+        except (RuntimeError,OSError) as error:
+            print(f"skim_delphes   : not run ({error})")
+            return
+        print(f"skim_delphes   : {t_binary:.3f} s ({n_events/t_binary:.3g} events/s, {os.path.getsize(out_binary)/2**20:.1f} MB)")
+        print(f"speed-up       : {t_binary/t_uproot:.2f}x")
+
+        a = uproot.open(f"{out_uproot}:Delphes")
+        b = uproot.open(f"{out_binary}:Delphes")
+        assert a.num_entries==b.num_entries, "Different number of entries"
+        for key in a.keys(filter_name="*.*"):
+            assert ak.all(ak.ravel(a[key].array())==ak.ravel(b[key].array())), f"{key} differs"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark suite for the parsers on synthetic samples, e.g.
+
+    python -m benchmarks.suite --sizes 10000 100000 1000000 --workdir <dir> --report bench.json
+
+For each size a synthetic Delphes file and LHE file are written to workdir
+(once, they are reused by later runs) with tools.synthetic_delphes. Every
+case then runs in a fresh interpreter, so that its peak RSS is its own, and
+the wall time, CPU time, throughput and peak memory are reported per case
+and size.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import contextlib
+import subprocess
+
+from delphes.profiling import rss
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Name -> (input: "delphes", "parsed" or "lhe", function(inname, outname, n_events))
+CASES = {}
+
+
+def case(name:str, inputs:str):
+    def register(function):
+        CASES[name] = (inputs,function)
+        return function
+    return register
+
+
+@case("truth_tools","delphes")
+def truth_tools(inname,outname,n_events):
+    from delphes.reader import ReaderConfig
+    from delphes.truth_tools import load_events, parse_meta, parse_tops_and_Ws, parse_decays, parse_reco, \
+                                    PARTICLE_BRANCHES, META_BRANCHES, RECO_BRANCHES
+    config = ReaderConfig()
+    events = load_events(config.open(inname),PARTICLE_BRANCHES+META_BRANCHES+RECO_BRANCHES,config)
+    d = parse_meta(events,{})
+    d = parse_tops_and_Ws(events,d)
+    d = parse_decays(events,d)
+    parse_reco(events,{})
+
+
+@case("process","delphes")
+def process(inname,outname,n_events):
+    from delphes.process import PROCESSES, run
+    run(PROCESSES["4tops"],inname,outname)
+
+
+@case("matching","delphes")
+def matching(inname,outname,n_events):
+    # The dR matching scripts are module-level, run them as from the command line
+    sys.argv = ["parse_delphes_4tops.py",inname,outname]
+    runpy.run_module("delphes.parse_delphes_4tops",run_name="__main__")
+
+
+@case("nu2flows","parsed")
+def nu2flows(inname,outname,n_events):
+    from tools.nu2flows_parser import main
+    main(inname,outname,5)
+
+
+@case("LHEparse","lhe")
+def lheparse(inname,outname,n_events):
+    sys.path.insert(0,os.path.join(REPO,"lhe"))
+    from LHEclass import LHEparse
+    P = LHEparse(inname)
+    P.build()
+    P.write_kinematics_to_ROOT(outname,"tree")
+
+
+def inputs(workdir:str, n_events:int, seed:int=0):
+
+    """
+    Synthetic inputs of a given size, generated on first use
+    """
+
+    from tools.synthetic_delphes import generate, generate_lhe
+
+    names = {"delphes" : os.path.join(workdir,f"delphes_4tops_{n_events}.root"),
+             "parsed"  : os.path.join(workdir,f"parsed_4tops_{n_events}.root"),
+             "lhe"     : os.path.join(workdir,f"events_4tops_{n_events}.lhe.gz")}
+    if not os.path.exists(names["delphes"]):
+        print(f"Generating {n_events} Delphes events")
+        generate(names["delphes"],n_events,"4tops",seed)
+    if not os.path.exists(names["parsed"]):
+        print(f"Parsing {n_events} Delphes events for nu2flows")
+        with contextlib.redirect_stdout(io.StringIO()):
+            process(names["delphes"],names["parsed"],n_events)
+    if not os.path.exists(names["lhe"]):
+        print(f"Generating {n_events} LHE events")
+        generate_lhe(names["lhe"],n_events,"4tops",seed)
+    return names
+
+
+def measure(name:str, inname:str, outname:str, n_events:int):
+
+    """
+    Runs one case in this process and returns its measurements
+    """
+
+    function = CASES[name][1]
+    wall = time.perf_counter()
+    cpu  = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        function(inname,outname,n_events)
+    wall = time.perf_counter()-wall
+    cpu  = time.process_time()-cpu
+    return {"case":name, "events":n_events, "wall_s":wall, "cpu_s":cpu,
+            "events_per_s":n_events/wall, "peak_rss_mb":rss()[1]}
+
+
+def run(sizes:list, cases:list, workdir:str):
+
+    """
+    Runs every case at every size, each in a fresh interpreter
+    """
+
+    workdir = os.path.abspath(workdir)
+    os.makedirs(workdir,exist_ok=True)
+    results = []
+    for n_events in sizes:
+        names = inputs(workdir,n_events)
+        for name in cases:
+            outname = os.path.join(workdir,f"out_{name}_{n_events}.root")
+            command = [sys.executable,"-m","benchmarks.suite","--measure",name,names[CASES[name][0]],outname,str(n_events)]
+            process = subprocess.run(command,capture_output=True,text=True,cwd=REPO)
+            if process.returncode!=0:
+                print(f"{name:12s} {n_events:>9d} FAILED\n{process.stderr}")
+                continue
+            result = json.loads(process.stdout.splitlines()[-1])
+            results.append(result)
+            print(f"{name:12s} {n_events:>9d} {result['wall_s']:9.2f} s {result['cpu_s']:9.2f} s "
+                  f"{result['events_per_s']:11.4g} ev/s {result['peak_rss_mb']:9.0f} MB")
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the parsers on synthetic samples")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000,100_000,1_000_000])
+    parser.add_argument("--cases", type=str, nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--workdir", type=str, default="benchmark_data", help="Directory for the synthetic inputs and outputs")
+    parser.add_argument("--report", type=str, help="JSON file for the results", required=False)
+    parser.add_argument("--measure", type=str, nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        name, inname, outname, n_events = args.measure
+        print(json.dumps(measure(name,inname,outname,int(n_events))))
+        return
+
+    print(f"{'case':12s} {'events':>9s} {'wall':>11s} {'cpu':>11s} {'throughput':>16s} {'peak RSS':>12s}")
+    results = run(args.sizes,args.cases,args.workdir)
+    if args.report:
+        with open(args.report,"w") as f:
+            json.dump(results,f,indent=2)
+
+
+if __name__ == "__main__":
+    main()
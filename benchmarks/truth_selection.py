@@ -0,0 +1,73 @@
+"""
+Compares the awkward-op truth selection (parse_tops_and_Ws + parse_decays)
+with the fused kernel in delphes.selection on a Delphes file, e.g.
+
+    python -m benchmarks.truth_selection <delphes.root> --repeat 3
+
+Checks that both give the same Truth entries and reports the best wall time
+of each.
+"""
+
+import io
+import time
+import argparse
+import contextlib
+
+import uproot
+import awkward as ak
+
+from delphes.truth_tools import load_events, parse_tops_and_Ws, parse_decays, PARTICLE_BRANCHES
+from delphes.selection import select_truth
+
+
+def awkward_chain(events):
+    d = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        d = parse_tops_and_Ws(events,d)
+        d = parse_decays(events,d)
+    return d
+
+
+def fused(events):
+    return select_truth(events,{})
+
+
+def best_time(function,events,repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(events)
+        times.append(time.perf_counter()-start)
+    return min(times), result
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the fused truth selection")
+    parser.add_argument("infile", type=str, help="Delphes ROOT file")
+    parser.add_argument("-r","--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    events = load_events(uproot.open(f"{args.infile}:Delphes"),PARTICLE_BRANCHES)
+    n_events = len(events["Particle.PID"])
+
+    # Compile the kernels outside of the timed region
+    fused({k:v[:1] for k,v in events.items()})
+    awkward_chain({k:v[:1] for k,v in events.items()})
+
+    t_chain, reference = best_time(awkward_chain,events,args.repeat)
+    t_fused, result    = best_time(fused,events,args.repeat)
+
+    assert reference.keys()==result.keys(), "Different output fields"
+    for key in reference:
+        assert ak.all(ak.num(reference[key],axis=1)==ak.num(result[key],axis=1)), f"{key} differs in multiplicity"
+        assert ak.all(ak.flatten(reference[key])==ak.flatten(result[key])), f"{key} differs"
+
+    print(f"{n_events} events")
+    print(f"awkward chain : {t_chain:.3f} s ({n_events/t_chain:.3g} events/s)")
+    print(f"fused kernel  : {t_fused:.3f} s ({n_events/t_fused:.3g} events/s)")
+    print(f"speed-up      : {t_chain/t_fused:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Content-addressed MadLAD bundle shipped to the generation jobs instead of the
+whole ../MadLAD tree, e.g.
+
+    python -m condor.bundle --config 4tops.yaml
+
+Packs the MadLAD sources, models and the process config (with the configs it
+lists in its Hydra defaults) into bundles/madlad-<hash>.tar.gz, leaving out
+the outputs of earlier runs (the save_dir of every process config, ROOT, LHE
+and HepMC files), git metadata and Python caches. The hash covers the path,
+mode and content of every bundled file, so an unchanged MadLAD reuses the
+existing bundle. Jobs unpack it once per node into a node-local cache,
+/tmp/madlad-bundles-<uid> unless MADLAD_BUNDLE_CACHE is set on the nodes, and
+copy it from there while the hash matches.
+"""
+
+import os
+import glob
+import fnmatch
+import hashlib
+import tarfile
+import argparse
+
+import yaml
+
+BUNDLE_DIR = "bundles"
+
+# Never bundled: run outputs, large event files and caches
+EXCLUDE = [".git", "__pycache__", "*.pyc", "*_condorrun_*", "*.root", "*.lhe", "*.lhe.gz", "*.hepmc", "*.hepmc.gz"]
+
+# Node-local cache of unpacked bundles on the worker nodes. Not under
+# $TMPDIR, which HTCondor points at the job's own scratch directory.
+BUNDLE_CACHE = "${MADLAD_BUNDLE_CACHE:-/tmp/madlad-bundles-$(id -u)}"
+
+
+def config_files(madlad:str, config:str):
+
+    """
+    Process configs needed by config: itself and, recursively, the configs
+    named in its Hydra defaults list
+    """
+
+    needed, todo = set(), [config]
+    while todo:
+        name = todo.pop()
+        path = os.path.join(madlad,"processes",name if name.endswith(".yaml") else f"{name}.yaml")
+        if path in needed or not os.path.isfile(path):
+            continue
+        needed.add(path)
+        with open(path) as stream:
+            cfg = yaml.safe_load(stream) or {}
+        for default in cfg.get("defaults",[]) if isinstance(cfg,dict) else []:
+            if isinstance(default,str) and default!="_self_":
+                todo.append(default)
+            elif isinstance(default,dict):
+                todo.extend(v for v in default.values() if isinstance(v,str))
+    return needed
+
+
+def run_outputs(madlad:str):
+
+    """
+    Output directories and files of every process config in MadLAD
+    """
+
+    outputs = set()
+    for path in glob.glob(os.path.join(madlad,"processes","*.yaml")):
+        try:
+            with open(path) as stream:
+                save_dir = yaml.safe_load(stream)["gen"]["block_model"]["save_dir"]
+        except (yaml.YAMLError,KeyError,TypeError):
+            continue
+        outputs.add(os.path.join(madlad,save_dir))
+        outputs.add(os.path.join(madlad,f"{save_dir}.root"))
+    return outputs
+
+
+def bundle_files(madlad:str, config:str, exclude:list=EXCLUDE):
+
+    """
+    Sorted paths of the files to bundle for config
+    """
+
+    configs = config_files(madlad,config)
+    outputs = run_outputs(madlad)
+    processes = os.path.join(madlad,"processes")
+    files = []
+    for root,dirs,names in os.walk(madlad):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root,d) not in outputs and not any(fnmatch.fnmatch(d,p) for p in exclude))
+        for name in names:
+            path = os.path.join(root,name)
+            if path in outputs or any(fnmatch.fnmatch(name,p) for p in exclude):
+                continue
+            if root==processes and name.endswith(".yaml") and path not in configs:
+                continue
+            files.append(path)
+    return sorted(files)
+
+
+def content_hash(madlad:str, files:list):
+
+    """
+    Hash of the relative path, mode and content of every file
+    """
+
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(os.path.relpath(path,madlad).encode()+b"\0")
+        digest.update(oct(os.stat(path).st_mode).encode()+b"\0")
+        with open(path,"rb") as file:
+            for block in iter(lambda: file.read(1<<20),b""):
+                digest.update(block)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def build_bundle(madlad:str, config:str, outdir:str=BUNDLE_DIR, exclude:list=EXCLUDE, level:int=6):
+
+    """
+    Path of the bundle of MadLAD for config, built only if no bundle with the
+    same content exists in outdir. Bundles unpack into a MadLAD directory.
+    """
+
+    madlad = os.path.normpath(madlad)
+    files  = bundle_files(madlad,config,exclude)
+    name   = f"madlad-{content_hash(madlad,files)[:16]}"
+    path   = os.path.join(outdir,f"{name}.tar.gz")
+    if os.path.isfile(path):
+        print(f"Reusing MadLAD bundle {path}")
+        return path
+
+    os.makedirs(outdir,exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with tarfile.open(tmp,"w:gz",compresslevel=level) as tar:
+        for f in files:
+            tar.add(f,arcname=os.path.join("MadLAD",os.path.relpath(f,madlad)),recursive=False)
+    os.replace(tmp,path)
+    print(f"Wrote MadLAD bundle {path} ({len(files)} files, {os.path.getsize(path)/2**20:.1f} MB)")
+    return path
+
+
+def unpack_script(bundle:str, source:str=None):
+
+    """
+    Job script lines which leave a private MadLAD directory in the job
+    directory, unpacking the bundle into the node-local cache first if it is
+    not there yet. The archive is read from source (e.g. a path on a shared
+    filesystem) if given, otherwise from the transferred file. The unpack is
+    locked so that the jobs of a node unpack it only once.
+    """
+
+    name = os.path.basename(bundle)[:-len(".tar.gz")]
+    archive = source or os.path.basename(bundle)
+    return f"""# MadLAD bundle {name}, unpacked once per node
+BUNDLE_CACHE={BUNDLE_CACHE}
+mkdir -p $BUNDLE_CACHE
+(
+    flock 9
+    if [ ! -d $BUNDLE_CACHE/{name} ]; then
+        rm -rf $BUNDLE_CACHE/{name}.tmp && mkdir $BUNDLE_CACHE/{name}.tmp
+        tar -xzf {archive} -C $BUNDLE_CACHE/{name}.tmp && mv $BUNDLE_CACHE/{name}.tmp $BUNDLE_CACHE/{name}
+    fi
+) 9>$BUNDLE_CACHE/{name}.lock
+cp -a --reflink=auto $BUNDLE_CACHE/{name}/MadLAD . || exit 1
+"""
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Build the MadLAD bundle of a process config")
+    parser.add_argument("--config", type=str, required=True, help="Config name, no need to point to the directory")
+    parser.add_argument("--madlad", type=str, default="MadLAD", help="MadLAD directory")
+    parser.add_argument("--outdir", type=str, default=BUNDLE_DIR, help="Directory of the bundles")
+    parser.add_argument("--exclude", type=str, nargs="+", default=[], help="More file or directory patterns to leave out")
+    args = parser.parse_args()
+
+    build_bundle(args.madlad,args.config,args.outdir,EXCLUDE+args.exclude)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,30 @@ from datetime import datetime
 import argparse
 from warnings import warn 
 
+from condor.resources import load_profile, resource_requests, PROFILE_DIR, DEFAULT_CPUS, DEFAULT_MEMORY
+from condor.skim import write_job_script as write_skim_script, SKIMMERS
+from condor.delphes_branches import branches as DB, light_branches
+from condor.bundle import build_bundle, unpack_script, BUNDLE_DIR
+from condor.seeds import allocate_seeds, MAX_SEED, SEED_FILE
+
 
 class Mad4Condor(object):
     
-    def __init__(self,config_name,cfg,Njobs,lhe,hepmc):
+    def __init__(self,config_name,cfg,Njobs,lhe,hepmc,request_cpus=DEFAULT_CPUS,request_memory=DEFAULT_MEMORY,
+                 seed=None,dag=False,skimmer="binary",branches="Light",parse_process=None,bundle=None,bundle_shared=False,
+                 seed_file=SEED_FILE):
         self.config_name    = config_name
         self.cfg            = cfg
         self.Njobs          = Njobs
+        self.request_cpus   = request_cpus
+        self.request_memory = request_memory
+        self.seed           = seed
+        self.dag            = dag
+        self.skimmer        = skimmer
+        self.branches       = branches
+        self.parse_process  = parse_process
+        self.bundle         = bundle
+        self.bundle_shared  = bundle_shared
         self.name           = self.cfg["gen"]["block_model"]["save_dir"]
         self.outputs_string = ""
         self.remaps_string  = ""
@@ -31,9 +48,14 @@ class Mad4Condor(object):
             raise ValueError("auto-launch must be set to true for running with Condor")
         
         self.create_directory()
+        # A block of seeds of its own, or the --seed block, in the ledger
+        self.seed = allocate_seeds(self.Njobs,self.condor_directory_name,self.seed,seed_file)
+        print(f"Seeding the jobs with {self.seed} to {self.seed+self.Njobs-1}")
         self.write_job_script()
         self.specify_outputs()
         self.write_submit_file()        
+        if self.dag:
+            self.write_dag()
 
     
     def create_directory(self):
@@ -64,8 +86,12 @@ unset __conda_setup
 # <<< conda initialize <<<
 conda activate madlad
 
+{self.seed_line()}
+echo "MadLAD seed $seed"
+
+{self.unpack_lines()}
 cd MadLAD   # Execute in MadLAD folder
-python -m madlad.generate --config-name={self.config_name} gen.block_run.iseed=$RANDOM
+python -m madlad.generate --config-name={self.config_name} gen.block_run.iseed=$seed
 cd -        # Return to condor work directory
 
         """
@@ -73,6 +99,42 @@ cd -        # Return to condor work directory
         with open(f"{self.condor_directory_name}/job.sh","w") as file:
             file.write(text)
                 
+    def unpack_lines(self):
+
+        """
+        Job script lines unpacking the MadLAD bundle, empty when the MadLAD
+        directory itself is transferred
+        """
+
+        if self.bundle is None:
+            return ""
+        return unpack_script(self.bundle,os.path.abspath(self.bundle) if self.bundle_shared else None)
+
+    def transfer_inputs(self):
+
+        """
+        transfer_input_files of the generation jobs: the whole MadLAD
+        directory, the bundle, or nothing when the jobs read the bundle
+        from a shared filesystem
+        """
+
+        if self.bundle is None:
+            return "../MadLAD"
+        if self.bundle_shared:
+            return ""
+        return os.path.relpath(self.bundle,self.condor_directory_name)
+
+    def seed_line(self):
+
+        """
+        Bash line setting the MadLAD seed: the first seed of the production's
+        block plus the Process ($2, the job index in the DAG), so that the
+        seed does not depend on the cluster and a resubmitted process reuses
+        the seed of the one it replaces
+        """
+
+        return f"seed=$(( {self.seed} + $2 ))"
+
     def specify_outputs(self):
         
         evt_dir  = 'run_01_decayed_1'  if 'block_madspin' in list(self.cfg['gen'].keys()) else 'run_01'
@@ -101,17 +163,18 @@ cd -        # Return to condor work directory
     def write_submit_file(self):
         
         text=f"""# Submit file for HTCondor
+# config = {self.config_name}
 universe   = vanilla
 executable = job.sh
-arguments  = $(RandomNumber)
+arguments  = $(ClusterId) $(Process)
 output     = $(ClusterId).$(Process).out
 error      = $(ClusterId).$(Process).err
 log        = $(ClusterId).$(Process).log
-request_cpus = 12
-request_memory = 50 GB
+request_cpus = {self.request_cpus}
+request_memory = {self.request_memory} MB
 transfer_executable = True
 should_transfer_files = YES
-transfer_input_files    = ../MadLAD
+transfer_input_files    = {self.transfer_inputs()}
 transfer_output_files = {self.outputs_string}
 transfer_output_remaps = "{self.remaps_string}"
 
@@ -121,6 +184,99 @@ queue {self.Njobs}"""
 
         with open(f"{self.condor_directory_name}/submit.sub","w") as file:
             file.write(text)
+
+    def write_dag(self):
+
+        """
+        DAGMan workflow (workflow.dag) with one generation node per job, each
+        the parent of its own skim node and, with a parse process, its own
+        delphes.process node, so that post-processing starts as soon as each
+        generation job finishes. Submitted with condor_submit_dag workflow.dag.
+        """
+
+        if "block_delphes" not in self.cfg["gen"]:
+            raise ValueError("The DAG workflow skims and parses the Delphes output, which is turned off in this config")
+
+        path = self.condor_directory_name
+        # Outputs named after the node index instead of the cluster, which
+        # the downstream nodes cannot know in advance
+        remaps  = self.remaps_string.replace("$(Cluster)_$(Process)","$(job)")
+        delphes = "delphes_$(job).root"
+
+        with open(f"{path}/submit.sub") as file:
+            gen = file.read()
+        gen = gen.replace("arguments  = $(ClusterId) $(Process)","arguments  = $(ClusterId) $(job)")
+        gen = gen.replace(f'transfer_output_remaps = "{self.remaps_string}"',f'transfer_output_remaps = "{remaps}"')
+        gen = gen.replace(f"queue {self.Njobs}","queue")
+        with open(f"{path}/gen.sub","w") as file:
+            file.write(gen)
+
+        if self.branches=="HighLevel":
+            branches = [b for k in ["Event","Jet","Muon","Electron","MissingET"] for b in DB[k]]
+        else:
+            branches = light_branches
+        write_skim_script(path,"skim.root"," ".join(branches),self.skimmer)
+
+        nodes = {"skim" : f"""# Skim node of the DAG workflow
+universe   = vanilla
+executable = job_skim.sh
+arguments  = {delphes}
+output     = skim_$(job).out
+error      = skim_$(job).err
+log        = skim_$(job).log
+getenv = True
+request_cpus = 1
+request_memory = 2 GB
+transfer_executable = True
+should_transfer_files = YES
+transfer_input_files    = ../condor/{SKIMMERS[self.skimmer]}, {delphes}
+transfer_output_files = skim.root
+transfer_output_remaps = "skim.root = skim_$(job).root"
+
+when_to_transfer_output = ON_EXIT 
+
+queue"""}
+
+        if self.parse_process:
+            with open(f"{path}/job_parse.sh","w") as file:
+                file.write(f"""#!/bin/bash
+python3 -m delphes.process $1 parsed.root --process {self.parse_process} --threads 1
+        """)
+            nodes["parse"] = f"""# Parse node of the DAG workflow
+universe   = vanilla
+executable = job_parse.sh
+arguments  = {delphes}
+output     = parse_$(job).out
+error      = parse_$(job).err
+log        = parse_$(job).log
+getenv = True
+request_cpus = 1
+request_memory = 4 GB
+transfer_executable = True
+should_transfer_files = YES
+transfer_input_files    = ../delphes, {delphes}
+transfer_output_files = parsed.root
+transfer_output_remaps = "parsed.root = parsed_$(job).root"
+
+when_to_transfer_output = ON_EXIT 
+
+queue"""
+
+        for name,text in nodes.items():
+            with open(f"{path}/{name}.sub","w") as file:
+                file.write(text)
+
+        lines = []
+        for job in range(self.Njobs):
+            lines.append(f"JOB gen_{job} gen.sub")
+            lines.append(f'VARS gen_{job} job="{job}"')
+            for name in nodes:
+                lines.append(f"JOB {name}_{job} {name}.sub")
+                lines.append(f'VARS {name}_{job} job="{job}"')
+            lines.append(f"PARENT gen_{job} CHILD {' '.join(f'{name}_{job}' for name in nodes)}")
+        with open(f"{path}/workflow.dag","w") as file:
+            file.write("\n".join(lines)+"\n")
+        print(f"Wrote {path}/workflow.dag with {self.Njobs} generation nodes and their {', '.join(nodes)} nodes, submit with condor_submit_dag workflow.dag")
             
        
 def main():
@@ -130,6 +286,18 @@ def main():
     parser.add_argument("--Njobs", type=int, help="Number of jobs")
     parser.add_argument("--lhe",action="store_true",required=False)
     parser.add_argument("--hepmc",action="store_true",required=False)
+    parser.add_argument("--profiles",type=str,default=PROFILE_DIR,help="Directory of the resource profiles written by condor.resources")
+    parser.add_argument("--margin",type=float,default=0.2,help="Safety margin on the measured resources")
+    parser.add_argument("--no-profile",action="store_true",help="Use the default requests even if the config has a profile")
+    parser.add_argument("--seed",type=int,help="Base seed, job i uses seed+i. Defaults to the next free block of the seed ledger")
+    parser.add_argument("--seed-ledger",type=str,default=SEED_FILE,help="Ledger of the seeds handed out to earlier productions")
+    parser.add_argument("--dag",action="store_true",help="Also write a DAGMan workflow in which each generation job feeds its own skim and parse jobs")
+    parser.add_argument("--skimmer",type=str,choices=list(SKIMMERS),default="binary",help="Skimmer of the DAG skim nodes")
+    parser.add_argument("--skim-branches",type=str,choices=["Light","HighLevel"],default="Light",help="Branches kept by the DAG skim nodes")
+    parser.add_argument("--parse",type=str,help="delphes.process process of the DAG parse nodes, e.g. 4tops. No parse nodes without it")
+    parser.add_argument("--no-bundle",action="store_true",help="Transfer the whole MadLAD directory to every job instead of the MadLAD bundle")
+    parser.add_argument("--bundle-dir",type=str,default=BUNDLE_DIR,help="Directory of the MadLAD bundles")
+    parser.add_argument("--bundle-shared",action="store_true",help="Read the bundle from the shared filesystem on a node cache miss instead of transferring it")
     
     args = parser.parse_args()   
          
@@ -142,7 +310,21 @@ def main():
             print(exc)
           
     config_name = config_filepath.split("/")[-1]
+
+    ## Resource requests measured by earlier runs of the config
+    profile = None if args.no_profile else load_profile(config_name,args.profiles)
+    cpus, memory = resource_requests(profile,args.margin)
+    if profile is not None:
+        print(f"Using the resource profile of {config_name} ({profile['summary']['jobs']} jobs): {cpus} CPUs, {memory} MB")
+    
+    if args.seed is not None and not 0<args.seed<=MAX_SEED-args.Njobs:
+        raise ValueError(f"--seed must be between 1 and {MAX_SEED-args.Njobs}")
+    
+    ## Only the files the config needs, packed once and cached on the nodes
+    bundle = None if args.no_bundle else build_bundle("MadLAD",config_name,args.bundle_dir)
     
-    RUN = Mad4Condor(config_name,cfg,args.Njobs,args.lhe,args.hepmc)
+    RUN = Mad4Condor(config_name,cfg,args.Njobs,args.lhe,args.hepmc,cpus,memory,
+                     seed=args.seed,dag=args.dag,skimmer=args.skimmer,branches=args.skim_branches,parse_process=args.parse,
+                     bundle=bundle,bundle_shared=args.bundle_shared,seed_file=args.seed_ledger)
     
 main()
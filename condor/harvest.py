@@ -0,0 +1,304 @@
+"""
+Checks a finished HTCondor run of condor.generate or condor.skim, e.g.
+
+    python -m condor.harvest <run directory> [--submit skim_delphes_7_skim.sub]
+
+Reads the job logs, .err files and the remapped outputs of the submission and
+classifies every process as done, failed (non-zero exit or aborted), empty
+(an output is missing or has zero size), running or missing (no log). Reports
+the events per hour and the wall-time distribution of the done jobs, and
+writes <submit>_resubmit.sub queueing only the failed, empty and missing
+processes under their original process IDs and with the cluster ID of the
+first submission in their output, error, log and remapped output names, so
+that their outputs keep the names of the first submission. The job log of a
+resubmitted process then holds all its attempts, and it is judged on the
+events of the latest cluster in it.
+"""
+
+import os
+import re
+import gzip
+import json
+import argparse
+
+import numpy as np
+import uproot
+
+from condor.resources import parse_log, job_logs, log_clusters, LOG_NAME
+
+QUEUE_FROM = re.compile(r"^queue\s+(.*?)\s+from\s+(\S+)\s*$")
+QUEUE_N    = re.compile(r"^queue\s*(\d*)\s*$")
+QUEUE_IN   = re.compile(r"^queue\s+(\w+)\s+in\s*\((.*)\)\s*$")
+
+# Jobs slower than SLOW times the median wall time are listed
+SLOW = 2
+
+RESUBMIT = ("failed","empty","missing")
+
+# Settings holding the names of the files a process writes
+NAMED_OUTPUTS = ("output","error","log","transfer_output_files","transfer_output_remaps")
+
+
+def read_submit(path:str):
+
+    """
+    Settings of a submit file as a dict, with the queue statement split into
+    the number of processes and, for a queue ... from <file> or
+    queue <var> in (...) statement, its variables and items
+    """
+
+    settings = {}
+    with open(path) as file:
+        lines = [line.strip() for line in file]
+    for line in lines:
+        if not line or line.startswith("#"):
+            continue
+        if (match:=QUEUE_FROM.match(line)):
+            variables, items = match.groups()
+            with open(os.path.join(os.path.dirname(path),items)) as file:
+                settings["queue_items"] = [item.rstrip("\n") for item in file if item.strip()]
+            settings["queue_variables"] = [v.strip() for v in variables.split(",")]
+            settings["queue_file"] = items
+            settings["processes"]  = len(settings["queue_items"])
+        elif (match:=QUEUE_IN.match(line)):
+            variable, items = match.groups()
+            settings["queue_items"] = [item.strip() for item in items.split(",") if item.strip()]
+            settings["queue_variables"] = [variable]
+            settings["processes"]  = len(settings["queue_items"])
+        elif (match:=QUEUE_N.match(line)):
+            settings["processes"] = int(match.group(1) or 1)
+        elif "=" in line:
+            key, value = line.split("=",1)
+            settings[key.strip().lower()] = value.strip()
+    return settings
+
+
+def output_templates(settings:dict):
+
+    """
+    Names of the outputs of each process after the transfer_output_remaps,
+    with the $(Cluster) and $(Process) macros left in place
+    """
+
+    remaps = settings.get("transfer_output_remaps","").strip('"')
+    return [remap.split("=",1)[1].strip() for remap in remaps.split(";") if "=" in remap]
+
+
+def expand(template:str, cluster:int, process:int):
+    for macro in ("$(ClusterId)","$(Cluster)"):
+        template = template.replace(macro,str(cluster))
+    for macro in ("$(ProcId)","$(Process)","$(Job)"):
+        template = template.replace(macro,str(process))
+    return template
+
+
+def count_events(path:str):
+
+    """
+    Events in an output: entries of the first tree of a ROOT file, or <event>
+    blocks of a (gzipped) LHE file. None for other outputs.
+    """
+
+    if path.endswith(".root"):
+        with uproot.open(path) as file:
+            trees = [key for key,cls in file.classnames().items() if cls=="TTree"]
+            return file[trees[0]].num_entries if trees else 0
+    if ".lhe" in path:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path,"rb") as file:
+            return sum(line.startswith(b"<event") for line in file)
+    return None
+
+
+def last_line(path:str):
+    if not os.path.isfile(path):
+        return ""
+    with open(path,errors="replace") as file:
+        lines = [line.strip() for line in file if line.strip()]
+    return lines[-1] if lines else ""
+
+
+def harvest(directory:str, submit:str):
+
+    """
+    Status, wall time, events and error of every process of a submission, as
+    a dict keyed on the process ID. Resubmitted processes are judged on their
+    latest attempt.
+    """
+
+    settings  = read_submit(os.path.join(directory,submit))
+    templates = output_templates(settings)
+
+    # Latest cluster of each process, and the cluster its files are named
+    # after: the same unless it was resubmitted under the first cluster's names
+    attempts = {}
+    for log in job_logs(directory):
+        named, process = map(int,LOG_NAME.fullmatch(os.path.basename(log)).groups())
+        cluster = max(log_clusters(log)|{named})
+        if cluster>=attempts.get(process,(-1,))[0]:
+            attempts[process] = (cluster,named,log)
+
+    jobs = {}
+    for process in range(settings["processes"]):
+        if process not in attempts:
+            jobs[process] = {"status":"missing"}
+            continue
+        cluster, named, log = attempts[process]
+        job = {"cluster":cluster,"status":"running","wall_s":None,"events":None,"error":""}
+        jobs[process] = job
+
+        with open(log) as file:
+            aborted = re.search(rf"^009 \(0*{cluster}\.",file.read(),re.MULTILINE) is not None
+        # A resubmitted process has another process ID within its cluster
+        terminated = [r for r in parse_log(log) if r["job"].split(".")[0]==str(cluster)]
+        err = os.path.join(directory,f"{named}.{process}.err")
+        if aborted and not terminated:
+            job.update(status="failed",error="aborted")
+            continue
+        if not terminated:
+            continue
+        record = terminated[-1]
+        job["wall_s"] = record["wall_s"]
+        if record["return_value"]!=0:
+            job.update(status="failed",error=last_line(err) or f"return value {record['return_value']}")
+            continue
+
+        job["status"] = "done"
+        for template in templates:
+            path = os.path.join(directory,expand(template,named,process))
+            if not os.path.isfile(path) or os.path.getsize(path)==0:
+                job.update(status="empty",error=f"{os.path.basename(path)} missing or empty")
+                break
+            if job["events"] is None:
+                try:
+                    job["events"] = count_events(path)
+                except Exception as error:
+                    job.update(status="empty",error=f"{os.path.basename(path)} unreadable: {error}")
+                    break
+    return jobs
+
+
+def first_cluster(directory:str):
+
+    """
+    Cluster of the first submission in a run directory, from its job log
+    names. None without logs.
+    """
+
+    clusters = [int(LOG_NAME.fullmatch(os.path.basename(p)).group(1)) for p in job_logs(directory)]
+    return min(clusters,default=None)
+
+
+def write_resubmit(directory:str, submit:str, processes:list):
+
+    """
+    Copy of the submit file queueing only processes, under their original
+    process IDs through the $(Job) macro, and writing their files under the
+    names of the first submission's cluster
+    """
+
+    settings = read_submit(os.path.join(directory,submit))
+    cluster  = first_cluster(directory)
+    name = f"{submit[:-4] if submit.endswith('.sub') else submit}_resubmit.sub"
+    with open(os.path.join(directory,submit)) as file:
+        lines = file.read().replace("$(ProcId)","$(Job)").replace("$(Process)","$(Job)").splitlines()
+
+    text = []
+    for line in lines:
+        key = line.split("=",1)[0].strip().lower() if "=" in line else None
+        if key in NAMED_OUTPUTS and cluster is not None:
+            line = line.replace("$(ClusterId)",str(cluster)).replace("$(Cluster)",str(cluster))
+        if QUEUE_FROM.match(line.strip()):
+            # Item lines of the failed processes, each prefixed with its ID
+            items = f"{settings['queue_file'].rsplit('.',1)[0]}_resubmit.txt"
+            with open(os.path.join(directory,items),"w") as file:
+                file.writelines(f"{p} {settings['queue_items'][p]}\n" for p in processes)
+            text.append(f"queue Job, {', '.join(settings['queue_variables'])} from {items}")
+        elif QUEUE_N.match(line.strip()):
+            text.append(f"queue Job in ({', '.join(map(str,processes))})")
+        else:
+            text.append(line)
+
+    with open(os.path.join(directory,name),"w") as file:
+        file.write("\n".join(text))
+    return name
+
+
+def distribution(values):
+    values = np.asarray(values,dtype=float)
+    return {"min"   : float(values.min()),
+            "median": float(np.median(values)),
+            "p95"   : float(np.percentile(values,95)),
+            "max"   : float(values.max())}
+
+
+def summarise(jobs:dict):
+
+    """
+    Process counts per status, wall-time distribution of the done jobs and
+    their throughput in events per hour: per job, and over the summed wall
+    time of all done jobs
+    """
+
+    summary = {"processes":len(jobs),"status":{}}
+    for job in jobs.values():
+        summary["status"][job["status"]] = summary["status"].get(job["status"],0)+1
+
+    done = [job for job in jobs.values() if job["status"]=="done" and job["wall_s"]]
+    if done:
+        wall = [job["wall_s"] for job in done]
+        summary["wall_s"] = distribution(wall)
+        counted = [job for job in done if job["events"] is not None]
+        if counted:
+            summary["events"] = sum(job["events"] for job in counted)
+            summary["events_per_hour"] = summary["events"]/(sum(job["wall_s"] for job in counted)/3600)
+            summary["events_per_hour_per_job"] = distribution([job["events"]/(job["wall_s"]/3600) for job in counted])
+        summary["slow"] = sorted(p for p,job in jobs.items() if job["status"]=="done" and (job["wall_s"] or 0)>SLOW*summary["wall_s"]["median"])
+    return summary
+
+
+def find_submit(directory:str):
+    submits = [f for f in sorted(os.listdir(directory)) if f.endswith(".sub") and not f.endswith("_resubmit.sub")]
+    if len(submits)!=1:
+        raise ValueError(f"Found {len(submits)} submit files in {directory}, choose one with --submit")
+    return submits[0]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check a Condor run and write a resubmission of its failed processes")
+    parser.add_argument("directory", type=str, help="Run directory holding the submit file, job logs and outputs")
+    parser.add_argument("--submit", type=str, help="Submit file of the run, if the directory holds several", required=False)
+    parser.add_argument("--report", type=str, help="Write the per-process status and summary to this JSON file", required=False)
+    args = parser.parse_args()
+
+    submit  = args.submit or find_submit(args.directory)
+    jobs    = harvest(args.directory,submit)
+    summary = summarise(jobs)
+
+    print(f"{submit}: {summary['processes']} processes, "+", ".join(f"{n} {status}" for status,n in sorted(summary["status"].items())))
+    if "wall_s" in summary:
+        w = summary["wall_s"]
+        print(f"Wall time (h)   : min {w['min']/3600:.2f}  median {w['median']/3600:.2f}  p95 {w['p95']/3600:.2f}  max {w['max']/3600:.2f}")
+    if "events" in summary:
+        e = summary["events_per_hour_per_job"]
+        print(f"Events          : {summary['events']} ({summary['events_per_hour']:.0f} events/hour of job wall time)")
+        print(f"Events/hour/job : min {e['min']:.0f}  median {e['median']:.0f}  max {e['max']:.0f}")
+    if summary.get("slow"):
+        print(f"Slower than {SLOW}x the median: {' '.join(map(str,summary['slow']))}")
+
+    failed = sorted(p for p,job in jobs.items() if job["status"] in RESUBMIT)
+    for process in failed:
+        job = jobs[process]
+        print(f" - {process:5d} {job['status']:8s} {job.get('error','')}")
+    if failed:
+        name = write_resubmit(args.directory,submit,failed)
+        print(f"Wrote {name} for {len(failed)} processes")
+
+    if args.report:
+        with open(args.report,"w") as file:
+            json.dump({"submit":submit,"summary":summary,"jobs":jobs},file,indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Runs a submit file written by condor.generate, condor.skim or
+condor.harvest on the local machine instead of HTCondor, e.g.
+
+    python -m condor.local <run directory>/submit.sub -j 8
+
+Each process gets its own scratch directory under <run directory>/_local with
+its transfer_input_files (files are linked, directories copied since jobs
+write into them) and runs the executable with its arguments, expanding
+$(Process), $(ClusterId) and the queue variables as HTCondor does. Its
+stdout, stderr and transfer_output_files, renamed by the
+transfer_output_remaps, end up in the run directory, and a job log in the
+HTCondor format is written so that condor.harvest and condor.resources work
+on local runs as well.
+
+Processes run on a bounded pool: at most -j at once, and only as many as fit
+in --cpus cores and --memory MB given their request_cpus and request_memory.
+"""
+
+import os
+import re
+import time
+import shlex
+import shutil
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+from condor.harvest import read_submit
+from condor.resources import job_logs, log_clusters, LOG_NAME
+
+MACRO = re.compile(r"\$\((\w+)\)")
+MEMORY_UNITS = {"K":1/1024, "KB":1/1024, "M":1, "MB":1, "G":1024, "GB":1024, "T":1024**2, "TB":1024**2}
+
+
+def expand(text:str, macros:dict):
+
+    """
+    Substitutes the $(name) macros of text, case-insensitively as HTCondor
+    does. Unknown macros are left in place.
+    """
+
+    return MACRO.sub(lambda m: str(macros.get(m.group(1).lower(),m.group(0))),text)
+
+
+def item_values(variables:list, item:str):
+
+    """
+    Values of the queue variables in one queue item: split on commas and
+    whitespace, with the last variable taking the rest of the item
+    """
+
+    values = re.split(r"[\s,]+",item.strip(),maxsplit=len(variables)-1)
+    return dict(zip([v.lower() for v in variables],values))
+
+
+def memory_mb(request:str):
+    number, unit = re.fullmatch(r"\s*([\d.]+)\s*([A-Za-z]*)\s*",request).groups()
+    return float(number)*MEMORY_UNITS.get(unit.upper() or "MB",1)
+
+
+def total_memory():
+    return os.sysconf("SC_PAGE_SIZE")*os.sysconf("SC_PHYS_PAGES")/2**20
+
+
+def next_cluster(directory:str):
+
+    """
+    Cluster ID of a local run: one above the clusters of the job logs in the
+    directory, named or inside them, so that condor.harvest judges processes
+    on the latest attempt
+    """
+
+    clusters = [max(log_clusters(p)|{int(LOG_NAME.fullmatch(os.path.basename(p)).group(1))}) for p in job_logs(directory)]
+    return max(clusters,default=0)+1
+
+
+def _clock(seconds:float):
+    seconds = int(seconds)
+    return f"{seconds//86400} {seconds//3600%24:02d}:{seconds//60%60:02d}:{seconds%60:02d}"
+
+
+def _event(code:str, cluster:int, process:int, text:str, body:str=""):
+    return f"{code} ({cluster:03d}.{process:03d}.000) {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {text}\n{body}...\n"
+
+
+class Slots:
+
+    """
+    Cores and memory (MB) shared by the running processes. A process waits
+    until its request fits; a request larger than the whole machine runs on
+    its own.
+    """
+
+    def __init__(self, cpus:float, memory:float):
+        self.cpus      = cpus
+        self.memory    = memory
+        self.free      = [cpus,memory]
+        self.running   = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, cpus:float, memory:float):
+        with self.condition:
+            while self.running and (cpus>self.free[0] or memory>self.free[1]):
+                self.condition.wait()
+            self.free[0] -= cpus
+            self.free[1] -= memory
+            self.running += 1
+
+    def release(self, cpus:float, memory:float):
+        with self.condition:
+            self.free[0] += cpus
+            self.free[1] += memory
+            self.running -= 1
+            self.condition.notify_all()
+
+
+class LocalRun:
+
+    """
+    Local execution of a submit file.
+    Args:
+    - submit  : path of the submit file, relative paths in it are taken from
+                its directory as HTCondor does
+    - workers : processes running at once
+    - cpus    : cores shared by the processes, defaults to all cores
+    - memory  : memory in MB shared by the processes, defaults to all memory
+    - keep    : keep the scratch directory of each process
+    """
+
+    def __init__(self, submit:str, workers:int=None, cpus:float=None, memory:float=None, keep:bool=False):
+        self.submit    = submit
+        self.directory = os.path.dirname(os.path.abspath(submit))
+        self.settings  = read_submit(submit)
+        self.workers   = workers or os.cpu_count()
+        self.slots     = Slots(cpus or os.cpu_count(),memory or total_memory())
+        self.keep      = keep
+        self.cluster   = next_cluster(self.directory)
+
+    def processes(self):
+
+        """
+        Macros of each process: its ID, the cluster and its queue variables
+        """
+
+        variables = self.settings.get("queue_variables",[])
+        items     = self.settings.get("queue_items",[None]*self.settings.get("processes",1))
+        return [{"process":p,"procid":p,"cluster":self.cluster,"clusterid":self.cluster,
+                 **(item_values(variables,item) if item is not None else {})}
+                for p,item in enumerate(items)]
+
+    def setting(self, key:str, macros:dict, default:str=""):
+        return expand(self.settings.get(key,default),macros).strip().strip('"')
+
+    def run_process(self, macros:dict):
+
+        """
+        Runs one process and returns its ID, return value and the outputs
+        which were not produced
+        """
+
+        process = macros["process"]
+        cpus    = float(self.setting("request_cpus",macros,"1"))
+        memory  = memory_mb(self.setting("request_memory",macros,"1 GB"))
+        scratch = os.path.join(self.directory,"_local",f"{self.cluster}.{process}")
+        log     = os.path.join(self.directory,self.setting("log",macros,f"{self.cluster}.{process}.log"))
+
+        with open(log,"a") as file:
+            file.write(_event("000",self.cluster,process,"Job submitted from host: <local>"))
+
+        self.slots.acquire(cpus,memory)
+        try:
+            returncode, wall, usage, missing = self.execute(macros,scratch,log)
+        except Exception as error:
+            with open(log,"a") as file:
+                file.write(_event("009",self.cluster,process,"Job was aborted.",f"\t{error}\n"))
+            raise
+        finally:
+            self.slots.release(cpus,memory)
+            if not self.keep:
+                shutil.rmtree(scratch,ignore_errors=True)
+
+        with open(log,"a") as file:
+            file.write(_event("005",self.cluster,process,"Job terminated.",
+                              f"\t(1) Normal termination (return value {returncode})\n"
+                              f"\t\tUsr {_clock(usage.ru_utime)}, Sys {_clock(usage.ru_stime)}  -  Run Remote Usage\n"
+                              f"\tPartitionable Resources :    Usage  Request Allocated\n"
+                              f"\t   Cpus                 : {(usage.ru_utime+usage.ru_stime)/max(wall,1e-9):8.2f} {cpus:8g} {cpus:8g}\n"
+                              f"\t   Memory (MB)          : {usage.ru_maxrss//1024:8d} {memory:8.0f} {memory:8.0f}\n"))
+        return process, returncode, missing
+
+    def execute(self, macros:dict, scratch:str, log:str):
+
+        """
+        Transfers the inputs of a process into scratch, runs it and transfers
+        its outputs back. Returns its return value, wall time, resource usage
+        and the outputs which were not produced.
+        """
+
+        process = macros["process"]
+        shutil.rmtree(scratch,ignore_errors=True)
+        os.makedirs(scratch)
+        for name in [f.strip() for f in self.setting("transfer_input_files",macros).split(",") if f.strip()]:
+            source = os.path.normpath(os.path.join(self.directory,name))
+            target = os.path.join(scratch,os.path.basename(source))
+            if os.path.isdir(source):
+                shutil.copytree(source,target,symlinks=True)
+            else:
+                os.symlink(source,target)
+
+        executable = self.setting("executable",macros)
+        shutil.copy(os.path.join(self.directory,executable),scratch)
+        command = [f"./{os.path.basename(executable)}",*shlex.split(self.setting("arguments",macros))]
+        if executable.endswith(".sh"):
+            command = ["bash",*command]
+
+        with open(log,"a") as file:
+            file.write(_event("001",self.cluster,process,"Job executing on host: <local>"))
+        stdout = os.path.join(self.directory,self.setting("output",macros,os.devnull))
+        stderr = os.path.join(self.directory,self.setting("error",macros,os.devnull))
+        start = time.time()
+        with open(stdout,"w") as out, open(stderr,"w") as err:
+            job = subprocess.Popen(command,cwd=scratch,stdout=out,stderr=err,env={**os.environ,"_CONDOR_SCRATCH_DIR":scratch})
+            # wait4 rather than wait for the CPU time and peak memory of the job
+            _, status, usage = os.wait4(job.pid,0)
+            job.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.time()-start
+
+        # Outputs are transferred under their base name, then remapped
+        remaps = {}
+        for remap in self.setting("transfer_output_remaps",macros).split(";"):
+            if "=" in remap:
+                name, target = remap.split("=",1)
+                remaps[name.strip()] = target.strip()
+        missing = []
+        for name in [f.strip() for f in self.setting("transfer_output_files",macros).split(",") if f.strip()]:
+            source = os.path.join(scratch,name)
+            if not os.path.exists(source):
+                missing.append(name)
+                continue
+            target = remaps.get(os.path.basename(name),os.path.basename(name))
+            shutil.move(source,os.path.join(self.directory,target))
+        return job.returncode, wall, usage, missing
+
+    def run(self):
+
+        """
+        Runs all processes on the pool with a progress bar and returns the
+        failed ones with their return value and missing outputs
+        """
+
+        processes = self.processes()
+        print(f"Running {len(processes)} processes of {self.submit} locally as cluster {self.cluster}, {self.workers} at a time")
+        failed = {}
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = {pool.submit(self.run_process,macros): macros["process"] for macros in processes}
+            with tqdm(total=len(futures),unit="job") as progress:
+                for future in as_completed(futures):
+                    try:
+                        process, returncode, missing = future.result()
+                    except Exception as error:
+                        process, returncode, missing = futures[future], None, [f"({error})"]
+                    if returncode!=0 or missing:
+                        failed[process] = (returncode,missing)
+                        progress.set_postfix(failed=len(failed))
+                    progress.update()
+        try:
+            os.rmdir(os.path.join(self.directory,"_local"))
+        except OSError:
+            pass
+        for process,(returncode,missing) in sorted(failed.items()):
+            print(f" - {process:5d} return value {returncode}"+(f", missing {' '.join(missing)}" if missing else ""))
+        print(f"{len(processes)-len(failed)} of {len(processes)} processes succeeded, see python -m condor.harvest {self.directory}")
+        return failed
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run an HTCondor submit file on the local machine")
+    parser.add_argument("submit", type=str, help="Submit file written by condor.generate, condor.skim or condor.harvest")
+    parser.add_argument("-j","--jobs", type=int, help="Processes running at once, defaults to the number of cores", required=False)
+    parser.add_argument("--cpus", type=float, help="Cores shared by the processes, defaults to all cores", required=False)
+    parser.add_argument("--memory", type=float, help="Memory in MB shared by the processes, defaults to all memory", required=False)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory of each process")
+    args = parser.parse_args()
+
+    failed = LocalRun(args.submit,args.jobs,args.cpus,args.memory,args.keep).run()
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
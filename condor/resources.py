@@ -0,0 +1,259 @@
+"""
+Resource profiles of MadLAD generation jobs, measured from the HTCondor job
+logs ($(ClusterId).$(Process).log) of earlier runs, e.g.
+
+    python -m condor.resources <condorrun dir> [<condorrun dir> ...] [--config 4tops.yaml]
+
+Records the memory, CPU usage and wall time of every finished job in a profile
+per config (condor/profiles/<config>.json by default). condor.generate reads
+the profile of its config and requests the measured memory and CPUs plus a
+safety margin instead of the defaults.
+"""
+
+import os
+import re
+import glob
+import json
+import math
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),"profiles")
+
+# Requests of a config without a profile
+DEFAULT_CPUS   = 12
+DEFAULT_MEMORY = 50*1024
+
+# Memory requests are rounded up to multiples of MEMORY_STEP MB
+MEMORY_STEP = 512
+
+EVENT_HEADER = re.compile(r"^(\d{3}) \((\d+)\.(\d+)\.\d+\) (\S+ \S+) (.*)$")
+USAGE        = re.compile(r"Usr (\d+) (\d+):(\d+):(\d+), Sys (\d+) (\d+):(\d+):(\d+)\s+-\s+Run Remote Usage")
+RETURN_VALUE = re.compile(r"return value (-?\d+)")
+RESOURCE     = re.compile(r"^\s*(Cpus|Disk \(KB\)|Memory \(MB\))\s*:(.*)$")
+IMAGE_MEMORY = re.compile(r"^\s*(\d+)\s+-\s+MemoryUsage of job \(MB\)")
+LOG_NAME     = re.compile(r"(\d+)\.(\d+)\.log")
+
+
+def _timestamp(text:str):
+
+    """
+    Event time, in the ISO format of recent HTCondor versions or the
+    MM/DD format of older ones
+    """
+
+    for fmt in ("%Y-%m-%d %H:%M:%S","%m/%d %H:%M:%S"):
+        try:
+            return datetime.strptime(text,fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _seconds(days,hours,minutes,seconds):
+    return ((int(days)*24+int(hours))*60+int(minutes))*60+int(seconds)
+
+
+def parse_log(path:str):
+
+    """
+    Measured resources of each job which terminated in a job log, as a list
+    of dicts with its id, return value, memory (MB), CPUs used, wall and CPU
+    time (s) and disk (KB). Jobs which were evicted and restarted are timed
+    from their last start.
+    """
+
+    with open(path) as file:
+        events = file.read().split("\n...")
+
+    started, peak, jobs = {}, {}, []
+    for event in events:
+        lines = event.strip("\n").splitlines()
+        if not lines:
+            continue
+        header = EVENT_HEADER.match(lines[0])
+        if header is None:
+            continue
+        code, cluster, process, time, _ = header.groups()
+        job = f"{int(cluster)}.{int(process)}"
+
+        if code=="001":
+            started[job] = _timestamp(time)
+        elif code=="006":
+            for line in lines[1:]:
+                if (match:=IMAGE_MEMORY.match(line)):
+                    peak[job] = max(peak.get(job,0),int(match.group(1)))
+        elif code=="005":
+            record = {"job":job,"return_value":None,"memory_mb":peak.get(job),"cpus":None,
+                      "wall_s":None,"cpu_s":None,"disk_kb":None}
+            start, end = started.get(job), _timestamp(time)
+            if start is not None and end is not None:
+                record["wall_s"] = max((end-start).total_seconds(),0)
+            for line in lines[1:]:
+                if record["return_value"] is None and (match:=RETURN_VALUE.search(line)):
+                    record["return_value"] = int(match.group(1))
+                elif record["cpu_s"] is None and (match:=USAGE.search(line)):
+                    values = match.groups()
+                    record["cpu_s"] = _seconds(*values[:4])+_seconds(*values[4:])
+                elif (match:=RESOURCE.match(line)):
+                    # Usage, Request, Allocated, with the usage left blank when unmeasured
+                    name, values = match.group(1), match.group(2).split()
+                    if len(values)<3:
+                        continue
+                    try:
+                        usage = float(values[0])
+                    except ValueError:
+                        continue
+                    if name=="Cpus":
+                        record["cpus"] = usage
+                    elif name=="Disk (KB)":
+                        record["disk_kb"] = usage
+                    else:
+                        record["memory_mb"] = max(usage,record["memory_mb"] or 0)
+            # Older versions do not report the CPU usage, take it from the CPU time
+            if not record["cpus"] and record["cpu_s"] and record["wall_s"]:
+                record["cpus"] = record["cpu_s"]/record["wall_s"]
+            jobs.append(record)
+    return jobs
+
+
+def job_logs(directory:str):
+
+    """
+    Job logs ($(ClusterId).$(Process).log) of a run directory
+    """
+
+    return sorted(p for p in glob.glob(os.path.join(directory,"*.log")) if LOG_NAME.fullmatch(os.path.basename(p)))
+
+
+def log_clusters(path:str):
+
+    """
+    Cluster IDs of the events in a job log. A resubmission which keeps the
+    log name of the first submission appends its events under its own
+    cluster.
+    """
+
+    clusters = set()
+    with open(path) as file:
+        for line in file:
+            if (header:=EVENT_HEADER.match(line)):
+                clusters.add(int(header.group(2)))
+    return clusters
+
+
+def run_config(directory:str):
+
+    """
+    Config name recorded in the submit file written by condor.generate
+    """
+
+    path = os.path.join(directory,"submit.sub")
+    if not os.path.isfile(path):
+        return None
+    with open(path) as file:
+        for line in file:
+            if line.startswith("# config"):
+                return line.split("=",1)[1].strip()
+    return None
+
+
+def profile_path(config:str, directory:str=PROFILE_DIR):
+    return os.path.join(directory,f"{os.path.basename(config)}.json")
+
+
+def load_profile(config:str, directory:str=PROFILE_DIR):
+    path = profile_path(config,directory)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def update_profile(config:str, jobs:list, directory:str=PROFILE_DIR):
+
+    """
+    Adds the jobs to the profile of config, replacing earlier records of the
+    same job id, and writes it back
+    """
+
+    profile = load_profile(config,directory) or {"config":config,"jobs":{}}
+    for record in jobs:
+        profile["jobs"][record["job"]] = {k:v for k,v in record.items() if k!="job"}
+    profile["summary"] = summarise(profile["jobs"].values())
+    os.makedirs(directory,exist_ok=True)
+    with open(profile_path(config,directory),"w") as file:
+        json.dump(profile,file,indent=2)
+    return profile
+
+
+def summarise(records):
+
+    """
+    Number of jobs and median, 95th percentile and maximum of each measured
+    quantity over the successful jobs
+    """
+
+    records = [r for r in records if r["return_value"]==0]
+    summary = {"jobs":len(records)}
+    for quantity in ("memory_mb","cpus","wall_s","cpu_s","disk_kb"):
+        values = np.array([r[quantity] for r in records if r[quantity] is not None],dtype=float)
+        if len(values):
+            summary[quantity] = {"median":float(np.median(values)),
+                                 "p95"   :float(np.percentile(values,95)),
+                                 "max"   :float(values.max())}
+    return summary
+
+
+def resource_requests(profile:dict, margin:float=0.2):
+
+    """
+    (request_cpus, request_memory in MB) for a profile: the largest memory and
+    the 95th percentile CPU usage measured, each with the safety margin. Falls
+    back to the defaults for anything which was not measured.
+    """
+
+    summary = (profile or {}).get("summary",{})
+    cpus, memory = DEFAULT_CPUS, DEFAULT_MEMORY
+    if "cpus" in summary:
+        cpus = min(max(math.ceil(summary["cpus"]["p95"]*(1+margin)),1),DEFAULT_CPUS)
+    if "memory_mb" in summary:
+        memory = math.ceil(summary["memory_mb"]["max"]*(1+margin)/MEMORY_STEP)*MEMORY_STEP
+    return cpus, memory
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Record the measured resources of MadLAD Condor runs per config")
+    parser.add_argument("directories", type=str, nargs="+", help="Condor run directories holding the job logs")
+    parser.add_argument("--config", type=str, help="Config of the runs, read from their submit file by default", required=False)
+    parser.add_argument("--profiles", type=str, default=PROFILE_DIR, help="Directory of the resource profiles")
+    parser.add_argument("--margin", type=float, default=0.2, help="Safety margin of the printed requests")
+    args = parser.parse_args()
+
+    by_config = {}
+    for directory in args.directories:
+        config = args.config or run_config(directory)
+        if config is None:
+            print(f"Skipping {directory}: no config in its submit file, use --config")
+            continue
+        jobs = [record for log in job_logs(directory) for record in parse_log(log)]
+        print(f"{directory}: {len(jobs)} finished jobs of {config}")
+        by_config.setdefault(config,[]).extend(jobs)
+
+    for config,jobs in by_config.items():
+        profile = update_profile(config,jobs,args.profiles)
+        summary = profile["summary"]
+        cpus, memory = resource_requests(profile,args.margin)
+        print(f"{config}: {summary['jobs']} successful jobs")
+        for quantity in ("memory_mb","cpus","wall_s"):
+            if quantity in summary:
+                s = summary[quantity]
+                print(f" - {quantity:10s} median {s['median']:10.1f}  p95 {s['p95']:10.1f}  max {s['max']:10.1f}")
+        print(f" -> request_cpus = {cpus}, request_memory = {memory} MB")
+
+
+if __name__ == "__main__":
+    main()
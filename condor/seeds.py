@@ -0,0 +1,96 @@
+"""
+Ledger of the MadLAD seeds handed out to generation productions, e.g.
+
+    python -m condor.seeds
+
+condor.generate takes a block of consecutive seeds per production from the
+ledger (condor/seeds.json by default), and job i of the production uses the
+first seed of the block plus i. Seeds are therefore unique across every
+production allocated from the same ledger until MAX_SEED seeds have been
+handed out, after which the ledger wraps around with a warning. Productions
+submitted from another checkout, with another ledger, are not checked
+against it. --seed productions are recorded as well, with a warning if
+their block overlaps an earlier one.
+
+Resubmitted processes (condor.harvest) keep their process IDs, so they
+rerun with the seed of the failed job they replace.
+
+Lists the recorded productions when run.
+"""
+
+import os
+import json
+import fcntl
+import argparse
+from datetime import datetime
+from warnings import warn
+
+SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),"seeds.json")
+
+# Largest seed MadGraph accepts is 30081*30081. 0 would ask MadGraph for a
+# random seed, so seeds start at 1.
+MAX_SEED = 900_000_000
+
+
+def load_ledger(path:str=SEED_FILE):
+    if not os.path.isfile(path):
+        return {"next":1,"productions":[]}
+    with open(path) as file:
+        return json.load(file)
+
+
+def overlaps(ledger:dict, first:int, n_seeds:int):
+
+    """
+    Recorded productions whose seed block overlaps first..first+n_seeds-1
+    """
+
+    return [p for p in ledger["productions"] if first<p["first"]+p["jobs"] and p["first"]<first+n_seeds]
+
+
+def allocate_seeds(n_jobs:int, production:str, first:int=None, path:str=SEED_FILE):
+
+    """
+    First seed of a block of n_jobs seeds for production, taken from the
+    ledger at path unless first is given, and recorded there. The ledger is
+    locked so that productions created at the same time get distinct blocks.
+    """
+
+    if not 0<n_jobs<=MAX_SEED:
+        raise ValueError(f"A production needs between 1 and {MAX_SEED} seeds")
+    os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+    with open(f"{path}.lock","w") as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        ledger = load_ledger(path)
+        if first is None:
+            first = ledger["next"]
+            if first+n_jobs-1>MAX_SEED:
+                warn(f"All {MAX_SEED} seeds of {path} have been handed out, starting again from 1")
+                first = 1
+            ledger["next"] = first+n_jobs
+        clashes = overlaps(ledger,first,n_jobs)
+        if clashes:
+            warn(f"Seeds {first}..{first+n_jobs-1} of {production} overlap those of {', '.join(p['production'] for p in clashes)}")
+        ledger["productions"].append({"production":production,"first":first,"jobs":n_jobs,
+                                      "date":datetime.now().isoformat(timespec="seconds")})
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp,"w") as file:
+            json.dump(ledger,file,indent=2)
+        os.replace(tmp,path)
+    return first
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="List the seed blocks of the generation productions")
+    parser.add_argument("--ledger", type=str, default=SEED_FILE, help="Seed ledger written by condor.generate")
+    args = parser.parse_args()
+
+    ledger = load_ledger(args.ledger)
+    for p in ledger["productions"]:
+        print(f"{p['date']}  {p['first']:>10d} - {p['first']+p['jobs']-1:>10d}  {p['production']}")
+    print(f"Next free seed: {ledger['next']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,106 @@ import csv
 # from mad4batch.ROOT_skim import skim_delphes
 from condor.delphes_branches import branches as DB
 from condor.delphes_branches import light_branches
+from condor.skim_uproot import read_cuts
 
-def write_job_script(path,output_file,branch_string):
-    text = f"""#!/bin/bash
+# Cut expressions shipped with each job when skimming with a preselection
+CUT_FILE = "skim_cuts.txt"
+
+# Skimmer executable shipped with each job: the ROOT binary, or the uproot
+# script which needs no ROOT installation
+SKIMMERS = {"binary" : "skim_delphes",
+            "uproot" : "skim_uproot.py"}
+
+# Memory request of a packed job: a base for the skimmer plus the largest
+# input, in multiples of MEMORY_STEP MB
+BASE_MEMORY = 1024
+MEMORY_STEP = 256
+
+SIZE_UNITS = {"B":1, "KB":2**10, "MB":2**20, "GB":2**30, "TB":2**40}
+
+
+def parse_size(size:str):
+
+    """
+    Bytes in a size such as 2GB, 500 MB or 1000000
+    """
+
+    size = size.strip().upper().replace(" ","")
+    for unit in sorted(SIZE_UNITS,key=len,reverse=True):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)])*SIZE_UNITS[unit])
+    return int(size)
+
+
+def pack_files(files:list, sizes:dict, budget:int):
+
+    """
+    Groups files into jobs of at most budget bytes each (first fit, largest
+    files first). A file larger than the budget gets a job of its own.
+    Jobs are returned largest first, with their files in listing order.
+    """
+
+    jobs = []
+    for f in sorted(files,key=lambda f: sizes[f],reverse=True):
+        for job in jobs:
+            if job[0]+sizes[f]<=budget:
+                job[0] += sizes[f]
+                job[1].append(f)
+                break
+        else:
+            jobs.append([sizes[f],[f]])
+    order = {f:i for i,f in enumerate(files)}
+    return [sorted(job,key=order.get) for _,job in jobs]
+
+
+def job_memory(job:list, sizes:dict):
+
+    """
+    Memory request in MB of a job skimming the files in job
+    """
+
+    memory = BASE_MEMORY + max(sizes[f] for f in job)/2**20
+    return int(-(-memory//MEMORY_STEP)*MEMORY_STEP)
+
+
+def write_job_list(path:str, outfile:str, jobs:list, sizes:dict):
+
+    """
+    Queue file of a packed submission: one line per job with its memory
+    request in MB and its comma-separated inputs
+    """
+
+    name = f"skim_{outfile.replace('.root','')}_jobs.txt"
+    with open(f"{path}/{name}","w") as file:
+        for job in jobs:
+            file.write(f"{job_memory(job,sizes)} {','.join(job)}\n")
+    return name
+
+def write_job_script(path,output_file,branch_string,skimmer="binary",cuts=False,packed=False):
+    if skimmer=="uproot":
+        cut_option = f" --cut-file {CUT_FILE}" if cuts else ""
+        text = f"""#!/bin/bash
+python3 skim_uproot.py $1 {output_file} {branch_string}{cut_option}
+        """
+    elif packed:
+        # $1 is a comma-separated list of inputs, skimmed one by one and merged
+        text = f"""#!/bin/bash
+setupATLAS -q 
+lsetup "root 6.30.02-x86_64-el9-gcc13-opt"
+IFS=',' read -ra inputs <<< "$1"
+if [ ${{#inputs[@]}} -eq 1 ]; then
+    ./skim_delphes $1 {output_file} {branch_string}
+else
+    parts=()
+    for i in "${{!inputs[@]}}"; do
+        ./skim_delphes ${{inputs[$i]}} part_$i.root {branch_string} || exit 1
+        parts+=(part_$i.root)
+    done
+    hadd -f {output_file} "${{parts[@]}}" && rm "${{parts[@]}}"
+fi
+        """
+    else:
+        text = f"""#!/bin/bash
 setupATLAS -q 
 lsetup "root 6.30.02-x86_64-el9-gcc13-opt"
 ./skim_delphes $1 {output_file} {branch_string}
@@ -22,30 +119,47 @@ lsetup "root 6.30.02-x86_64-el9-gcc13-opt"
         file.write(text)
 
     
-def write_submit_file(path:str, infile_template: str , outfile: str, Nfiles: int):
+def write_submit_file(path:str, infile_template: str , outfile: str, Nfiles: int, skimmer: str = "binary", cuts: bool = False, job_list: str = None):
         
         output_file = outfile.replace(".root","")
         job_name = f"job_{output_file}.sh"
+
+        # Packed jobs take their inputs and memory request from the job list
+        if job_list:
+            arguments = "$(inputs)"
+            memory    = "$(memory)"
+            queue     = f"memory, inputs from {job_list}"
+        else:
+            arguments = f"{infile_template}_$(Process).root"
+            memory    = "1 GB"
+            queue     = Nfiles
+
+        # With a preselection the cut file goes in and the cutflow comes back
+        inputs  = f"../condor/{SKIMMERS[skimmer]}, {CUT_FILE}" if cuts else f"../condor/{SKIMMERS[skimmer]}"
+        outputs = f"{outfile}, {output_file}_cutflow.json" if cuts else outfile
+        remaps  = f"{outfile} = {output_file}_$(Process).root"
+        if cuts:
+            remaps += f"; {output_file}_cutflow.json = {output_file}_$(Process)_cutflow.json"
             
         text=f"""# Submit file for HTCondor
 universe   = vanilla
 executable = {job_name}
-arguments = {infile_template}_$(Process).root
+arguments = {arguments}
 output     = $(ClusterId).$(Process).out
 error      = $(ClusterId).$(Process).err
 log        = $(ClusterId).$(Process).log
 getenv = True
 request_cpus = 4
-request_memory = 1 GB
+request_memory = {memory}
 transfer_executable = True
 should_transfer_files = YES
-transfer_input_files    = ../condor/skim_delphes, {infile_template}_$(Process).root
-transfer_output_files = {outfile}
-transfer_output_remaps = "{outfile} = {outfile.replace(".root","")}_$(Process).root"
+transfer_input_files    = {inputs}, {arguments}
+transfer_output_files = {outputs}
+transfer_output_remaps = "{remaps}"
 
 when_to_transfer_output = ON_EXIT 
 
-queue {Nfiles}"""
+queue {queue}"""
 
         name = f"{path}/skim_{outfile.replace('.root','')}.sub"
         with open(name,"w") as file:
@@ -56,10 +170,18 @@ def run(args):
     #Check input files    
     mypath = args.directory 
     files_to_skim = []
+    sizes = {}
+    empty = []
     for fname in listdir(mypath):
         f = join(mypath,fname)
-        if isfile(f) and "delphes" in f and getsize(f)!=0:
+        if isfile(f) and "delphes" in f:
+            if (size:=getsize(f))==0:
+                empty.append(fname)
+                continue
             files_to_skim.append(fname)
+            sizes[fname] = size
+    if empty:
+        print(f"Skipping {len(empty)} empty files (see python -m condor.harvest on the generation run): {' '.join(sorted(empty))}")
     if args.Nfiles:
         files_to_skim = files_to_skim[:args.Nfiles]
         
@@ -92,15 +214,41 @@ def run(args):
         print(f" - {br}")   
 
     branch_string = " ".join(branches_to_keep)
+
+    ## Event preselection, evaluated inside each job
+    cuts = (read_cuts(args.cut_file) if args.cut_file else []) + (args.cut or [])
+    if cuts:
+        if args.skimmer!="uproot":
+            raise ValueError("Event preselection is only supported by the uproot skimmer, use --skimmer uproot")
+        print("Preselection")
+        for cut in cuts:
+            print(f" - {cut}")
+        with open(join(mypath,CUT_FILE),"w") as file:
+            file.write("\n".join(cuts)+"\n")
+    
+    ## Packing files into jobs of about the same size
+    job_list = None
+    if args.pack:
+        jobs = pack_files(sorted(files_to_skim),sizes,parse_size(args.pack))
+        job_list = write_job_list(mypath,outfile_template,jobs,sizes)
+        print(f"Packing {len(files_to_skim)} files into {len(jobs)} jobs of up to {args.pack}")
+        for job in jobs:
+            print(f" - {len(job)} files, {sum(sizes[f] for f in job)/2**30:.2f} GB, {job_memory(job,sizes)} MB")
     
     write_job_script(path=mypath,
                      output_file=outfile_template,
-                     branch_string=branch_string)
+                     branch_string=branch_string,
+                     skimmer=args.skimmer,
+                     cuts=bool(cuts),
+                     packed=bool(args.pack))
     
     write_submit_file(path=mypath,
                       infile_template=infile_template,
                       outfile=outfile_template,
-                      Nfiles=len(files_to_skim))
+                      Nfiles=len(files_to_skim),
+                      skimmer=args.skimmer,
+                      cuts=bool(cuts),
+                      job_list=job_list)
 
 
 
@@ -114,6 +262,10 @@ if __name__ == "__main__":
     parser.add_argument("--branch-file",type=str)
     parser.add_argument("-c","--config",type=str,required=False)
     parser.add_argument("--Nfiles",type=int,required=False)
+    parser.add_argument("--skimmer",type=str,choices=list(SKIMMERS),default="binary",help="skim_delphes (needs ROOT) or the uproot skimmer")
+    parser.add_argument("--cut",type=str,action="append",help="Event preselection expression, e.g. 'Jet_size >= 4', can be repeated")
+    parser.add_argument("--cut-file",type=str,help="File of preselection expressions, one per line")
+    parser.add_argument("--pack",type=str,help="Pack files into jobs of up to this many bytes, e.g. 2GB, instead of one job per file")
 
     args = parser.parse_args()    
     
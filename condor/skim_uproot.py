@@ -0,0 +1,240 @@
+"""
+Pure-Python replacement for the skim_delphes binary, built on uproot, e.g.
+
+    python skim_uproot.py <input.root> <output.root> Jet.PT Jet.Eta Event.Number
+
+Takes the same arguments as skim_delphes: streams the Delphes tree of the
+input in chunks and writes the requested branches to a compressed Delphes
+tree in the output. A comma-separated list of inputs is skimmed into a single
+output. Members of a collection share one counter branch
+(<collection>_size) as in Delphes, which also stands in for a requested
+<collection>_size branch. Branches which uproot cannot write, such
+as TRef and TRefArray members, are reported and skipped.
+
+Events can be preselected with cut expressions (--cut, --cut-file), which
+are evaluated chunk by chunk before writing, e.g.
+
+    python skim_uproot.py in.root out.root Jet.PT Jet.Eta --cut "Jet_size >= 4" --cut "Electron_size + Muon_size >= 1"
+
+A cut is a Python expression over the branches, with collection members as
+attributes (Jet.PT, Jet.BTag) and counters as names (Jet_size); num, sum, any,
+all, count, min and max act per event, and ak and np are available. The
+number of events passing each cut in turn is written to <output>_cutflow.json.
+
+Only needs uproot and awkward, so it can be shipped to the worker nodes as a
+single file instead of needing a ROOT installation.
+"""
+
+import os
+import ast
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import uproot
+import numpy as np
+import awkward as ak
+
+CODECS = {"zlib" : uproot.ZLIB,
+          "lzma" : uproot.LZMA,
+          "lz4"  : uproot.LZ4,
+          "zstd" : uproot.ZSTD}
+
+
+def writable(branch):
+
+    """
+    Numerical branches, flat or jagged, which uproot can write back
+    """
+
+    interpretation = branch.interpretation
+    if isinstance(interpretation,uproot.interpretation.jagged.AsJagged):
+        interpretation = interpretation.content
+    return isinstance(interpretation,uproot.interpretation.numerical.AsDtype)
+
+
+def select_branches(tree, branches:list):
+
+    """
+    Splits the requested branches into the ones to write and the ones which
+    are missing or cannot be written
+    """
+
+    available = set(tree.keys(full_paths=False)) | set(tree.keys())
+    keep, skipped = [], []
+    for name in dict.fromkeys(branches):
+        if name in available and writable(tree[name]):
+            keep.append(name)
+        else:
+            skipped.append(name)
+    return keep, skipped
+
+
+def group(arrays:dict, counters:bool=True):
+
+    """
+    Zips the jagged members of each collection (Jet.PT, Jet.Eta, ...) into one
+    record array per collection so that they are written with a shared counter.
+    With counters=False the <collection>_size branches of the grouped
+    collections are left out, since the record writes that counter itself.
+    """
+
+    collections = {}
+    for name,array in arrays.items():
+        collection, _, member = name.partition(".")
+        if member and array.ndim>1:
+            collections.setdefault(collection,{})[member] = array
+        else:
+            collections[name] = array
+    if not counters:
+        grouped = [name for name,value in collections.items() if isinstance(value,dict)]
+        for name in grouped:
+            collections.pop(f"{name}_size",None)
+    return {name: ak.zip(value,depth_limit=2) if isinstance(value,dict) else value
+            for name,value in collections.items()}
+
+
+# Per-event functions available in cut expressions
+CUT_FUNCTIONS = {"ak"    : ak,
+                 "np"    : np,
+                 "abs"   : abs,
+                 "num"   : lambda x: ak.num(x,axis=1),
+                 "sum"   : lambda x: ak.sum(x,axis=1),
+                 "any"   : lambda x: ak.any(x,axis=1),
+                 "all"   : lambda x: ak.all(x,axis=1),
+                 "count" : lambda x: ak.count_nonzero(x,axis=1),
+                 "min"   : lambda x: ak.min(x,axis=1),
+                 "max"   : lambda x: ak.max(x,axis=1)}
+
+
+def read_cuts(path:str):
+
+    """
+    Cut expressions of a cut file, one per line, # starts a comment
+    """
+
+    with open(path) as file:
+        lines = [line.split("#",1)[0].strip() for line in file]
+    return [line for line in lines if line]
+
+
+def cut_branches(cuts:list, available:set):
+
+    """
+    Branches read by the cut expressions: Collection.Member attributes and
+    plain names such as the Collection_size counters
+    """
+
+    names = set()
+    for cut in cuts:
+        for node in ast.walk(ast.parse(cut,mode="eval")):
+            if isinstance(node,ast.Attribute) and isinstance(node.value,ast.Name):
+                names.add(f"{node.value.id}.{node.attr}")
+            elif isinstance(node,ast.Name):
+                names.add(node.id)
+    return sorted(n for n in names if n in available)
+
+
+def evaluate_cuts(cuts:list, arrays:dict):
+
+    """
+    Event mask after each cut in turn, for one chunk
+    """
+
+    namespace = {**CUT_FUNCTIONS,**group(arrays)}
+    n_events  = len(next(iter(arrays.values())))
+    mask  = np.ones(n_events,dtype=bool)
+    masks = []
+    for cut in cuts:
+        passed = eval(cut,{"__builtins__":{}},namespace)
+        passed = np.broadcast_to(np.asarray(ak.to_numpy(ak.fill_none(passed,False)),dtype=bool),(n_events,))
+        mask = mask & passed
+        masks.append(mask)
+    return masks
+
+
+def cutflow_name(outname:str):
+    return f"{outname[:-5] if outname.endswith('.root') else outname}_cutflow.json"
+
+
+def skim(innames, outname:str, branches:list, step_size="100 MB", compression:str="zlib", level:int=1, threads:int=None, cuts=(), treename:str="Delphes"):
+
+    """
+    Streams treename of each input (a list, or a comma-separated string) in
+    chunks of step_size and writes the requested branches of the events
+    passing all cuts to a single outname, decompressing with threads
+    (default: all cores). With cuts, the cutflow is written next to the
+    output. Returns the number of events written.
+    """
+
+    if isinstance(innames,str):
+        innames = innames.split(",")
+
+    cutflow = np.zeros(len(cuts),dtype=np.int64)
+    total = 0
+
+    n_events = 0
+    # One pool for all inputs. It is given to iterate rather than to
+    # uproot.open, which would shut it down when the input is closed.
+    with uproot.recreate(outname,compression=CODECS[compression](level)) as file, ThreadPoolExecutor(threads or os.cpu_count()) as executor:
+        for inname in innames:
+            with uproot.open(inname) as infile:
+                tree = infile[treename]
+                keep, skipped = select_branches(tree,branches)
+                if skipped:
+                    print(f"Skipping {len(skipped)} missing or unwritable branches of {inname}: {' '.join(skipped)}")
+                if not keep:
+                    raise ValueError(f"None of the requested branches can be written from {inname}")
+
+                available = set(tree.keys(full_paths=False)) | set(tree.keys())
+                extra = [b for b in cut_branches(cuts,available) if b not in keep]
+
+                for arrays in tree.iterate(keep+extra,step_size=step_size,how=dict,
+                                           decompression_executor=executor,interpretation_executor=executor):
+                    total += len(next(iter(arrays.values())))
+                    if cuts:
+                        masks = evaluate_cuts(cuts,arrays)
+                        cutflow += [np.count_nonzero(m) for m in masks]
+                        arrays = {name: arrays[name][masks[-1]] for name in keep}
+                    chunk = group(arrays,counters=False)
+                    if treename not in file:
+                        file.mktree(treename,{name: array.type for name,array in chunk.items()},
+                                    counter_name=lambda counted: f"{counted}_size",
+                                    field_name=lambda outer,inner: f"{outer}.{inner}")
+                    file[treename].extend(chunk)
+                    n_events += len(next(iter(chunk.values())))
+
+    if cuts:
+        with open(cutflow_name(outname),"w") as file:
+            json.dump({"input" : innames,
+                       "total" : total,
+                       "cuts"  : [{"cut":cut,"passed":int(n)} for cut,n in zip(cuts,cutflow)]},file,indent=2)
+    return n_events
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Skim a Delphes ROOT file with uproot")
+    parser.add_argument("input_file", type=str, help="Input file, or comma-separated list of inputs written to one output")
+    parser.add_argument("output_file", type=str)
+    parser.add_argument("branches", type=str, nargs="+")
+    parser.add_argument("--step-size", type=str, default="100 MB", help="Events (int) or memory per chunk")
+    parser.add_argument("--compression", type=str, choices=list(CODECS), default="zlib")
+    parser.add_argument("--level", type=int, default=1, help="Compression level")
+    parser.add_argument("--threads", type=int, help="Decompression threads, defaults to all cores", required=False)
+    parser.add_argument("--cut", type=str, action="append", default=[], help="Event selection expression, can be repeated")
+    parser.add_argument("--cut-file", type=str, help="File of cut expressions, one per line", required=False)
+
+    args = parser.parse_args()
+    step_size = int(args.step_size) if args.step_size.isdigit() else args.step_size
+    cuts = (read_cuts(args.cut_file) if args.cut_file else []) + args.cut
+
+    start = time.perf_counter()
+    n_events = skim(args.input_file,args.output_file,args.branches,step_size,args.compression,args.level,args.threads,cuts)
+    elapsed = time.perf_counter()-start
+    print(f"Skimmed {n_events} events in {elapsed:.1f} s ({n_events/max(elapsed,1e-9):.0f} events/s)")
+
+
+if __name__ == "__main__":
+    main()
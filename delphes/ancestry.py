@@ -0,0 +1,287 @@
+import numpy as np
+import awkward as ak
+import numba as nb
+
+
+# Pythia statuses of hadrons from string fragmentation (81-86) and of
+# R-hadrons (101-106), whose mothers are the whole range M1..M2
+RANGE_STATUSES = list(range(81,87))+list(range(101,107))
+
+
+@nb.njit(cache=True)
+def _parents_csr(offsets,m1,m2,is_range):
+
+    """
+    Parent lists from the M1/M2 mother indices. Where is_range is set and
+    M1 < M2, the mothers are all of M1..M2; otherwise both mothers are kept
+    when they are valid and distinct. Indices are converted to global
+    positions in the flattened particle content.
+    """
+
+    n = len(m1)
+    ptr = np.zeros(n+1,dtype=np.int64)
+    for e in range(len(offsets)-1):
+        start = offsets[e]
+        size  = offsets[e+1]-start
+        for i in range(start,start+size):
+            a = m1[i]
+            b = m2[i]
+            count = 0
+            if is_range[i] and a>=0 and b>a:
+                count = min(b,size-1)-a+1 if a<size else 0
+            else:
+                if a>=0 and a<size:
+                    count += 1
+                if b>=0 and b<size and b!=a:
+                    count += 1
+            ptr[i+1] = ptr[i]+count
+    idx = np.empty(ptr[n],dtype=np.int64)
+    for e in range(len(offsets)-1):
+        start = offsets[e]
+        size  = offsets[e+1]-start
+        for i in range(start,start+size):
+            a = m1[i]
+            b = m2[i]
+            k = ptr[i]
+            if is_range[i] and a>=0 and b>a:
+                for j in range(a,min(b,size-1)+1):
+                    idx[k] = start+j
+                    k += 1
+            else:
+                if a>=0 and a<size:
+                    idx[k] = start+a
+                    k += 1
+                if b>=0 and b<size and b!=a:
+                    idx[k] = start+b
+    return ptr, idx
+
+
+@nb.njit(cache=True)
+def _children_csr(offsets,d1,d2):
+
+    """
+    Daughter lists from the D1..D2 daughter range: a single daughter when
+    only one of the two is set, and the two separately stored daughters D1
+    and D2 when D2 < D1 (e.g. in backwards initial-state showers)
+    """
+
+    n = len(d1)
+    ptr = np.zeros(n+1,dtype=np.int64)
+    for e in range(len(offsets)-1):
+        start = offsets[e]
+        size  = offsets[e+1]-start
+        for i in range(start,start+size):
+            a = d1[i]
+            b = d2[i]
+            count = 0
+            if a>=0 and b>=a:
+                count = min(b,size-1)-a+1 if a<size else 0
+            else:
+                if a>=0 and a<size:
+                    count += 1
+                if b>=0 and b<size:
+                    count += 1
+            ptr[i+1] = ptr[i]+count
+    idx = np.empty(ptr[n],dtype=np.int64)
+    for e in range(len(offsets)-1):
+        start = offsets[e]
+        size  = offsets[e+1]-start
+        for i in range(start,start+size):
+            a = d1[i]
+            b = d2[i]
+            k = ptr[i]
+            if a>=0 and b>=a:
+                for j in range(a,min(b,size-1)+1):
+                    idx[k] = start+j
+                    k += 1
+            else:
+                if a>=0 and a<size:
+                    idx[k] = start+a
+                    k += 1
+                if b>=0 and b<size:
+                    idx[k] = start+b
+    return ptr, idx
+
+
+@nb.njit(cache=True)
+def _invert_csr(ptr,idx):
+
+    """
+    Transposes a CSR adjacency (parents -> children or vice versa)
+    """
+
+    n = len(ptr)-1
+    out_ptr = np.zeros(n+1,dtype=np.int64)
+    for k in range(len(idx)):
+        out_ptr[idx[k]+1] += 1
+    for i in range(n):
+        out_ptr[i+1] += out_ptr[i]
+    fill = out_ptr[:-1].copy()
+    out_idx = np.empty(len(idx),dtype=np.int64)
+    for i in range(n):
+        for k in range(ptr[i],ptr[i+1]):
+            j = idx[k]
+            out_idx[fill[j]] = i
+            fill[j] += 1
+    return out_ptr, out_idx
+
+
+@nb.njit(cache=True)
+def _first_parent_chain(ptr,idx,generations):
+
+    """
+    Follows the first parent (M1) of every particle for a number of
+    generations. Column g holds the global index of the ancestor g+1
+    generations up, or -1.
+    """
+
+    n = len(ptr)-1
+    chain = np.full((n,generations),-1,dtype=np.int64)
+    for i in range(n):
+        j = i
+        for g in range(generations):
+            if ptr[j]==ptr[j+1]:
+                break
+            j = idx[ptr[j]]
+            chain[i,g] = j
+    return chain
+
+
+@nb.njit(cache=True)
+def _reaches(ptr,idx,target,generations):
+
+    """
+    Flags particles connected to a target particle within a number of
+    generations along the given adjacency. Propagates one generation at a
+    time over all particles, so the cost is O(generations x edges).
+    """
+
+    n = len(ptr)-1
+    found = np.zeros(n,dtype=np.bool_)
+    for g in range(generations):
+        step = np.zeros(n,dtype=np.bool_)
+        for i in range(n):
+            for k in range(ptr[i],ptr[i+1]):
+                j = idx[k]
+                if target[j] or found[j]:
+                    step[i] = True
+                    break
+        found = step
+    return found
+
+
+class AncestryIndex:
+
+    """
+    Compact parent/daughter index of a Delphes Particle collection, built once
+    per chunk from the Particle.M1/M2/D1/D2 branches in an events dictionary
+    (see truth_tools.load_events).
+    Parents and daughters are stored as CSR arrays over the flattened particle
+    content, so ancestor and descendant queries over several generations are
+    single compiled passes instead of one gather per generation.
+    M2 is optional; without D1/D2 the daughters are obtained by inverting the
+    parent lists.
+    mothers sets how M1 < M2 is read:
+    - "pair"   : two mothers, M1 and M2 (e.g. the incoming partons of a hard
+                 process)
+    - "range"  : all particles M1..M2, as Delphes fills M1/M2 with the first
+                 and last incoming particle of the production vertex
+    - "pythia" : the range for the string fragmentation and R-hadron
+                 statuses (RANGE_STATUSES, needs Particle.Status), two mothers
+                 otherwise, as in the Pythia event record
+    M2 < M1 always means two mothers.
+    """
+
+    MOTHERS = ("pair","range","pythia")
+
+    def __init__(self,events,mothers:str="pair"):
+        if mothers not in self.MOTHERS:
+            raise ValueError(f"mothers must be one of {self.MOTHERS}, not {mothers}")
+        pid          = events["Particle.PID"]
+        self.counts  = ak.to_numpy(ak.num(pid,axis=1)).astype(np.int64)
+        self.offsets = np.concatenate([[0],np.cumsum(self.counts)]).astype(np.int64)
+        self.pid     = ak.to_numpy(ak.flatten(pid))
+
+        def flat(branch):
+            return ak.to_numpy(ak.flatten(events[branch]))
+
+        m1 = flat("Particle.M1")
+        m2 = flat("Particle.M2") if "Particle.M2" in events else np.full_like(m1,-1)
+        if mothers=="pythia":
+            is_range = np.isin(np.abs(flat("Particle.Status")),RANGE_STATUSES)
+        else:
+            is_range = np.full(len(m1),mothers=="range")
+        self.parent_ptr, self.parents = _parents_csr(self.offsets,m1,m2,is_range)
+
+        self.d1d2 = (flat("Particle.D1"),flat("Particle.D2")) if "Particle.D1" in events and "Particle.D2" in events else None
+        self._children = None
+
+    @property
+    def children(self):
+
+        """
+        Daughter CSR (ptr, idx), built on the first descendant query
+        """
+
+        if self._children is None:
+            if self.d1d2 is not None:
+                self._children = _children_csr(self.offsets,*self.d1d2)
+            else:
+                self._children = _invert_csr(self.parent_ptr,self.parents)
+        return self._children
+
+    def _unflatten(self,flat):
+        return ak.unflatten(flat,self.counts)
+
+    def _target(self,pids):
+        return np.isin(np.abs(self.pid),np.abs(np.asarray(pids)))
+
+    def mother_chain(self,generations:int):
+
+        """
+        Global indices of the first-mother ancestors, shape (particles, generations)
+        """
+
+        return _first_parent_chain(self.parent_ptr,self.parents,generations)
+
+    def ancestor_pids(self,generations:int):
+
+        """
+        PIDs of the mother, grandmother, ... of every particle along the first
+        mother, 0 where the chain ends. Returns events * var * generations, so
+        e.g. abs(chain[:,:,0])==24 selects W daughters and
+        abs(chain[:,:,1])==6 selects top granddaughters.
+        """
+
+        chain = self.mother_chain(generations)
+        pids  = np.where(chain>=0,self.pid[chain],0)
+        return self._unflatten(pids)
+
+    def has_ancestor(self,pids,generations:int=1):
+
+        """
+        Particles with an ancestor of |PID| in pids within generations
+        """
+
+        return self._unflatten(_reaches(self.parent_ptr,self.parents,self._target(pids),generations))
+
+    def has_descendant(self,pids,generations:int=1):
+
+        """
+        Particles with a descendant of |PID| in pids within generations
+        """
+
+        return self._unflatten(_reaches(*self.children,self._target(pids),generations))
+
+    def is_last_copy(self):
+
+        """
+        Particles none of whose daughters carries the same PID
+        """
+
+        child_ptr, children = self.children
+        has_copy  = np.zeros(len(self.pid),dtype=np.bool_)
+        parent_of = np.repeat(np.arange(len(self.pid)),np.diff(child_ptr))
+        same = self.pid[children]==self.pid[parent_of]
+        has_copy[parent_of[same]] = True
+        return self._unflatten(~has_copy)
@@ -0,0 +1,190 @@
+"""
+Batch driver for the delphes parsers. Runs the parser of one process over
+every Delphes file in a directory or glob on a process pool, e.g.
+
+    python -m delphes.batch -p 4tops -i <condor run dir> -o <outdir> -j 64
+
+Writes one output per input, or a single merged output with --merge, as ROOT
+files or partitioned Parquet datasets (--format parquet).
+"""
+
+import os
+import sys
+import glob
+import shutil
+import argparse
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import awkward as ak
+
+from delphes import writers
+from delphes.process import PROCESSES, run as run_process
+from delphes.reader import ReaderConfig
+from delphes.profiling import Profiler
+from delphes.cache import ParseCache
+from delphes.event_index import SOURCE
+
+
+def find_inputs(pattern:str, template:str="delphes_*.root"):
+
+    """
+    Expands a directory (matched against template) or a glob into a sorted
+    list of non-empty input files
+    """
+
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern,template)
+    files = sorted(glob.glob(pattern))
+    empty = [f for f in files if os.path.getsize(f)==0]
+    if empty:
+        print(f"Skipping {len(empty)} empty files")
+    return [f for f in files if os.path.getsize(f)!=0]
+
+
+def output_name(inname:str, outdir:str, backend:str="root"):
+    base = os.path.basename(inname).replace(".root","")
+    return os.path.join(outdir,f"{base}_parsed{writers.WRITERS[backend].extension}")
+
+
+def profile_name(inname:str, profile_dir:str):
+    base = os.path.basename(inname).replace(".root","")
+    return os.path.join(profile_dir,f"{base}_profile.json")
+
+
+def remove_output(outname:str):
+    if os.path.isdir(outname):
+        shutil.rmtree(outname)
+    elif os.path.exists(outname):
+        os.remove(outname)
+
+
+def parse_file(process:str, inname:str, outname:str, config:ReaderConfig, output=None, profile=None, cache=None):
+
+    """
+    Parses a single file, writing the stage report to profile if given.
+    Exceptions are returned as text so that one bad file does not stop the
+    batch.
+    """
+
+    try:
+        profiler = Profiler(inname,enabled=profile is not None)
+        run_process(PROCESSES[process],inname,outname,config=config,output=output,profiler=profiler,cache=cache)
+        profiler.write(profile)
+        return inname, outname, None
+    except Exception:
+        # Do not leave a partially written output behind
+        remove_output(outname)
+        return inname, outname, traceback.format_exc()
+
+
+def merge_outputs(outputs:list, merged:str, config:ReaderConfig, step_size="100 MB", output=None):
+
+    """
+    Concatenates the Truth and Reco trees of the parsed files in order.
+    Delphes numbers the events of every file from 0, so each event gets a
+    Source column with the position of its file in outputs, and the merged
+    trees are joined on (Source, EventNumber) by event_index.align. Parquet
+    parts are rewritten one by one to add it.
+    """
+
+    output = output or {}
+    parquet = output.get("backend","root")=="parquet"
+    with writers.open_writer(merged,**output) as writer:
+        for source,outname in enumerate(outputs):
+            for name in ["Truth","Reco"]:
+                if parquet:
+                    parts = (ak.from_parquet(p) for p in sorted(glob.glob(os.path.join(outname,name,"part-*.parquet"))))
+                    chunks = ({field: part[field] for field in part.fields} for part in parts)
+                else:
+                    tree = config.open(outname,name)
+                    chunks = config.iterate(tree,tree.keys(),step_size)
+                for arrays in chunks:
+                    arrays[SOURCE] = np.full(len(next(iter(arrays.values()))),source,dtype=np.int32)
+                    writer.write(**{name:arrays})
+
+
+def run(process:str, inputs:list, outdir:str, merge=None, workers=None, config=None, output=None, profile_dir=None, cache=None):
+
+    """
+    Parses inputs in parallel, output holds the writers.open_writer options.
+    With profile_dir, the stage report of each input is written there.
+    With a ParseCache, inputs parsed before are read back from it.
+    Returns a dictionary of failed input -> traceback.
+    """
+
+    # The pool already fills the cores, so each worker reads single-threaded
+    config = config or ReaderConfig(decompression_workers=1)
+    output = output or {}
+
+    os.makedirs(outdir,exist_ok=True)
+    if profile_dir:
+        os.makedirs(profile_dir,exist_ok=True)
+    workdir = tempfile.mkdtemp(dir=outdir) if merge else outdir
+
+    failures = {}
+    outputs  = {}
+    print(f"Parsing {len(inputs)} {process} files on {workers or os.cpu_count()} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_file,process,f,output_name(f,workdir,output.get("backend","root")),config,output,
+                               profile_name(f,profile_dir) if profile_dir else None,cache) for f in inputs]
+        for i,future in enumerate(as_completed(futures)):
+            inname, outname, error = future.result()
+            if error is None:
+                outputs[inname] = outname
+                print(f"[{i+1}/{len(inputs)}] {inname} -> {outname}")
+            else:
+                failures[inname] = error
+                print(f"[{i+1}/{len(inputs)}] {inname} FAILED")
+
+    # Evicted here rather than in the workers, which may still be reading
+    # entries of the cache
+    if cache:
+        cache.evict()
+
+    if merge:
+        ordered = [outputs[f] for f in inputs if f in outputs]
+        print(f"Merging {len(ordered)} outputs into {merge}")
+        merge_outputs(ordered,merge,config,output=output)
+        for outname in ordered:
+            remove_output(outname)
+        os.rmdir(workdir)
+
+    print(f"Parsed {len(outputs)}/{len(inputs)} files, {len(failures)} failed")
+    for inname,error in failures.items():
+        print(f" - {inname}: {error.strip().splitlines()[-1]}")
+
+    return failures
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Parse many Delphes files in parallel")
+    parser.add_argument("-p","--process", type=str, choices=list(PROCESSES), required=True)
+    parser.add_argument("-i","--input", type=str, help="Directory or glob of Delphes files", required=True)
+    parser.add_argument("-o","--outdir", type=str, help="Directory for the parsed files", required=True)
+    parser.add_argument("-t","--template", type=str, default="delphes_*.root", help="File template used when --input is a directory")
+    parser.add_argument("-m","--merge", type=str, help="Write a single merged file instead of one per input", required=False)
+    parser.add_argument("-j","--workers", type=int, help="Number of processes, defaults to all cores", required=False)
+    ReaderConfig.arguments(parser)
+    writers.arguments(parser)
+    parser.add_argument("--profile-dir", type=str, help="Write a JSON report of the time and memory of each stage per input", required=False)
+    ParseCache.arguments(parser)
+
+    args = parser.parse_args()
+
+    inputs = find_inputs(args.input,args.template)
+    if len(inputs)==0:
+        raise ValueError(f"No input files found for {args.input}")
+
+    # The pool already fills the cores, so default to single-threaded reads
+    args.threads = args.threads or 1
+    failures = run(args.process,inputs,args.outdir,args.merge,args.workers,ReaderConfig.from_args(args),writers.options_from_args(args),
+                   args.profile_dir,ParseCache.from_args(args))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
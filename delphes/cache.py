@@ -0,0 +1,243 @@
+import os
+import json
+import glob
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+import awkward as ak
+
+from delphes.writers import ParquetWriter
+
+# Bytes of an input file hashed at a time
+HASH_BLOCK = 8 << 20
+
+
+def file_identity(path:str, memo_dir:str=None):
+
+    """
+    Content identity of an input file: its size and a hash of its whole
+    content, so that copies and moves of a file share cache entries. With
+    memo_dir the hash is remembered there for the path, device, inode, size
+    and modification time (ns) of the file, and only recomputed when one of
+    them changes. A file rewritten in place keeping all of them would keep
+    its old identity.
+    """
+
+    stat = os.stat(path)
+    memo = None
+    if memo_dir:
+        signature = f"{os.path.realpath(path)}:{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+        memo = os.path.join(memo_dir,hashlib.sha256(signature.encode()).hexdigest())
+        try:
+            with open(memo) as f:
+                identity = json.load(f)
+            # Marks the memo as recently used, see ParseCache.evict
+            os.utime(memo)
+            return identity
+        except (OSError,ValueError):
+            pass
+
+    digest = hashlib.sha256()
+    with open(path,"rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK),b""):
+            digest.update(block)
+    identity = {"size":stat.st_size,"sha256":digest.hexdigest()}
+
+    if memo:
+        os.makedirs(memo_dir,exist_ok=True)
+        tmp = f"{memo}.tmp{os.getpid()}"
+        with open(tmp,"w") as f:
+            json.dump(identity,f)
+        os.replace(tmp,memo)
+    return identity
+
+
+class ParseCache:
+
+    """
+    Content-addressed on-disk cache of parsed Truth and Reco trees.
+    Args:
+    - directory : cache directory, shared between runs and processes
+    - max_bytes : size cap, the least recently used entries are evicted
+                  once it is exceeded
+    Entries are keyed on the input file identity, the parser version and the
+    parser options (see key), and hold the trees as Parquet parts, one per
+    parsed chunk, which are read back without any decompress-and-mask cost.
+    Entries are written to a temporary directory and renamed into place, so
+    concurrent writers never see a partial entry. Runs using the cache hold
+    a shared lock on it (see using), and evict only removes entries when no
+    run holds it, so that an entry is never removed while it is read.
+    """
+
+    def __init__(self, directory:str, max_bytes:int=20*2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory,exist_ok=True)
+
+    def key(self, inname:str, version:int, **options):
+        description = {"input":file_identity(inname,self.memo_dir()),"version":version,"options":options}
+        return hashlib.sha256(json.dumps(description,sort_keys=True).encode()).hexdigest()
+
+    def path(self, key:str):
+        return os.path.join(self.directory,key)
+
+    def memo_dir(self):
+        return os.path.join(self.directory,".identities")
+
+    @contextmanager
+    def _lock(self, mode:int):
+        with open(os.path.join(self.directory,".lock"),"a") as lock:
+            fcntl.flock(lock,mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock,fcntl.LOCK_UN)
+
+    def using(self):
+
+        """
+        Shared lock held while looking up, reading and storing entries, which
+        keeps evict from removing them meanwhile
+        """
+
+        return self._lock(fcntl.LOCK_SH)
+
+    def get(self, key:str):
+
+        """
+        Entry directory of key, or None on a miss. A hit marks the entry as
+        recently used.
+        """
+
+        path = self.path(key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)
+        return path
+
+    def read(self, path:str):
+
+        """
+        (Truth, Reco) dictionaries of each chunk of an entry, in order
+        """
+
+        def columns(part):
+            array = ak.from_parquet(part)
+            return {field: array[field] for field in array.fields}
+
+        for truth in sorted(glob.glob(os.path.join(path,"Truth","part-*.parquet"))):
+            reco = os.path.join(path,"Reco",os.path.basename(truth))
+            yield columns(truth), columns(reco)
+
+    def store(self, key:str):
+
+        """
+        Writer of a new entry: use as a context manager and write the chunks
+        with write(Truth=..., Reco=...). The entry is published when the
+        block exits without an exception.
+        """
+
+        return _EntryWriter(self,key)
+
+    def size(self):
+        return sum(_size(p) for p in self.entries())
+
+    def entries(self):
+        return [p for p in glob.glob(os.path.join(self.directory,"*")) if os.path.isdir(p) and not os.path.basename(p).startswith(".")]
+
+    def evict(self):
+
+        """
+        Removes the least recently used entries until the cache fits
+        max_bytes, and the input hashes remembered by file_identity which
+        have not been used since the last removed entry was. Skipped, returning False, while any run is using the
+        cache; the next run evicts them then. Called once a run, or a whole
+        batch of parallel runs, has finished rather than by each writer.
+        """
+
+        try:
+            with self._lock(fcntl.LOCK_EX|fcntl.LOCK_NB):
+                self._evict()
+        except BlockingIOError:
+            return False
+        return True
+
+    def _evict(self):
+        entries = []
+        for path in self.entries():
+            try:
+                entries.append((os.path.getmtime(path),_size(path),path))
+            except OSError:
+                continue
+        total = sum(size for _,size,_ in entries)
+        cutoff = None
+        for mtime,size,path in sorted(entries):
+            if total<=self.max_bytes:
+                break
+            shutil.rmtree(path,ignore_errors=True)
+            total -= size
+            cutoff = mtime
+        if cutoff is None:
+            return
+        for memo in glob.glob(os.path.join(self.memo_dir(),"*")):
+            try:
+                if os.path.getmtime(memo)<cutoff:
+                    os.remove(memo)
+            except OSError:
+                continue
+
+    def clear(self):
+        for path in self.entries():
+            shutil.rmtree(path,ignore_errors=True)
+        shutil.rmtree(self.memo_dir(),ignore_errors=True)
+
+    @staticmethod
+    def arguments(parser):
+
+        """
+        Adds the cache options to an argparse parser, see from_args
+        """
+
+        parser.add_argument("--cache", type=str, help="Directory of the parsed-output cache", required=False)
+        parser.add_argument("--cache-size", type=float, default=20, help="Cache size cap in GB", required=False)
+
+    @staticmethod
+    def from_args(args):
+        return ParseCache(args.cache,int(args.cache_size*2**30)) if args.cache else None
+
+
+def _size(path:str):
+    return sum(os.path.getsize(os.path.join(root,f)) for root,_,files in os.walk(path) for f in files)
+
+
+class _EntryWriter:
+
+    def __init__(self, cache:ParseCache, key:str):
+        self.cache   = cache
+        self.key     = key
+        self.tmpdir  = None
+        self.writer  = None
+
+    def write(self, **trees):
+        self.writer.write(**trees)
+
+    def __enter__(self):
+        # Created on entry only, so that a writer which is never entered
+        # leaves nothing behind in the cache
+        self.tmpdir = tempfile.mkdtemp(prefix=".tmp-",dir=self.cache.directory)
+        # Fast codec: the cache is read far more often than it is written
+        self.writer = ParquetWriter(self.tmpdir,compression="lz4")
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            shutil.rmtree(self.tmpdir,ignore_errors=True)
+            return
+        try:
+            os.rename(self.tmpdir,self.cache.path(self.key))
+        except OSError:
+            # Stored concurrently by another process
+            shutil.rmtree(self.tmpdir,ignore_errors=True)
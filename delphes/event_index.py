@@ -0,0 +1,118 @@
+import numpy as np
+import awkward as ak
+
+# Column written by delphes.batch --merge with the position of the input file
+# of each event, since Delphes numbers the events of every file from 0
+SOURCE = "Source"
+
+# Event numbers take the low NUMBER_BITS bits of the (Source, EventNumber)
+# key of an event and the source the bits above
+NUMBER_BITS = 40
+
+
+def event_numbers(column):
+
+    """
+    Flat int64 event numbers from an EventNumber column, which is jagged with
+    one entry per event in the parsed trees (from Event.Number)
+    """
+
+    if isinstance(column,ak.Array) and column.ndim>1:
+        column = ak.firsts(column,axis=1)
+    return np.asarray(ak.to_numpy(column) if isinstance(column,ak.Array) else column,dtype=np.int64)
+
+
+def event_keys(numbers,sources=None):
+
+    """
+    Single int64 key per event ordering the events by source, then by event
+    number, so that a sort of the keys is a lexsort of the two columns
+    """
+
+    if sources is None:
+        return numbers
+    if len(numbers) and (numbers.min()<0 or numbers.max()>>NUMBER_BITS or sources.min()<0 or sources.max()>>(63-NUMBER_BITS)):
+        raise ValueError(f"Event numbers must be in [0,2^{NUMBER_BITS}) and sources in [0,2^{63-NUMBER_BITS}) to be joined")
+    return (sources<<NUMBER_BITS)|numbers
+
+
+class EventIndex:
+
+    """
+    Sorted (Source, EventNumber) index of a parsed Truth or Reco tree, so
+    that rows can be found, filtered and joined by event rather than by
+    position.
+    Args:
+    - column : the EventNumber column (jagged or flat) of the tree
+    - source : the Source column of a merged tree, None for a single file
+    keys holds the sorted event keys and rows the row of each key, both
+    plain NumPy arrays; every query is a vectorized binary search, so joins
+    are O(n log n).
+    """
+
+    def __init__(self,column,source=None):
+        self.ids     = event_keys(event_numbers(column),None if source is None else event_numbers(source))
+        self.rows    = np.argsort(self.ids,kind="stable")
+        self.keys    = self.ids[self.rows]
+        self.unique  = len(self.keys)<2 or not np.any(self.keys[1:]==self.keys[:-1])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self,keys):
+
+        """
+        Row of each of the event keys, -1 where the event is not in the tree
+        """
+
+        if not self.unique:
+            raise ValueError(f"EventNumber repeats in this tree; merged trees need their {SOURCE} column, see delphes.batch --merge")
+        keys = np.asarray(keys,dtype=np.int64)
+        if len(self.keys)==0:
+            return np.full(len(keys),-1,dtype=np.int64)
+        position = np.minimum(np.searchsorted(self.keys,keys),len(self.keys)-1)
+        found = self.keys[position]==keys
+        return np.where(found,self.rows[position],-1)
+
+    def join(self,other):
+
+        """
+        Inner join with the index of another tree: rows of this tree and the
+        matching rows of the other, in the row order of this tree.
+        Trees which are already aligned row by row are returned as they are.
+        """
+
+        if len(self.ids)==len(other.ids) and np.array_equal(self.ids,other.ids):
+            rows = np.arange(len(self.ids))
+            return rows, rows
+        if not self.unique:
+            raise ValueError(f"EventNumber repeats in this tree; merged trees need their {SOURCE} column, see delphes.batch --merge")
+        other_rows = other.lookup(self.ids)
+        rows = np.flatnonzero(other_rows>=0)
+        return rows, other_rows[rows]
+
+
+def take(arrays:dict,rows):
+
+    """
+    Selects rows of every column of a tree dictionary
+    """
+
+    return {k: v[rows] for k,v in arrays.items()}
+
+
+def align(left:dict,right:dict,key:str="EventNumber"):
+
+    """
+    Aligns two tree dictionaries (e.g. Reco and Truth) on their events:
+    keeps the events present in both, in the order of left. Merged trees
+    are joined on (Source, EventNumber) when both have a Source column.
+    """
+
+    merged = SOURCE in left and SOURCE in right
+    left_index  = EventIndex(left[key],left[SOURCE] if merged else None)
+    right_index = EventIndex(right[key],right[SOURCE] if merged else None)
+    left_rows, right_rows = left_index.join(right_index)
+    if len(left_rows)==len(left[key]) and len(right_rows)==len(right[key]) and np.array_equal(left_rows,right_rows):
+        return left, right
+    return take(left,left_rows), take(right,right_rows)
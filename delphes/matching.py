@@ -0,0 +1,198 @@
+import numpy as np
+import awkward as ak
+import numba as nb
+
+
+def _flat_deltaR(a,b):
+
+    """
+    Row-major content of the N x M delta-R matrices of all events, built by
+    broadcasting the flattened eta/phi of a against those of b
+    """
+
+    nrows = ak.to_numpy(ak.num(a,axis=1)).astype(np.int64)
+    ncols = ak.to_numpy(ak.num(b,axis=1)).astype(np.int64)
+    a_eta, a_phi = (ak.to_numpy(ak.flatten(x)).astype(np.float64) for x in (a.eta,a.phi))
+    b_eta, b_phi = (ak.to_numpy(ak.flatten(x)).astype(np.float64) for x in (b.eta,b.phi))
+
+    sizes = nrows*ncols
+    if len(nrows) and nrows[0]*ncols[0]>0 and (nrows==nrows[0]).all() and (ncols==ncols[0]).all():
+        # Fixed multiplicities: plain numpy broadcasting over (event,row,col).
+        # Empty matrices in every event go through the general path, which
+        # handles them without reshaping an empty array
+        n, m  = nrows[0], ncols[0]
+        deta  = a_eta.reshape(-1,n,1) - b_eta.reshape(-1,1,m)
+        dphi  = a_phi.reshape(-1,n,1) - b_phi.reshape(-1,1,m)
+    else:
+        event = np.repeat(np.arange(len(sizes)),sizes)
+        local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes)-sizes,sizes)
+        m     = ncols[event]
+        ia    = np.repeat(np.cumsum(nrows)-nrows,sizes) + local//np.maximum(m,1)
+        jb    = np.repeat(np.cumsum(ncols)-ncols,sizes) + local%np.maximum(m,1)
+        deta  = a_eta[ia] - b_eta[jb]
+        dphi  = a_phi[ia] - b_phi[jb]
+    dphi = (dphi + np.pi) % (2*np.pi) - np.pi
+    return np.sqrt(deta**2 + dphi**2).ravel(), nrows, ncols
+
+
+def deltaR_matrix(a,b):
+
+    """
+    Builds the N x M delta-R matrix between the collections a and b in each
+    event by broadcasting every element of a against every element of b.
+    a and b are jagged arrays with eta and phi fields (e.g. vector objects).
+    Returns an array of type n_events * var * var * float64.
+    """
+
+    content, nrows, ncols = _flat_deltaR(a,b)
+    rows = ak.unflatten(content,np.repeat(ncols,nrows))
+    return ak.unflatten(rows,nrows)
+
+
+@nb.njit(cache=True)
+def _hungarian(cost,n,m,u,v,p,way,minv,used,out):
+
+    """
+    Minimum-cost assignment of n rows to m >= n columns (Kuhn-Munkres with
+    potentials, O(n^2 m)). Work arrays are passed in so that they are
+    allocated once per call of _assign rather than once per event.
+    out[i] is set to the column assigned to row i.
+    """
+
+    u[:n+1] = 0.
+    v[:m+1] = 0.
+    p[:m+1] = 0
+    way[:m+1] = 0
+    for i in range(1,n+1):
+        p[0] = i
+        j0 = 0
+        minv[:m+1] = np.inf
+        used[:m+1] = False
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = np.inf
+            j1 = 0
+            for j in range(1,m+1):
+                if not used[j]:
+                    cur = cost[i0-1,j-1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m+1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0]==0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0==0:
+                break
+    for j in range(1,m+1):
+        if p[j]!=0:
+            out[p[j]-1] = j-1
+
+
+@nb.njit(cache=True)
+def _assign(content,nrows,ncols):
+
+    """
+    Solves the assignment for every event of a flattened delta-R matrix.
+    content holds the row-major N x M matrices of all events back to back.
+    Returns the matched column of every row (-1 if unmatched) and its delta-R.
+    """
+
+    n_events = len(nrows)
+    index = np.full(nrows.sum(),-1,dtype=np.int64)
+    best  = np.full(nrows.sum(),np.nan)
+
+    size = max(nrows.max(),ncols.max())+1 if n_events else 1
+    u    = np.zeros(size)
+    v    = np.zeros(size)
+    p    = np.zeros(size,dtype=np.int64)
+    way  = np.zeros(size,dtype=np.int64)
+    minv = np.zeros(size)
+    used = np.zeros(size,dtype=np.bool_)
+    out  = np.zeros(size,dtype=np.int64)
+    cost = np.zeros((size,size))
+
+    matrix_start = 0
+    row_start    = 0
+    for e in range(n_events):
+        n = nrows[e]
+        m = ncols[e]
+        if n>0 and m>0:
+            # Always assign the shorter side, unassigned rows keep -1
+            transpose = n>m
+            for i in range(n):
+                for j in range(m):
+                    dr = content[matrix_start+i*m+j]
+                    if np.isnan(dr):
+                        dr = 1e9
+                    if transpose:
+                        cost[j,i] = dr
+                    else:
+                        cost[i,j] = dr
+            if transpose:
+                _hungarian(cost,m,n,u,v,p,way,minv,used,out)
+                for j in range(m):
+                    i = out[j]
+                    index[row_start+i] = j
+                    best[row_start+i]  = content[matrix_start+i*m+j]
+            else:
+                _hungarian(cost,n,m,u,v,p,way,minv,used,out)
+                for i in range(n):
+                    j = out[i]
+                    index[row_start+i] = j
+                    best[row_start+i]  = content[matrix_start+i*m+j]
+        matrix_start += n*m
+        row_start    += n
+    return index, best
+
+
+def match_deltaR(a,b):
+
+    """
+    One-to-one delta-R matching of each element of a to an element of b,
+    minimising the summed delta-R in each event. Works for any multiplicity.
+    Returns, per element of a, the index of its partner in b and the matched
+    delta-R, both None where a has more elements than b.
+    """
+
+    content, nrows, ncols = _flat_deltaR(a,b)
+    index, best = _assign(content,nrows,ncols)
+
+    index = ak.unflatten(index,nrows)
+    best  = ak.unflatten(best,nrows)
+    return ak.mask(index,index>=0), ak.mask(best,index>=0)
+
+
+def pair_products(products):
+
+    """
+    Builds candidate parents from consecutive pairs of decay products,
+    (0,1), (2,3), ... as stored in the W decay collections.
+    products must be vector objects so that the pairs can be summed.
+    """
+
+    return products[:,0::2] + products[:,1::2]
+
+
+def pair_indices(index):
+
+    """
+    Converts the index of a matched candidate from pair_products into the
+    indices of its two decay products, [i0, i1, ...] -> [2*i0, 2*i0+1, ...]
+    """
+
+    index = index[:,:,np.newaxis]
+    return ak.flatten(ak.concatenate([2*index,2*index+1],axis=2),axis=2)
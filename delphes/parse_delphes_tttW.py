@@ -1,17 +1,28 @@
 import uproot
+import numpy as np
 import awkward as ak
 import vector
 
+from delphes.matching import match_deltaR, pair_products, pair_indices
+from delphes.reader import ReaderConfig
+from delphes.profiling import Profiler
+
 import sys
 
+# Optional third argument: JSON report of the time and memory of each stage.
+# Branches are read as they are used, so their reading is part of each stage.
+profiler = Profiler(sys.argv[1],enabled=len(sys.argv)>3)
+
 # Load
+profiler.start("load")
 print("Loading file")
 fname = sys.argv[1]
-tree = uproot.open(f"{fname}:Delphes")
+tree = ReaderConfig().open(fname)
 
 # Initialise dictionary
 d = {}
 
+profiler.start("truth")
 print("Writing top and W data")
 # Partons
 _22mask = tree["Particle.Status"].array()==22
@@ -52,6 +63,7 @@ d["b_id"]       = tree["Particle.PID"].array()[status23 & bottom_mask]
 """
 Hadronic W decays are taken from status==23 with PDGID filter
 """
+profiler.start("decays")
 print("Extracting hadronic W decay information")
 only_quarks_mask = abs(tree["Particle.PID"].array()[status23])<=6
 
@@ -97,111 +109,38 @@ Wdecay_combined_phi = ak.concatenate([W_hadronic_decays_phi,W_leptonic_decays_ph
 Wdecay_combined_e   = ak.concatenate([W_hadronic_decays_e,W_leptonic_decays_e],axis=1)
 Wdecay_combined_m   = ak.concatenate([W_hadronic_decays_m,W_leptonic_decays_m],axis=1)
 
+profiler.start("matching")
 print("Performing delta-R matching")
 # Build vectors of W bosons
 """
 The best performing matching is through delta-R matching of candidate Ws to the
 true Ws found through status==22
-{W1,W2,W3,W4} are candidate W bosons built from the decay products
+Candidate Ws are built from consecutive pairs of decay products and assigned
+one-to-one to the true Ws by minimising the summed delta-R
 """
-W1 = vector.zip({"pt":Wdecay_combined_pt[:,0],
-                 "eta":Wdecay_combined_eta[:,0],
-                 "phi":Wdecay_combined_phi[:,0],
-                 "e":Wdecay_combined_e[:,0]}) + vector.zip({"pt":Wdecay_combined_pt[:,1],
-                 "eta":Wdecay_combined_eta[:,1],
-                 "phi":Wdecay_combined_phi[:,1],
-                 "e":Wdecay_combined_e[:,1]})
-                 
-W2 = vector.zip({"pt":Wdecay_combined_pt[:,2],
-                 "eta":Wdecay_combined_eta[:,2],
-                 "phi":Wdecay_combined_phi[:,2],
-                 "e":Wdecay_combined_e[:,2]}) + vector.zip({"pt":Wdecay_combined_pt[:,3],
-                 "eta":Wdecay_combined_eta[:,3],
-                 "phi":Wdecay_combined_phi[:,3],
-                 "e":Wdecay_combined_e[:,3]})
-                 
-W3 = vector.zip({"pt":Wdecay_combined_pt[:,4],
-                 "eta":Wdecay_combined_eta[:,4],
-                 "phi":Wdecay_combined_phi[:,4],
-                 "e":Wdecay_combined_e[:,4]}) + vector.zip({"pt":Wdecay_combined_pt[:,5],
-                 "eta":Wdecay_combined_eta[:,5],
-                 "phi":Wdecay_combined_phi[:,5],
-                 "e":Wdecay_combined_e[:,5]})                 
-                 
-W4 = vector.zip({"pt":Wdecay_combined_pt[:,6],
-                 "eta":Wdecay_combined_eta[:,6],
-                 "phi":Wdecay_combined_phi[:,6],
-                 "e":Wdecay_combined_e[:,6]}) + vector.zip({"pt":Wdecay_combined_pt[:,7],
-                 "eta":Wdecay_combined_eta[:,7],
-                 "phi":Wdecay_combined_phi[:,7],
-                 "e":Wdecay_combined_e[:,7]})
-                 
-dW1 = vector.zip({"pt":d["W_pt"][:,0],                  
-                 "eta":d["W_eta"][:,0],
-                 "phi":d["W_phi"][:,0],
-                 "e":d["W_e"][:,0]}) 
-
-dW2 = vector.zip({"pt":d["W_pt"][:,1],                  
-                 "eta":d["W_eta"][:,1],
-                 "phi":d["W_phi"][:,1],
-                 "e":d["W_e"][:,1]})
-
-dW3 = vector.zip({"pt":d["W_pt"][:,2],                  
-                 "eta":d["W_eta"][:,2],
-                 "phi":d["W_phi"][:,2],
-                 "e":d["W_e"][:,2]})  
-
-dW4 = vector.zip({"pt":d["W_pt"][:,3],                  
-                 "eta":d["W_eta"][:,3],
-                 "phi":d["W_phi"][:,3],
-                 "e":d["W_e"][:,3]})  
-
-DR_dW1 = ak.concatenate([ak.unflatten(dW1.deltaR(W1),1,axis=0),
-                        ak.unflatten(dW1.deltaR(W2),1,axis=0),
-                        ak.unflatten(dW1.deltaR(W3),1,axis=0),
-                        ak.unflatten(dW1.deltaR(W4),1,axis=0)],axis=1)
-
-DR_dW2 = ak.concatenate([ak.unflatten(dW2.deltaR(W1),1,axis=0),
-                        ak.unflatten(dW2.deltaR(W2),1,axis=0),
-                        ak.unflatten(dW2.deltaR(W3),1,axis=0),
-                        ak.unflatten(dW2.deltaR(W4),1,axis=0)],axis=1)
-
-DR_dW3 = ak.concatenate([ak.unflatten(dW3.deltaR(W1),1,axis=0),
-                        ak.unflatten(dW3.deltaR(W2),1,axis=0),
-                        ak.unflatten(dW3.deltaR(W3),1,axis=0),
-                        ak.unflatten(dW3.deltaR(W4),1,axis=0)],axis=1)
-
-DR_dW4 = ak.concatenate([ak.unflatten(dW4.deltaR(W1),1,axis=0),
-                        ak.unflatten(dW4.deltaR(W2),1,axis=0),
-                        ak.unflatten(dW4.deltaR(W3),1,axis=0),
-                        ak.unflatten(dW4.deltaR(W4),1,axis=0)],axis=1)
+W_decays = vector.zip({"pt":Wdecay_combined_pt,
+                       "eta":Wdecay_combined_eta,
+                       "phi":Wdecay_combined_phi,
+                       "e":Wdecay_combined_e})
 
+W_candidates = pair_products(W_decays)
 
-print("Computing indices")
-min_DR_dW1 = ak.argmin(abs(DR_dW1),axis=1)
-min_DR_dW2 = ak.argmin(abs(DR_dW2),axis=1)
-min_DR_dW3 = ak.argmin(abs(DR_dW3),axis=1)
-min_DR_dW4 = ak.argmin(abs(DR_dW4),axis=1)
+W_truth = vector.zip({"pt":d["W_pt"],
+                      "eta":d["W_eta"],
+                      "phi":d["W_phi"],
+                      "e":d["W_e"]})
 
-indices = ak.concatenate([ak.unflatten(min_DR_dW1,1,axis=0),
-                          ak.unflatten(min_DR_dW2,1,axis=0),
-                          ak.unflatten(min_DR_dW3,1,axis=0),
-                          ak.unflatten(min_DR_dW4,1,axis=0)],
-                         axis=1)
+print("Computing indices")
+indices, all_minima = match_deltaR(W_truth,W_candidates)
 
 """
-The delta-R matching is not always successful: matched branch indiciates whether
-there is a unique set of indices
+unmatched flags events in which a true W has no candidate. duplicate_matched
+is kept only for compatibility with readers of earlier outputs: the assignment
+is one-to-one, so a candidate is never shared between two true Ws and it is
+always 0
 """
-d["duplicate_matched"]=ak.fill_none(((ak.sum(indices,axis=1))!=6)*1,float("nan"))
-
-
-
-all_minima = ak.concatenate([DR_dW1[ak.unflatten(indices[:,0],1,axis=0)],
-                DR_dW2[ak.unflatten(indices[:,1],1,axis=0)],
-                DR_dW3[ak.unflatten(indices[:,2],1,axis=0)],
-                DR_dW4[ak.unflatten(indices[:,3],1,axis=0)]],axis=1)
-
+d["duplicate_matched"] = ak.zeros_like(ak.num(indices,axis=1))
+d["unmatched"]         = ak.values_astype(ak.any(ak.is_none(indices,axis=1),axis=1),np.int64)
 
 d["greater_than_0p4"] = ak.count_nonzero(all_minima>0.4,axis=1)
 
@@ -209,7 +148,7 @@ d["greater_than_0p4"] = ak.count_nonzero(all_minima>0.4,axis=1)
 Sorting the indices to reflect the desired order
 """
 
-final_indices = ak.concatenate([2*indices,2*indices+1],axis=1)[:,[0,4,1,5,2,6,3,7]]
+final_indices = pair_indices(indices)
 
 d["W_decay_pt"]       = ak.fill_none(Wdecay_combined_pt[final_indices],float("nan"))
 d["W_decay_eta"]      = ak.fill_none(Wdecay_combined_eta[final_indices],float("nan"))
@@ -225,6 +164,7 @@ print("Truth particle parsing complete")
 
 
 ### Reco-level
+profiler.start("reco")
 print("Writing reco-level trees")
 r = {}
 
@@ -250,9 +190,13 @@ r["met_met"]  =  tree["MissingET.MET"].array()
 r["met_eta"]  =  tree["MissingET.Eta"].array()
 r["met_phi"]  =  tree["MissingET.Phi"].array()
 
+profiler.start("write")
 print("Writing file")
 fname = sys.argv[2]
 with  uproot.recreate(f"{fname}") as file:
     file["Truth"] = d
     file["Reco"]  = r
-print("Complete")
\ No newline at end of file
+print("Complete")
+
+if profiler.enabled:
+    profiler.write(sys.argv[3])
@@ -0,0 +1,194 @@
+import argparse
+from contextlib import nullcontext
+
+import awkward as ak
+
+from delphes.truth_tools import PARTICLE_FIELDS, META_BRANCHES, RECO_FIELDS, parse_meta, parse_reco, load_events, iterate_events
+from delphes.selection import SELECTION_BRANCHES, CATEGORIES, select_truth
+from delphes import writers
+from delphes.reader import ReaderConfig
+from delphes.profiling import Profiler
+from delphes.cache import ParseCache
+
+
+class Process:
+
+    """
+    Declarative description of a signal process for the Delphes parser.
+    Args:
+    - name           : process name used on the command line
+    - multiplicities : expected number of objects per event for each truth
+                       category, e.g. {"top":4,"W":4,"W_decay":8}; events
+                       with other multiplicities fail the parsing
+    - truth          : truth categories to extract (see selection.CATEGORIES)
+    - fields         : Particle fields to write for each truth category
+    - reco           : reco objects to write (see truth_tools.RECO_FIELDS)
+    The minimal set of branches is computed up front and the truth selection
+    is done in a single fused pass, see branches() and parse().
+    """
+
+    def __init__(self, name:str, multiplicities:dict, truth=CATEGORIES, fields=list(PARTICLE_FIELDS), reco=list(RECO_FIELDS)):
+        self.name           = name
+        self.multiplicities = multiplicities
+        self.truth          = list(truth)
+        self.fields         = list(fields)
+        self.reco           = list(reco)
+
+        for category in list(self.multiplicities)+self.truth:
+            if category not in CATEGORIES:
+                raise ValueError(f"Unknown truth category {category}, expected one of {CATEGORIES}")
+        for field in self.fields:
+            if field not in PARTICLE_FIELDS:
+                raise ValueError(f"Unknown particle field {field}, expected one of {list(PARTICLE_FIELDS)}")
+        for obj in self.reco:
+            if obj not in RECO_FIELDS:
+                raise ValueError(f"Unknown reco object {obj}, expected one of {list(RECO_FIELDS)}")
+
+    def options(self):
+
+        """
+        Everything which determines the parsed output, for the cache key
+        """
+
+        return {"name"           : self.name,
+                "multiplicities" : self.multiplicities,
+                "truth"          : self.truth,
+                "fields"         : self.fields,
+                "reco"           : self.reco}
+
+    def branches(self):
+
+        """
+        The read plan: every branch needed by the requested outputs, once
+        """
+
+        branches = list(META_BRANCHES)
+        if self.truth or self.multiplicities:
+            branches += SELECTION_BRANCHES + [PARTICLE_FIELDS[f] for f in self.fields or ["id"]]
+        for obj in self.reco:
+            branches += list(RECO_FIELDS[obj].values())
+        return list(dict.fromkeys(branches))
+
+    def check(self, counts:dict):
+        for category,n in self.multiplicities.items():
+            assert ak.count_nonzero(counts[category]!=n) == 0, f"There are events with other than {n} {category} in {self.name}"
+
+    def parse(self, events:dict, profiler=None):
+
+        """
+        Truth and reco dictionaries of a chunk of events, the truth stage
+        covers the fused top, W, b and decay selection
+        """
+
+        profiler = profiler or Profiler(enabled=False)
+
+        print("Parsing truth")
+        with profiler.stage("truth"):
+            d = {}
+            d = parse_meta(events,d)
+
+            if self.truth or self.multiplicities:
+                print("Parsing top, W and decay information")
+                categories = list(dict.fromkeys(self.truth+list(self.multiplicities)))
+                fields     = self.fields or ["id"]
+                truth = select_truth(events,{},categories,fields)
+                self.check({c: ak.num(truth[f"{c}_{fields[0]}"],axis=1) for c in self.multiplicities})
+                d.update({f"{c}_{f}": truth[f"{c}_{f}"] for c in self.truth for f in self.fields})
+        print("Truth particle parsing complete")
+
+        print("Writing reco-level trees")
+        with profiler.stage("reco"):
+            r = {}
+            r = parse_reco(events,r,self.reco)
+
+        return d, r
+
+
+# Bump whenever the parsed output of a given input and Process changes, this
+# invalidates the cached outputs
+PARSER_VERSION = 1
+
+# Adding a signal process only needs a new entry here
+PROCESSES = {"4tops" : Process("4tops", {"top":4,"W":4,"W_decay":8}),
+             "3tW"   : Process("3tW",   {"top":3,"W":4,"W_decay":8}),
+             "3tj"   : Process("3tj",   {"top":3,"W":3,"W_decay":6})}
+
+
+def run(process:Process, inname:str, outname:str, step_size=None, config=None, output=None, profiler=None, cache=None):
+
+    """
+    Parses a Delphes file with a process description, in one go or streamed
+    in chunks of step_size events (default: config.step_size).
+    output holds the open_writer options (backend, compression, ...), ROOT
+    with the uproot defaults if not given.
+    profiler records the load, truth, reco and write stages.
+    With a ParseCache, a previously parsed input is read back from the cache
+    instead of being parsed again, and new results are stored in it.
+    """
+
+    config    = config or ReaderConfig()
+    step_size = step_size or config.step_size
+    profiler  = profiler or Profiler(enabled=False)
+
+    # The shared lock keeps eviction from removing the entry while it is read
+    with cache.using() if cache else nullcontext():
+        key   = cache.key(inname,PARSER_VERSION,strict=config.strict,**process.options()) if cache else None
+        entry = cache.get(key) if cache else None
+
+        if entry is not None:
+            print(f"Reading cached output {entry}")
+            chunks = cache.read(entry)
+        else:
+            print("Loading file")
+            tree = config.open(inname)
+            branches = process.branches()
+
+            if step_size is None:
+                chunks = (load_events(tree,branches,config) for _ in range(1))
+            else:
+                print(f"Streaming in chunks of {step_size} events")
+                chunks = iterate_events(tree,step_size,branches,config)
+
+        store = cache.store(key) if cache and entry is None else nullcontext()
+        with writers.open_writer(outname,**(output or {})) as writer, store:
+            while True:
+                # Chunks are read lazily, so loading is timed chunk by chunk
+                with profiler.stage("load"):
+                    events = next(chunks,None)
+                if events is None:
+                    break
+                if entry is not None:
+                    d, r = events
+                else:
+                    d, r = process.parse(events,profiler)
+                    if cache:
+                        store.write(Truth=d,Reco=r)
+                print("Writing file")
+                with profiler.stage("write"):
+                    writer.write(Truth=d,Reco=r)
+    print("Complete")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Parse truth and reco information from a Delphes file")
+    parser.add_argument("infile", type=str)
+    parser.add_argument("outfile", type=str)
+    parser.add_argument("-p","--process", type=str, choices=list(PROCESSES), required=True)
+    ReaderConfig.arguments(parser)
+    writers.arguments(parser)
+    Profiler.arguments(parser)
+    ParseCache.arguments(parser)
+
+    args = parser.parse_args()
+    profiler = Profiler.from_args(args,args.process)
+    cache = ParseCache.from_args(args)
+    run(PROCESSES[args.process],args.infile,args.outfile,config=ReaderConfig.from_args(args),
+        output=writers.options_from_args(args),profiler=profiler,cache=cache)
+    if cache:
+        cache.evict()
+    profiler.write(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import resource
+import datetime
+import tracemalloc
+from contextlib import contextmanager
+
+
+def rss():
+
+    """
+    Current and peak resident memory of this process in MB, from /proc where
+    available (ru_maxrss is inherited from the parent through fork)
+    """
+
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":",1) for line in f)
+        return int(status["VmRSS"].split()[0])/1024, int(status["VmHWM"].split()[0])/1024
+    except (OSError,KeyError):
+        # ru_maxrss is in kB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+        return peak, peak
+
+
+def reset_peak_rss():
+
+    """
+    Resets the peak RSS to the current RSS (Linux only), returns False if
+    the peak could not be reset and keeps counting from the process start
+    """
+
+    try:
+        with open("/proc/self/clear_refs","w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class Profiler:
+
+    """
+    Records the wall time, CPU time, peak RSS and (optionally) the tracemalloc
+    allocations of the named stages of a parsing run, e.g. load, truth,
+    decays, matching, reco and write. A stage entered several times, as when
+    streaming chunks, accumulates its times and keeps its maximum peaks.
+    Args:
+    - name        : name of the run in the report
+    - enabled     : a disabled profiler records nothing, so that the
+                    parsers can always call it
+    - tracemalloc : trace Python allocations, slows the run down
+    Stages are delimited with the stage() context manager, or with start()
+    and stop() in module-level scripts.
+    """
+
+    def __init__(self, name:str="", enabled:bool=True, tracemalloc:bool=False):
+        self.name        = name
+        self.enabled     = enabled
+        self.tracemalloc = tracemalloc
+        self.stages      = {}
+        self.current     = None
+        self.started     = datetime.datetime.now().isoformat(timespec="seconds")
+        self.wall        = time.perf_counter()
+        self.cpu         = time.process_time()
+
+    def start(self, stage:str):
+
+        """
+        Starts a stage, stopping the current one
+        """
+
+        if not self.enabled:
+            return
+        self.stop()
+        if self.tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        resettable = reset_peak_rss()
+        self.current = {"name"       : stage,
+                        "wall"       : time.perf_counter(),
+                        "cpu"        : time.process_time(),
+                        "rss"        : rss()[0],
+                        "resettable" : resettable,
+                        "traced"     : tracemalloc.get_traced_memory()[0] if self.tracemalloc else 0}
+
+    def stop(self):
+        if not self.enabled or self.current is None:
+            return
+        current, self.current = self.current, None
+        wall = time.perf_counter()-current["wall"]
+        cpu  = time.process_time()-current["cpu"]
+        now, peak = rss()
+
+        entry = self.stages.setdefault(current["name"],{"calls"          : 0,
+                                                        "wall_s"         : 0.,
+                                                        "cpu_s"          : 0.,
+                                                        "rss_delta_mb"   : 0.,
+                                                        "peak_rss_mb"    : 0.,
+                                                        "peak_is_stage"  : True})
+        entry["calls"]         += 1
+        entry["wall_s"]        += wall
+        entry["cpu_s"]         += cpu
+        entry["rss_delta_mb"]  += now-current["rss"]
+        entry["peak_rss_mb"]    = max(entry["peak_rss_mb"],peak)
+        entry["peak_is_stage"] &= current["resettable"]
+        if self.tracemalloc:
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            entry["alloc_net_mb"]  = entry.get("alloc_net_mb",0.)+(traced-current["traced"])/2**20
+            entry["alloc_peak_mb"] = max(entry.get("alloc_peak_mb",0.),(traced_peak-current["traced"])/2**20)
+
+    @contextmanager
+    def stage(self, stage:str):
+        self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def report(self):
+        self.stop()
+        return {"name"    : self.name,
+                "argv"    : sys.argv,
+                "pid"     : os.getpid(),
+                "started" : self.started,
+                "stages"  : self.stages,
+                "total"   : {"wall_s"      : time.perf_counter()-self.wall,
+                             "cpu_s"       : time.process_time()-self.cpu,
+                             "peak_rss_mb" : max([s["peak_rss_mb"] for s in self.stages.values()]+[rss()[1]])}}
+
+    def write(self, path:str):
+
+        """
+        Writes the JSON report to path
+        """
+
+        if not self.enabled:
+            return
+        with open(path,"w") as f:
+            json.dump(self.report(),f,indent=2)
+
+    @staticmethod
+    def arguments(parser):
+
+        """
+        Adds the profiling options to an argparse parser, see from_args
+        """
+
+        parser.add_argument("--profile", type=str, help="Write a JSON report of the time and memory of each stage", required=False)
+        parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python allocations in the report (slower)", required=False)
+
+    @staticmethod
+    def from_args(args, name:str=""):
+        return Profiler(name,enabled=args.profile is not None,tracemalloc=args.tracemalloc)
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import uproot
+
+
+class ReaderConfig:
+
+    """
+    Shared uproot settings for every reader of Delphes and parsed files.
+    Args:
+    - decompression_workers  : threads decompressing baskets (default: all cores,
+                               1 reads on the calling thread)
+    - interpretation_workers : threads turning baskets into arrays (default: as
+                               decompression_workers)
+    - step_size              : events (int) or memory ("100 MB") per chunk when
+                               iterating, None reads the whole tree at once
+    - strict                 : only the requested branches are read and a missing
+                               branch is an error; otherwise missing branches
+                               are skipped
+    """
+
+    def __init__(self, decompression_workers=None, interpretation_workers=None, step_size=None, strict=True):
+        self.decompression_workers  = decompression_workers or os.cpu_count()
+        self.interpretation_workers = interpretation_workers or self.decompression_workers
+        self.step_size              = step_size
+        self.strict                 = strict
+        self._executors             = None
+
+    def executors(self):
+
+        """
+        Thread pools passed to uproot, created once and shared by every tree
+        opened with this configuration
+        """
+
+        if self._executors is None:
+            def pool(workers):
+                return ThreadPoolExecutor(workers) if workers>1 else uproot.source.futures.TrivialExecutor()
+            self._executors = {"decompression_executor"  : pool(self.decompression_workers),
+                               "interpretation_executor" : pool(self.interpretation_workers)}
+        return self._executors
+
+    def open(self, path:str, treename:str="Delphes"):
+        return uproot.open(f"{path}:{treename}",**self.executors())
+
+    def project(self, tree, branches:list):
+
+        """
+        Column projection: the exact list of branches that will be read
+        """
+
+        # Delphes members are nested (Particle/Particle.PID), match on their names
+        available = set(tree.keys(full_paths=False)) | set(tree.keys())
+        missing   = [b for b in branches if b not in available]
+        if missing and self.strict:
+            raise KeyError(f"Branches {missing} not found in {tree.object_path} of {tree.file.file_path}")
+        return [b for b in branches if b in available]
+
+    def read(self, tree, branches:list):
+
+        """
+        Reads the projected branches in one call, as a dictionary keyed by name
+        """
+
+        return tree.arrays(self.project(tree,branches),how=dict,**self.executors())
+
+    def iterate(self, tree, branches:list, step_size=None):
+
+        """
+        Chunked equivalent of read
+        """
+
+        yield from tree.iterate(self.project(tree,branches),
+                                step_size=step_size or self.step_size,
+                                how=dict,**self.executors())
+
+    @staticmethod
+    def arguments(parser):
+
+        """
+        Adds the reader options to an argparse parser, see from_args
+        """
+
+        parser.add_argument("--threads", type=int, help="Decompression/interpretation threads, defaults to all cores", required=False)
+        parser.add_argument("--step-size", type=int, help="Events per chunk, reads the whole file if not given", required=False)
+        parser.add_argument("--no-strict", action="store_true", help="Skip requested branches which are missing", required=False)
+
+    @staticmethod
+    def from_args(args):
+        return ReaderConfig(decompression_workers=args.threads,step_size=args.step_size,strict=not args.no_strict)
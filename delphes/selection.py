@@ -0,0 +1,106 @@
+import numpy as np
+import awkward as ak
+import numba as nb
+
+from delphes.truth_tools import PARTICLE_FIELDS
+
+# Branches read by the kernel itself, on top of the requested output fields
+SELECTION_BRANCHES = ["Particle.PID","Particle.Status","Particle.M1"]
+
+# Output prefix of each category, in the order of the bits set by _flag_particles
+CATEGORIES = ["top","W","b","W_decay"]
+
+
+@nb.njit(cache=True)
+def _flag_particles(offsets,pid,status,m1):
+
+    """
+    Single pass over the flattened Particle content. Sets one bit per truth
+    category for every particle and counts each category per event:
+    - top     : status 22, |PID| 6
+    - W       : status 22, |PID| 24
+    - b       : status 23, |PID| 5, mother is not a W
+    - W_decay : |PID| < 17, mother is a W
+    """
+
+    n_events = len(offsets)-1
+    flags  = np.zeros(len(pid),dtype=np.uint8)
+    counts = np.zeros((4,n_events),dtype=np.int64)
+    for e in range(n_events):
+        start = offsets[e]
+        size  = offsets[e+1]-start
+        for i in range(start,start+size):
+            apid = abs(pid[i])
+            mother = m1[i]
+            W_mother = mother>=0 and mother<size and abs(pid[start+mother])==24
+            flag = 0
+            if status[i]==22:
+                if apid==6:
+                    flag |= 1
+                    counts[0,e] += 1
+                elif apid==24:
+                    flag |= 2
+                    counts[1,e] += 1
+            if W_mother:
+                if apid<17:
+                    flag |= 8
+                    counts[3,e] += 1
+            elif status[i]==23 and apid==5:
+                flag |= 4
+                counts[2,e] += 1
+            flags[i] = flag
+    return flags, counts
+
+
+@nb.njit(cache=True)
+def _category_indices(flags,counts):
+
+    """
+    Global indices of the particles in each category, filled in one pass over
+    the flags. Returns one array per category, concatenated, with their offsets.
+    """
+
+    totals = counts.sum(axis=1)
+    starts = np.zeros(5,dtype=np.int64)
+    for c in range(4):
+        starts[c+1] = starts[c]+totals[c]
+    index = np.empty(starts[4],dtype=np.int64)
+    fill  = starts[:4].copy()
+    for i in range(len(flags)):
+        flag = flags[i]
+        if flag:
+            for c in range(4):
+                if flag & (1<<c):
+                    index[fill[c]] = i
+                    fill[c] += 1
+    return index, starts
+
+
+def select_truth(events,d,categories=CATEGORIES,fields=list(PARTICLE_FIELDS)):
+
+    """
+    Fused equivalent of parse_tops_and_Ws followed by parse_decays: all the
+    top, W, b-quark and W-decay selections are made in one compiled pass over
+    the particles, then each output field is a single gather.
+    Fills the same top_*, W_*, b_* and W_decay_* entries of d, restricted to
+    the requested categories and fields.
+    """
+
+    pid     = events["Particle.PID"]
+    counts  = ak.to_numpy(ak.num(pid,axis=1))
+    offsets = np.concatenate([[0],np.cumsum(counts)]).astype(np.int64)
+
+    def flat(branch):
+        return ak.to_numpy(ak.flatten(events[branch]))
+
+    flags, category_counts = _flag_particles(offsets,flat("Particle.PID"),flat("Particle.Status"),flat("Particle.M1"))
+    index, starts = _category_indices(flags,category_counts)
+
+    contents = {suffix: flat(PARTICLE_FIELDS[suffix]) for suffix in fields}
+    for c,prefix in enumerate(CATEGORIES):
+        if prefix not in categories:
+            continue
+        selected = index[starts[c]:starts[c+1]]
+        for suffix in fields:
+            d[f"{prefix}_{suffix}"] = ak.unflatten(contents[suffix][selected],category_counts[c])
+    return d
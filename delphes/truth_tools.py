@@ -1,92 +1,125 @@
 import uproot
 import awkward as ak
 
-def parse_tops_and_Ws(tree,d):
-    _22mask = tree["Particle.Status"].array()==22
-    top_mask = abs(tree["Particle.PID"].array())==6
-    W_mask   = abs(tree["Particle.PID"].array())==24
-
-    d["top_pt"]     = tree["Particle.PT"].array()[_22mask & top_mask]
-    d["top_eta"]    = tree["Particle.Eta"].array()[_22mask & top_mask]
-    d["top_phi"]    = tree["Particle.Phi"].array()[_22mask & top_mask]
-    d["top_e"]      = tree["Particle.E"].array()[_22mask & top_mask]
-    d["top_mass"]   = tree["Particle.Mass"].array()[_22mask & top_mask]
-    d["top_id"]     = tree["Particle.PID"].array()[_22mask & top_mask] 
-
-    d["W_pt"]       = tree["Particle.PT"].array()[_22mask & W_mask]
-    d["W_eta"]      = tree["Particle.Eta"].array()[_22mask & W_mask]
-    d["W_phi"]      = tree["Particle.Phi"].array()[_22mask & W_mask]
-    d["W_e"]        = tree["Particle.E"].array()[_22mask & W_mask]
-    d["W_mass"]     = tree["Particle.Mass"].array()[_22mask & W_mask]
-    d["W_id"]       = tree["Particle.PID"].array()[_22mask & W_mask] 
-    
+from delphes.ancestry import AncestryIndex
+from delphes.reader import ReaderConfig
+
+# Particle.* members needed by the truth helpers
+PARTICLE_BRANCHES = ["Particle.PID",
+                     "Particle.Status",
+                     "Particle.M1",
+                     "Particle.PT",
+                     "Particle.Eta",
+                     "Particle.Phi",
+                     "Particle.E",
+                     "Particle.Mass"]
+
+META_BRANCHES = ["Event.Number"]
+
+# Reco object -> output suffix -> branch, in the order the fields are written
+RECO_FIELDS = {"jet" : {"pt":"Jet.PT","eta":"Jet.Eta","phi":"Jet.Phi","mass":"Jet.Mass","btag":"Jet.BTag"},
+               "el"  : {"pt":"Electron.PT","eta":"Electron.Eta","phi":"Electron.Phi","charge":"Electron.Charge"},
+               "mu"  : {"pt":"Muon.PT","eta":"Muon.Eta","phi":"Muon.Phi","charge":"Muon.Charge"},
+               "met" : {"met":"MissingET.MET","eta":"MissingET.Eta","phi":"MissingET.Phi"}}
+
+RECO_BRANCHES = [branch for fields in RECO_FIELDS.values() for branch in fields.values()]
+
+# Output suffix -> Particle member, in the order the fields are written
+PARTICLE_FIELDS = {"pt"   : "Particle.PT",
+                   "eta"  : "Particle.Eta",
+                   "phi"  : "Particle.Phi",
+                   "e"    : "Particle.E",
+                   "mass" : "Particle.Mass",
+                   "id"   : "Particle.PID"}
+
+
+def load_events(tree,branches=PARTICLE_BRANCHES+META_BRANCHES+RECO_BRANCHES,config=None):
+
+    """
+    Reads every branch needed by the truth and reco helpers in a single
+    tree.arrays call, so each basket is decompressed once.
+    Returns a dictionary of arrays keyed by branch name which is passed to the
+    parse_* helpers in place of the tree.
+    config is a reader.ReaderConfig, the default uses all cores.
+    """
+
+    config = config or ReaderConfig()
+    return config.read(tree,branches)
+
+
+def iterate_events(tree,step_size,branches=PARTICLE_BRANCHES+META_BRANCHES+RECO_BRANCHES,config=None):
+
+    """
+    Chunked equivalent of load_events: yields the same dictionaries for
+    consecutive blocks of step_size events, so memory is bounded by the chunk
+    rather than by the file.
+    """
+
+    config = config or ReaderConfig()
+    yield from config.iterate(tree,branches,step_size)
+
+
+def select_particles(events,mask,prefix,d):
+
+    """
+    Applies a single particle mask to each of the PARTICLE_FIELDS
+    """
+
+    for suffix,branch in PARTICLE_FIELDS.items():
+        d[f"{prefix}_{suffix}"] = events[branch][mask]
+    return d
+
+
+def parse_tops_and_Ws(events,d):
+    abs_pid  = abs(events["Particle.PID"])
+    _22mask  = events["Particle.Status"]==22
+    top_mask = abs_pid==6
+    W_mask   = abs_pid==24
+
+    d = select_particles(events,_22mask & top_mask,"top",d)
+    d = select_particles(events,_22mask & W_mask,"W",d)
+
     return d
 
 
-def parse_decays(tree,d):
-        
+def parse_decays(events,d):
+
+    abs_pid  = abs(events["Particle.PID"])
+    ancestry = AncestryIndex(events)
+
     # Final-state particles
-    status23    = tree["Particle.Status"].array()==23
+    status23    = events["Particle.Status"]==23
     # Particles with a W mother
-    has_a_W_mother = abs(tree["Particle.PID"].array()[tree["Particle.M1"].array()])==24
+    has_a_W_mother = ancestry.has_ancestor([24],generations=1)
     # Particles which are bs
-    bottom_mask = abs(tree["Particle.PID"].array())==5
+    bottom_mask = abs_pid==5
     # Is a quark or lepton
-    is_fermion = abs(tree["Particle.PID"].array())<17
+    is_fermion = abs_pid<17
 
     # B quarks
     print("Extracting b-quark information")
-
-    d["b_id"]     = tree["Particle.PID"].array()[status23 & ~has_a_W_mother & bottom_mask]
+    d = select_particles(events,status23 & ~has_a_W_mother & bottom_mask,"b",d)
     # assert ak.count_nonzero(ak.count(d["b_id"],axis=1) !=4 ) == 0, "There are events with other than four bottom quarks"
 
-    d["b_pt"]       = tree["Particle.PT"].array()[status23 & ~has_a_W_mother & bottom_mask]
-    d["b_eta"]      = tree["Particle.Eta"].array()[status23 & ~has_a_W_mother & bottom_mask]
-    d["b_phi"]      = tree["Particle.Phi"].array()[status23 & ~has_a_W_mother & bottom_mask]
-    d["b_e"]        = tree["Particle.E"].array()[status23 & ~has_a_W_mother & bottom_mask]
-    d["b_mass"]     = tree["Particle.Mass"].array()[status23 & ~has_a_W_mother & bottom_mask]
-
     # Wdecays
     print("Extracting W decay information")
+    d = select_particles(events,has_a_W_mother & is_fermion,"W_decay",d)
 
-    d["W_decay_id"]     = tree["Particle.PID"].array()[has_a_W_mother & is_fermion]
-    d["W_decay_pt"]     = tree["Particle.PT"].array()[has_a_W_mother & is_fermion]
-    d["W_decay_eta"]    = tree["Particle.Eta"].array()[has_a_W_mother & is_fermion]
-    d["W_decay_phi"]    = tree["Particle.Phi"].array()[has_a_W_mother & is_fermion]
-    d["W_decay_e"]      = tree["Particle.E"].array()[has_a_W_mother & is_fermion]
-    d["W_decay_mass"]   = tree["Particle.Mass"].array()[has_a_W_mother & is_fermion]
-    
-    return d 
+    return d
 
 
-def parse_meta(tree,d):
-    
-    d["EventNumber"]      = tree["Event.Number"].array()
-    
-    return d
+def parse_meta(events,d):
 
-def parse_reco(tree,r):
+    d["EventNumber"]      = events["Event.Number"]
 
-    r["EventNumber"]      = tree["Event.Number"].array()
+    return d
 
-    r["jet_pt"]     =  tree["Jet.PT"].array()
-    r["jet_eta"]    =  tree["Jet.Eta"].array()
-    r["jet_phi"]    =  tree["Jet.Phi"].array()
-    r["jet_mass"]   =  tree["Jet.Mass"].array()
-    r["jet_btag"]   = tree["Jet.BTag"].array()
+def parse_reco(events,r,objects=list(RECO_FIELDS)):
 
-    r["el_pt"]      =  tree["Electron.PT"].array()
-    r["el_eta"]     =  tree["Electron.Eta"].array()
-    r["el_phi"]     =  tree["Electron.Phi"].array()
-    r["el_charge"]  =  tree["Electron.Charge"].array()
+    r["EventNumber"]      = events["Event.Number"]
 
-    r["mu_pt"]      =  tree["Muon.PT"].array()
-    r["mu_eta"]      =  tree["Muon.Eta"].array()
-    r["mu_phi"]      =  tree["Muon.Phi"].array()
-    r["mu_charge"]  =  tree["Muon.Charge"].array()
+    for obj in objects:
+        for suffix,branch in RECO_FIELDS[obj].items():
+            r[f"{obj}_{suffix}"] = events[branch]
 
-    r["met_met"]    =  tree["MissingET.MET"].array()
-    r["met_eta"]    =  tree["MissingET.Eta"].array()
-    r["met_phi"]    =  tree["MissingET.Phi"].array()
-    
-    return r
\ No newline at end of file
+    return r
@@ -0,0 +1,149 @@
+import os
+import glob
+
+import uproot
+import awkward as ak
+
+# Codec names accepted by the writers, mapped to the uproot compression
+ROOT_CODECS = {"none" : None,
+               "zlib" : uproot.ZLIB,
+               "lzma" : uproot.LZMA,
+               "lz4"  : uproot.LZ4,
+               "zstd" : uproot.ZSTD}
+
+PARQUET_CODECS = ["none","snappy","gzip","brotli","lz4","zstd"]
+
+
+class RootWriter:
+
+    """
+    Writes dictionaries of arrays to named trees in a ROOT file.
+    The first write to a tree creates it, later writes are appended, so the
+    parsers can stream chunks to disk and produce the same file as a single
+    in-memory write.
+    compression is one of ROOT_CODECS (level 1 unless given), None keeps the
+    uproot default.
+    """
+
+    extension = ".root"
+
+    def __init__(self,outname:str,compression=None,level=None):
+        if compression is not None and compression not in ROOT_CODECS:
+            raise ValueError(f"Unknown ROOT codec {compression}, expected one of {list(ROOT_CODECS)}")
+        options = {}
+        if compression is not None:
+            codec = ROOT_CODECS[compression]
+            options["compression"] = None if codec is None else codec(1 if level is None else level)
+        self.outname = outname
+        self.file    = uproot.recreate(f"{outname}",**options)
+
+    def write(self,**trees):
+        for name,arrays in trees.items():
+            if name in self.file:
+                self.file[name].extend(arrays)
+            else:
+                self.file[name] = arrays
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+class ParquetWriter:
+
+    """
+    Writes the same dictionaries as RootWriter as partitioned Parquet
+    datasets: one directory per tree (outname/Truth, outname/Reco) holding one
+    part file per write, so streamed chunks become partitions.
+    Each column is written separately, so downstream readers (pyarrow,
+    pandas, ak.from_parquet) can load a subset of columns with several threads.
+    Args:
+    - compression    : one of PARQUET_CODECS
+    - level          : codec compression level, None for the codec default
+    - row_group_size : maximum number of events per row group
+    """
+
+    extension = ""
+
+    def __init__(self,outname:str,compression="zstd",level=None,row_group_size=64*1024):
+        if compression not in PARQUET_CODECS:
+            raise ValueError(f"Unknown Parquet codec {compression}, expected one of {PARQUET_CODECS}")
+        self.outname        = outname
+        self.compression    = None if compression=="none" else compression
+        self.level          = level
+        self.row_group_size = row_group_size
+        self.parts          = {}
+        os.makedirs(outname,exist_ok=True)
+
+    def write(self,**trees):
+        for name,arrays in trees.items():
+            directory = os.path.join(self.outname,name)
+            if name not in self.parts:
+                # Recreate the dataset like uproot.recreate does for a file
+                os.makedirs(directory,exist_ok=True)
+                for old in glob.glob(os.path.join(directory,"part-*.parquet")):
+                    os.remove(old)
+                self.parts[name] = 0
+            ak.to_parquet(ak.zip(arrays,depth_limit=1),
+                          os.path.join(directory,f"part-{self.parts[name]:05d}.parquet"),
+                          compression=self.compression,
+                          compression_level=self.level,
+                          row_group_size=self.row_group_size)
+            self.parts[name] += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+WRITERS = {"root"    : RootWriter,
+           "parquet" : ParquetWriter}
+
+
+def open_writer(outname:str,backend:str="root",**options):
+
+    """
+    Opens the writer of the selected backend, options are passed on to it
+    """
+
+    return WRITERS[backend](outname,**options)
+
+
+def arguments(parser):
+
+    """
+    Adds the output options to an argparse parser, see options_from_args
+    """
+
+    parser.add_argument("--format", type=str, choices=list(WRITERS), default="root", help="Output backend")
+    parser.add_argument("--compression", type=str, help=f"Codec, ROOT: {list(ROOT_CODECS)}, Parquet: {PARQUET_CODECS}", required=False)
+    parser.add_argument("--compression-level", type=int, required=False)
+    parser.add_argument("--row-group-size", type=int, help="Events per Parquet row group", required=False)
+
+
+def options_from_args(args):
+
+    """
+    Keyword arguments of open_writer from the parsed command line
+    """
+
+    options = {"backend":args.format}
+    if args.compression is not None:
+        options["compression"] = args.compression
+    if args.compression_level is not None:
+        options["level"] = args.compression_level
+    if args.row_group_size is not None:
+        if args.format!="parquet":
+            raise ValueError("--row-group-size only applies to the Parquet output")
+        options["row_group_size"] = args.row_group_size
+    return options
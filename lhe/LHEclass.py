@@ -1,10 +1,226 @@
 
 import numpy as np
 import pylhe
+import os
 import sys
+import gzip
+from itertools import islice
 import awkward as ak
 import uproot 
 
+# Columns of the event information and particle lines of an LHE event, in
+# file order, with the integer ones as in pylhe.to_awkward
+EVENTINFO_COLUMNS = ["nparticles","pid","weight","scale","aqed","aqcd"]
+PARTICLE_COLUMNS  = ["id","status","mother1","mother2","color1","color2","px","py","pz","e","m","lifetime","spin"]
+INTEGER_COLUMNS   = {"nparticles","pid","id","status","mother1","mother2","color1","color2"}
+
+# Bytes of the (decompressed) file tokenized at once
+CHUNK_BYTES = 16 << 20
+
+# Bytes at the start of a particle line searched for its ID by block_ids
+ID_WIDTH = 16
+
+
+def _numbers(buffer:np.ndarray, lengths:np.ndarray, lines:np.ndarray, width:int):
+
+    """
+    Parses the whitespace-separated numbers of the given lines of a byte
+    buffer (split into lines of lengths bytes, newlines included) in one call,
+    as a (lines, width) array
+    """
+
+    selected = np.zeros(len(lengths),dtype=bool)
+    selected[lines] = True
+    values = np.fromstring(buffer[np.repeat(selected,lengths)].tobytes(),sep=" ")
+    if len(values)!=len(lines)*width:
+        raise ValueError(f"Expected {width} numbers on each of {len(lines)} LHE lines, found {len(values)} in total")
+    return values.reshape(-1,width)
+
+
+def _locate(buffer:np.ndarray):
+
+    """
+    Line lengths, event information and particle line indices of the
+    complete <event> blocks in a byte buffer
+    """
+
+    newlines = np.flatnonzero(buffer==ord("\n"))
+    starts = np.concatenate([[0],newlines+1])
+    lengths = np.diff(np.concatenate([starts,[len(buffer)]]))
+
+    # Lines starting with <event> or <event attributes...>
+    tag  = np.frombuffer(b"<event",dtype=np.uint8)
+    tags = np.flatnonzero(buffer[np.minimum(starts,len(buffer)-1)]==ord("<"))
+    head = np.minimum(starts[tags,None]+np.arange(len(tag)+1),len(buffer)-1)
+    is_event = (buffer[head[:,:-1]]==tag).all(axis=1) & np.isin(buffer[head[:,-1]],[ord(">"),ord(" ")])
+    event_lines = tags[is_event]
+
+    info = _numbers(buffer,lengths,event_lines+1,len(EVENTINFO_COLUMNS))
+    counts = info[:,0].astype(np.int64)
+
+    # The particle lines follow the event information line of each event
+    offsets = np.concatenate([[0],np.cumsum(counts)])
+    lines = np.repeat(event_lines+2-offsets[:-1],counts)+np.arange(offsets[-1])
+    return starts, lengths, info, counts, lines
+
+
+def parse_block(block:bytes):
+
+    """
+    Event array, as built by pylhe.to_awkward, of the complete <event> blocks
+    in block. Event and particle lines are located with NumPy on the raw
+    bytes and each kind is converted in bulk, without any per-event or
+    per-particle Python objects. Reweighting information (<rwgt>) is not
+    read.
+    """
+
+    buffer = np.frombuffer(block,dtype=np.uint8)
+    _, lengths, info, counts, lines = _locate(buffer)
+    particles = _numbers(buffer,lengths,lines,len(PARTICLE_COLUMNS))
+
+    def column(values,name):
+        return values.astype(np.int64) if name in INTEGER_COLUMNS else values
+
+    p = {name: column(particles[:,i],name) for i,name in enumerate(PARTICLE_COLUMNS)}
+    vector = ak.zip({k: p[k] for k in ("px","py","pz","e")},with_name="Momentum4D")
+    flat = ak.zip({"vector":vector,**{k: p[k] for k in PARTICLE_COLUMNS if k not in ("px","py","pz","e")}},
+                  with_name="Particle",depth_limit=1)
+    eventinfo = ak.zip({name: column(info[:,i],name) for i,name in enumerate(EVENTINFO_COLUMNS)},with_name="EventInfo")
+    return ak.zip({"eventinfo":eventinfo,"particles":ak.unflatten(flat,counts)},with_name="Event",depth_limit=1)
+
+
+def block_ids(block:bytes, width:int=ID_WIDTH):
+
+    """
+    Distinct particle IDs of the complete <event> blocks in block. Only the
+    first token of each particle line, found in its first width bytes, is
+    converted, which makes this much cheaper than parse_block.
+    """
+
+    buffer = np.frombuffer(block,dtype=np.uint8)
+    starts, lengths, _, _, lines = _locate(buffer)
+    # Past its end a line repeats its newline, which is blank like the
+    # whitespace
+    position = np.arange(width)
+    head = buffer[starts[lines,None]+np.minimum(position,lengths[lines,None]-1)]
+    blank = head<=ord(" ")
+    first = np.argmax(~blank,axis=1)
+    after = blank & (position>=first[:,None])
+    if not after.any(axis=1).all():
+        raise ValueError(f"Particle IDs longer than {width} bytes")
+    end = np.argmax(after,axis=1)
+    head[(position<first[:,None]) | (position>=end[:,None])] = ord(" ")
+    ids = np.fromstring(head.tobytes(),sep=" ")
+    if len(ids)!=len(lines):
+        raise ValueError(f"Expected {len(lines)} particle IDs, found {len(ids)}")
+    return np.unique(ids.astype(np.int64))
+
+
+def event_blocks(file_name:str, chunk_bytes:int=CHUNK_BYTES):
+
+    """
+    Byte blocks of complete <event>s of an LHE file, gzipped or not, read
+    chunk_bytes of the file at a time
+    """
+
+    opener = gzip.open if file_name.endswith(".gz") else open
+    with opener(file_name,"rb") as file:
+        rest = b""
+        while True:
+            data = file.read(chunk_bytes)
+            block = rest+data
+            end = block.rfind(b"</event>")
+            if end>=0:
+                end += len(b"</event>")
+                rest = block[end:]
+                yield block[:end]
+            else:
+                rest = block
+            if not data:
+                break
+
+
+def iterate_lhe(file_name:str, step_size:int=None, chunk_bytes:int=CHUNK_BYTES):
+
+    """
+    Event arrays of step_size events (all events at once without it) of an
+    LHE file, gzipped or not, parsed with parse_block from chunk_bytes of
+    the file at a time
+    """
+
+    pending, n_pending = [], 0
+    for block in event_blocks(file_name,chunk_bytes):
+        events = parse_block(block)
+        pending.append(events)
+        n_pending += len(events)
+        while step_size and n_pending>=step_size:
+            events = ak.concatenate(pending) if len(pending)>1 else pending[0]
+            yield events[:step_size]
+            pending, n_pending = [events[step_size:]], n_pending-step_size
+    if n_pending:
+        yield ak.concatenate(pending) if len(pending)>1 else pending[0]
+
+
+def scan_ids(file_name:str, chunk_bytes:int=CHUNK_BYTES):
+
+    """
+    Distinct particle IDs of a whole LHE file, see block_ids
+    """
+
+    ids = [block_ids(block) for block in event_blocks(file_name,chunk_bytes)]
+    return np.unique(np.concatenate(ids)) if ids else np.zeros(0,dtype=np.int64)
+
+
+def event_ranges(file_name:str, n_ranges:int, chunk_bytes:int=1<<20):
+
+    """
+    (start, stop) byte ranges splitting an uncompressed LHE file into about
+    n_ranges parts of similar size, each ending just after a </event> so that
+    every range holds whole events. The header belongs to the first range and
+    the closing tag to the last.
+    """
+
+    size = os.path.getsize(file_name)
+    bounds = [0]
+    with open(file_name,"rb") as file:
+        for i in range(1,n_ranges):
+            position = max(size*i//n_ranges,bounds[-1])
+            file.seek(position)
+            # Keep the tag's length minus one from the previous read in case
+            # </event> straddles two reads
+            tail = b""
+            while True:
+                data = file.read(chunk_bytes)
+                block = tail+data
+                end = block.find(b"</event>")
+                if end>=0 or not data:
+                    break
+                tail = block[-len(b"</event>")+1:]
+                position += len(block)-len(tail)
+            if end<0:
+                break
+            bounds.append(position+end+len(b"</event>"))
+    bounds.append(size)
+    return [(a,b) for a,b in zip(bounds[:-1],bounds[1:]) if b>a]
+
+
+def parse_range(file_name:str, start:int=None, stop:int=None):
+
+    """
+    Event array of the events between the start and stop bytes of an
+    uncompressed LHE file (see event_ranges), or of the whole file, gzipped or
+    not, without a range. None if there are no events.
+    """
+
+    if start is None:
+        return next(iterate_lhe(file_name),None)
+    with open(file_name,"rb") as file:
+        file.seek(start)
+        block = file.read(stop-start)
+    end = block.rfind(b"</event>")
+    return parse_block(block[:end+len(b"</event>")]) if end>=0 else None
+
+
 class LHEparse:
 
     """
@@ -12,7 +228,20 @@ class LHEparse:
     Particles are identified by the pdgid number as defined in the class
     dictionary PDGID
     Args:
-    - 
+    - file_name : LHE file, optionally gzipped
+    - step_size : events per batch. If given the file is streamed in batches
+                  (see iterate) instead of being read at once.
+    - fast      : parse with the NumPy tokenizer (parse_block) instead of
+                  pylhe's per-event objects. The event arrays are the same
+                  apart from the weights field (the <rwgt> weights), which
+                  they do not have. Use fast=False to read the weights.
+    - array     : event array which was already parsed (e.g. in parallel by
+                  lhe2root.py), file_name then only labels it
+    - species   : PDG IDs or names (values of PDGID) of the species to write.
+                  Without it, the species found in the file: when streaming
+                  the file is scanned for its particle IDs first (see
+                  scan_ids), so that the batches have the same fields as the
+                  whole file read at once.
     """
       
     PDGID = {
@@ -44,27 +273,139 @@ class LHEparse:
     }
 
 
-    def __init__(self , file_name:str):
+    def __init__(self , file_name:str, step_size:int=None, fast:bool=True, array=None, species:list=None):
         self.file_name      = file_name
+        self.step_size      = step_size
+        self.fast           = fast
+        self.species        = None if species is None else self.select_species(species)
+        if array is not None:
+            self.array      = array
+            return
         print(f"Parsing LHE file {self.file_name}")
-        self.array            =  pylhe.to_awkward(pylhe.read_lhe_with_attributes(self.file_name))
+        self.array            =  None if step_size else next(self.batches(),None)
+        if self.array is None and not step_size:
+            raise ValueError(f"No events in {self.file_name}")
+
+
+    @staticmethod
+    def read_events(file_name:str):
+
+        """
+        Event iterator of pylhe, read_lhe_with_attributes was replaced by
+        LHEFile in pylhe 1.0
+        """
+
+        if hasattr(pylhe,"read_lhe_with_attributes"):
+            return pylhe.read_lhe_with_attributes(file_name)
+        return pylhe.LHEFile.fromfile(file_name).events
+
+
+    @classmethod
+    def select_species(cls, species:list):
+
+        """
+        PDGID entries of the given PDG IDs or particle names, in PDGID order
+        """
+
+        wanted   = set(species)
+        selected = {k:v for k,v in cls.PDGID.items() if k in wanted or v in wanted}
+        unknown  = [s for s in species if s not in selected and s not in selected.values()]
+        if unknown:
+            raise ValueError(f"Unknown species {unknown}, see LHEparse.PDGID")
+        return selected
+
+
+    def scan_species(self):
+
+        """
+        PDGID entries of the particle IDs in the whole file, found by a pass
+        which only converts the IDs (see scan_ids)
+        """
+
+        print(f"Scanning {self.file_name} for particle species")
+        ids = set(scan_ids(self.file_name).tolist())
+        return {k:v for k,v in self.PDGID.items() if k in ids}
+
+
+    def batches(self):
+
+        """
+        Event arrays of step_size events, or of the whole file without a
+        step size
+        """
+
+        if self.fast:
+            yield from iterate_lhe(self.file_name,self.step_size)
+            return
+        events = iter(self.read_events(self.file_name))
+        while True:
+            batch = list(islice(events,self.step_size))
+            if not batch:
+                break
+            yield pylhe.to_awkward(batch)
+
+
+    def iterate(self):
+
+        """
+        Streams the file in batches of step_size events, building each batch
+        (see build) and yielding its Event array. Every batch has the fields
+        of the given species, or of all species in the file, which is scanned
+        for them first.
+        """
 
+        species = self.species if self.species is not None else self.scan_species()
+        for self.array in self.batches():
+            self.build(species)
+            yield self.arr
 
-    def build(self):
+
+    def build(self, species:dict=None):
         
         """
         Builds a flat awkward event array indexed by the particles names, 
             as given by the values of the PDGID dict.
         Supplemental composite fields for combined quark- and lepton-types.
+        With species (by default the ones given to the class), only those
+        PDGIDs are kept (with empty lists for events without them) instead of
+        the ones found in the array.
         """
         
+        # Position of each particle's ID in the sorted PDGID keys, -1 for
+        # IDs which are not in PDGID
+        particles = self.array.particles
+        flat      = ak.flatten(particles)
+        ids       = ak.to_numpy(flat.id)
+        keys      = np.array(sorted(self.PDGID))
+        position  = np.minimum(np.searchsorted(keys,ids),len(keys)-1)
+        position  = np.where(keys[position]==ids,position,-1)
+
+        species = self.species if species is None else species
+
         # Parse only the PDGIDs which exist in the imported array
-        unique_keys    = np.unique(ak.concatenate(self.array.particles.id).to_numpy())
-        self.PDGID_filtered = {k:v for k,v in self.PDGID.items() if k in unique_keys}
-        
+        unique_keys    = keys[np.bincount(position[position>=0],minlength=len(keys))>0].tolist()
+        if species is None:
+            self.PDGID_filtered = {k:v for k,v in self.PDGID.items() if k in unique_keys}
+        else:
+            self.PDGID_filtered = species
+
+        # Group the particles by species in one pass: a stable sort of the
+        # species index (a radix sort for int16 keys) keeps each species in
+        # event order, and the segment offsets give each species' particles
+        # (unselected IDs, and those not in PDGID at index -1, go last)
+        lookup  = {k:i for i,k in enumerate(keys)}
+        index   = np.full(len(keys)+1,len(self.PDGID_filtered),dtype=np.int16)
+        for i,k in enumerate(self.PDGID_filtered):
+            index[lookup[k]] = i
+        group   = index[position]
+        order   = np.argsort(group,kind="stable")
+        offsets = np.concatenate([[0],np.cumsum(np.bincount(group,minlength=len(self.PDGID_filtered)+1))])
+        event   = np.repeat(np.arange(len(particles)),ak.to_numpy(ak.num(particles)))
+
         columns = {}
-        for k,v in self.PDGID_filtered.items():
-            columns[v] = self.array.particles[self.array.particles.id==k]
+        for i,v in enumerate(self.PDGID_filtered.values()):
+            selected   = order[offsets[i]:offsets[i+1]]
+            columns[v] = ak.unflatten(flat[selected],np.bincount(event[selected],minlength=len(particles)))
             
         # columns["up_type_quarks"]        = ak.concatenate([columns["up"],columns["charm"],columns["top"]],axis=1)
         # columns["anti_up_type_quarks"]   = ak.concatenate([columns["anti_up"],columns["anti_charm"],columns["anti_top"]],axis=1)
@@ -78,7 +419,7 @@ class LHEparse:
         self.arr =  ak.zip(columns, depth_limit=1, with_name="Event")
     
     
-    def write_kinematics_to_ROOT(self,outfile,outtree_name):
+    def kinematics(self):
         
         outtree = {}
         for key in self.PDGID_filtered.values():
@@ -87,8 +428,25 @@ class LHEparse:
             outtree[f'{key}_eta'] = a.eta
             outtree[f'{key}_phi'] = a.phi
             outtree[f'{key}_e']   = a.e
+        return outtree
+    
+    
+    def write_kinematics_to_ROOT(self,outfile,outtree_name):
+
+        """
+        Writes the pt, eta, phi and energy of each species. When streaming,
+        each batch is built and appended to the tree in turn, so that only
+        one batch is in memory.
+        """
         
         with uproot.recreate(outfile) as f:
-            f[outtree_name] = outtree
+            if self.step_size is None:
+                f[outtree_name] = self.kinematics()
+                return
+            for _ in self.iterate():
+                if outtree_name in f:
+                    f[outtree_name].extend(self.kinematics())
+                else:
+                    f[outtree_name] = self.kinematics()
             
         
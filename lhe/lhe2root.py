@@ -1,14 +1,104 @@
-import sys
-from LHEclass import LHEparse
-
-def main(input_lhe,output_root,outtree_name):
-    
-    P = LHEparse(input_lhe)
-    P.build()
-    P.write_kinematics_to_ROOT(output_root,outtree_name)    
-    
+"""
+Writes the pt, eta, phi and energy of each particle species of an LHE file to
+a ROOT tree, e.g.
+
+    python lhe2root.py <events.lhe.gz> <output.root> [tree] [step size]
+
+With -j the events are parsed on a pool of processes: an uncompressed file is
+split into byte ranges on </event> boundaries, and a directory or quoted glob
+of files, e.g. of the unweighted_events_$(Cluster)_$(Process).lhe.gz outputs
+of a production, is spread over the pool file by file. The parsed events are
+concatenated in file and event order, e.g.
+
+    python lhe2root.py "run/unweighted_events_*.lhe.gz" <output.root> -j 16
+"""
+
+import os
+import re
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import awkward as ak
+
+from LHEclass import LHEparse, event_ranges, parse_range
+
+# Byte ranges per worker for uncompressed files, so that the pool stays busy
+# when some ranges parse faster than others
+RANGES_PER_WORKER = 4
+
+
+def natural_key(path:str):
+
+    """
+    Sort key ordering the numbers in a path by value, so that
+    unweighted_events_1_2 comes before unweighted_events_1_10
+    """
+
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)",path)]
+
+
+def lhe_files(input_lhe:str):
+
+    """
+    LHE files of a file, a directory or a glob, in natural order
+    """
+
+    if os.path.isdir(input_lhe):
+        files = glob.glob(os.path.join(input_lhe,"*.lhe"))+glob.glob(os.path.join(input_lhe,"*.lhe.gz"))
+    else:
+        files = glob.glob(input_lhe) or [input_lhe]
+    return sorted(files,key=natural_key)
+
+
+def parallel_parse(files:list, workers:int):
+
+    """
+    Event array of all files, parsed on workers processes. Gzipped files are
+    parsed one per task, uncompressed files in byte ranges.
+    """
+
+    tasks = []
+    for f in files:
+        if f.endswith(".gz"):
+            tasks.append((f,None,None))
+        else:
+            tasks.extend((f,start,stop) for start,stop in event_ranges(f,workers*RANGES_PER_WORKER))
+
+    print(f"Parsing {len(files)} LHE files in {len(tasks)} parts on {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map returns the parts in task order, hence in event order
+        parts = [p for p in pool.map(parse_range,*zip(*tasks)) if p is not None and len(p)]
+    if not parts:
+        raise ValueError(f"No events in {', '.join(files)}")
+    return ak.concatenate(parts) if len(parts)>1 else parts[0]
+
+
+def main(input_lhe,output_root,outtree_name,step_size=None,workers=None,species=None,fast=True):
+
+    if workers:
+        files = lhe_files(input_lhe)
+        P = LHEparse(input_lhe,array=parallel_parse(files,workers),species=species)
+    else:
+        P = LHEparse(input_lhe,step_size,fast=fast,species=species)
+    # Streamed files are built batch by batch while writing
+    if P.step_size is None:
+        P.build()
+    P.write_kinematics_to_ROOT(output_root,outtree_name)
+
 if __name__ == "__main__":
-    input_lhe    = sys.argv[1]
-    output_root  = sys.argv[2]
-    outtree_name = sys.argv[3] if sys.argv[3] else "tree"
-    main(input_lhe,output_root,outtree_name)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Write the kinematics of the particles of LHE files to a ROOT tree")
+    parser.add_argument("input_lhe", type=str, help="LHE file, optionally gzipped. With -j also a directory or a quoted glob of files")
+    parser.add_argument("output_root", type=str)
+    parser.add_argument("outtree_name", type=str, nargs="?", default="tree")
+    parser.add_argument("step_size", type=int, nargs="?", default=None, help="Stream the file in batches of this many events")
+    parser.add_argument("-j","--workers", type=int, default=None, help="Parse on this many processes")
+    parser.add_argument("--species", type=str, nargs="+", default=None, help="PDG IDs or names of the species to write, defaults to all in the file")
+    parser.add_argument("--pylhe", action="store_true", help="Parse with pylhe instead of the NumPy tokenizer, e.g. to check its output")
+    args = parser.parse_args()
+    if args.workers and args.step_size:
+        parser.error("a step size streams the file on one process, it cannot be combined with -j")
+    if args.workers and args.pylhe:
+        parser.error("-j parses with the NumPy tokenizer, it cannot be combined with --pylhe")
+    species = [float(s) if s.lstrip("-").isdigit() else s for s in args.species] if args.species else None
+    main(args.input_lhe,args.output_root,args.outtree_name,args.step_size,args.workers,species,not args.pylhe)
@@ -0,0 +1,15 @@
+import pytest
+
+from tools.synthetic_delphes import generate
+
+
+@pytest.fixture(scope="session")
+def delphes_file(tmp_path_factory):
+
+    """
+    Small synthetic 4-top Delphes file shared by the tests
+    """
+
+    path = tmp_path_factory.mktemp("delphes")/"delphes_4tops.root"
+    generate(str(path),200,"4tops",seed=1,chunk_size=100)
+    return str(path)
@@ -0,0 +1,70 @@
+import awkward as ak
+import pytest
+
+from delphes.ancestry import AncestryIndex
+
+# One event: beams 0 and 1, gluons 2 and 3, a 2 -> 2 process (4, 5), two
+# string partons (6, 7) and a string end (8), a hadron from the string 6..8,
+# a particle with mothers 2 and 5 (not adjacent) and one with M2 < M1
+PARTICLES = {"PID"   : [2212,2212,21,21,6,-6,2,21,-2,211,22,21],
+             "Status": [4,4,21,21,22,22,71,71,71,83,23,43],
+             "M1"    : [-1,-1,0,1,2,2,4,5,5,6,2,5],
+             "M2"    : [-1,-1,-1,-1,3,3,-1,-1,-1,8,5,2],
+             "D1"    : [2,3,4,4,6,7,9,9,9,-1,-1,-1],
+             "D2"    : [-1,-1,5,5,-1,4,-1,-1,-1,-1,-1,-1]}
+
+
+def events(n_events:int=2):
+    return {f"Particle.{k}": ak.Array([v]*n_events) for k,v in PARTICLES.items()}
+
+
+def parents(index, particle:int, event:int=1):
+    offset = index.offsets[event]
+    ptr, idx = index.parent_ptr, index.parents
+    return sorted((idx[ptr[offset+particle]:ptr[offset+particle+1]]-offset).tolist())
+
+
+def children(index, particle:int, event:int=1):
+    offset = index.offsets[event]
+    ptr, idx = index.children
+    return sorted((idx[ptr[offset+particle]:ptr[offset+particle+1]]-offset).tolist())
+
+
+def test_pair_mothers():
+    index = AncestryIndex(events())
+    assert parents(index,4)==[2,3]
+    assert parents(index,9)==[6,8]
+    assert parents(index,10)==[2,5]
+    assert parents(index,11)==[2,5]
+    assert parents(index,0)==[]
+
+
+def test_range_mothers():
+    index = AncestryIndex(events(),mothers="range")
+    assert parents(index,9)==[6,7,8]
+    assert parents(index,10)==[2,3,4,5]
+    # M2 < M1 is still two mothers
+    assert parents(index,11)==[2,5]
+
+
+def test_pythia_mothers():
+    index = AncestryIndex(events(),mothers="pythia")
+    # Only the string fragmentation status reads M1..M2 as a range
+    assert parents(index,9)==[6,7,8]
+    assert parents(index,10)==[2,5]
+    assert parents(index,11)==[2,5]
+    # The hadron reaches the gluon 7 inside its string, which pair misses
+    assert index.has_ancestor([21],generations=1)[1].tolist()==[False]*4+[True,True]+[False]*3+[True,True,True]
+    assert not AncestryIndex(events()).has_ancestor([21],generations=1)[1][9]
+    with pytest.raises(ValueError):
+        AncestryIndex(events(),mothers="both")
+
+
+def test_daughters():
+    index = AncestryIndex(events())
+    # D1..D2 range, a single daughter, and two separate daughters with D2 < D1
+    assert children(index,2)==[4,5]
+    assert children(index,6)==[9]
+    assert children(index,5)==[4,7]
+    assert children(index,0)==[2]
+    assert children(index,9)==[]
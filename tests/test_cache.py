@@ -0,0 +1,102 @@
+import os
+import multiprocessing
+
+import numpy as np
+import awkward as ak
+
+from delphes.cache import ParseCache, file_identity
+
+
+def write_entry(cache, key:str, n:int=1000):
+    with cache.store(key) as store:
+        store.write(Truth={"x":ak.Array(np.arange(n))},Reco={"y":ak.Array(np.arange(n))})
+
+
+def test_identity_covers_the_whole_file(tmp_path):
+
+    """
+    Changing bytes in the middle of an input without changing its size gives
+    another key, also when the hash of the old content is remembered
+    """
+
+    inname = tmp_path/"input.root"
+    inname.write_bytes(bytes(8<<20))
+    cache = ParseCache(str(tmp_path/"cache"))
+    key = cache.key(str(inname),1)
+    assert cache.key(str(inname),1)==key
+
+    with open(inname,"r+b") as f:
+        f.seek(4<<20)
+        f.write(b"changed")
+    os.utime(inname,ns=(os.stat(inname).st_atime_ns,os.stat(inname).st_mtime_ns+1))
+    assert cache.key(str(inname),1)!=key
+    assert file_identity(str(inname))["size"]==8<<20
+
+
+def _evict(directory:str, queue):
+    queue.put(ParseCache(directory,max_bytes=0).evict())
+
+
+def test_no_eviction_while_in_use(tmp_path):
+    cache = ParseCache(str(tmp_path/"cache"),max_bytes=0)
+    write_entry(cache,"a")
+    # Storing no longer evicts by itself
+    assert cache.get("a") is not None
+
+    queue = multiprocessing.Queue()
+    with cache.using():
+        process = multiprocessing.Process(target=_evict,args=(cache.directory,queue))
+        process.start()
+        process.join()
+        assert queue.get() is False
+        chunks = list(cache.read(cache.get("a")))
+    assert ak.array_equal(chunks[0][0]["x"],np.arange(1000))
+
+    assert cache.evict() is True
+    assert cache.get("a") is None
+
+
+def test_failed_store_leaves_no_temporary_directory(tmp_path):
+
+    """
+    A store which is created but never entered, e.g. because the output
+    writer opened before it failed, writes nothing to the cache
+    """
+
+    cache = ParseCache(str(tmp_path/"cache"))
+    store = cache.store("a")
+    try:
+        with open(tmp_path/"missing"/"output.root") as f, store:
+            pass
+    except OSError:
+        pass
+    assert os.listdir(cache.directory)==[]
+
+    try:
+        with cache.store("a") as store:
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert os.listdir(cache.directory)==[]
+
+
+def test_identities_are_evicted_with_the_entries(tmp_path):
+    cache = ParseCache(str(tmp_path/"cache"),max_bytes=0)
+    memos = []
+    for age,name in [(30,"old"),(20,"new")]:
+        inname = tmp_path/f"{name}.root"
+        inname.write_bytes(name.encode())
+        key = cache.key(str(inname),1)
+        write_entry(cache,key)
+        memos.append(*set(os.listdir(cache.memo_dir()))-set(memos))
+        os.utime(cache.path(key),(0,os.path.getmtime(cache.path(key))-age))
+        os.utime(os.path.join(cache.memo_dir(),memos[-1]),(0,os.path.getmtime(cache.path(key))-1))
+
+    # The old entry is removed, and with it the memo not used since
+    cache.max_bytes = cache.size()-1
+    assert cache.evict() is True
+    assert len(cache.entries())==1
+    assert os.listdir(cache.memo_dir())==memos[1:]
+
+    cache.clear()
+    assert cache.entries()==[] and not os.path.exists(cache.memo_dir())
@@ -0,0 +1,91 @@
+import shutil
+
+import uproot
+import numpy as np
+import awkward as ak
+import pytest
+
+from delphes import batch
+from delphes.event_index import EventIndex, SOURCE, NUMBER_BITS, align
+
+
+def tree(numbers, sources=None):
+    arrays = {"EventNumber": ak.Array([[n] for n in numbers]),
+              "x": ak.Array(np.arange(len(numbers)))}
+    if sources is not None:
+        arrays[SOURCE] = np.asarray(sources,dtype=np.int32)
+    return arrays
+
+
+def test_aligned_trees_are_returned_as_they_are():
+    reco, truth = tree([0,1,2,3]), tree([0,1,2,3])
+    left, right = align(reco,truth)
+    assert left is reco and right is truth
+
+
+def test_filtered_truth_and_reco():
+
+    """
+    Events cut from either side are dropped, the rest keep the order of left
+    """
+
+    reco, truth = tree([4,0,2,3,5]), tree([0,1,2,3,4])
+    left, right = align(reco,truth)
+    assert ak.to_list(ak.firsts(left["EventNumber"]))==[4,0,2,3]
+    assert ak.to_list(ak.firsts(right["EventNumber"]))==[4,0,2,3]
+    assert ak.to_list(right["x"])==[4,0,2,3]
+
+
+def test_duplicates_across_shards():
+
+    """
+    Every shard numbers its events from 0, the Source column tells them apart
+    """
+
+    reco  = tree([0,1,2,0,2,3],[0,0,0,1,1,1])
+    truth = tree([0,2,0,1,2],[0,0,1,1,1])
+    left, right = align(reco,truth)
+    assert ak.to_list(left["x"])==[0,2,3,4]
+    assert ak.to_list(right["x"])==[0,1,2,4]
+    assert np.array_equal(left[SOURCE],right[SOURCE])
+
+    # Without the Source column the join is ambiguous
+    with pytest.raises(ValueError):
+        align(tree([0,1,2,0,2,3]),tree([0,2,0,1,2]))
+
+
+def test_lookup():
+    index = EventIndex(ak.Array([[7],[3],[5]]),np.array([1,0,1]))
+    assert index.unique
+    assert index.lookup([(1<<NUMBER_BITS)|5,7,3]).tolist()==[2,-1,1]
+
+
+@pytest.mark.parametrize("backend",["root","parquet"])
+def test_merged_shards(tmp_path, delphes_file, backend):
+
+    """
+    Two copies of the same file have the same event numbers, the merged trees
+    still align on (Source, EventNumber) after a cut on Reco
+    """
+
+    inputs = [str(tmp_path/f"delphes_{i}.root") for i in range(2)]
+    for inname in inputs:
+        shutil.copy(delphes_file,inname)
+    merged = str(tmp_path/"merged")
+    assert batch.run("4tops",inputs,str(tmp_path/"out"),merge=merged,workers=2,output={"backend":backend})=={}
+
+    if backend=="parquet":
+        truth = {k: ak.from_parquet(f"{merged}/Truth")[k] for k in ["EventNumber",SOURCE]}
+        reco  = {k: ak.from_parquet(f"{merged}/Reco")[k] for k in ["EventNumber",SOURCE]}
+    else:
+        with uproot.open(merged) as f:
+            truth = f["Truth"].arrays(["EventNumber",SOURCE],how=dict)
+            reco  = f["Reco"].arrays(["EventNumber",SOURCE],how=dict)
+    assert ak.to_list(truth[SOURCE])==[0]*200+[1]*200
+
+    cut = np.arange(400)%3!=0
+    reco = {k: v[cut] for k,v in reco.items()}
+    left, right = align(reco,truth)
+    assert len(left[SOURCE])==cut.sum()
+    assert ak.to_list(left[SOURCE])==ak.to_list(right[SOURCE])
+    assert ak.to_list(left["EventNumber"])==ak.to_list(right["EventNumber"])
@@ -0,0 +1,75 @@
+import os
+import sys
+import glob
+import subprocess
+
+import uproot
+import numpy as np
+
+from condor.harvest import harvest, read_submit, write_resubmit, output_templates
+from condor.local import expand, item_values, _event
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """run: {auto-launch: true, shower: true}
+gen:
+  block_model: {save_dir: fourtops, order: lo}
+  block_delphes: {}
+"""
+
+
+def generate(workdir, n_jobs:int):
+
+    """
+    Run directory of condor.generate for a minimal config, without bundle
+    or resource profile
+    """
+
+    os.makedirs(workdir/"MadLAD"/"processes")
+    (workdir/"MadLAD"/"processes"/"test.yaml").write_text(CONFIG)
+    subprocess.run([sys.executable,"-m","condor.generate","--config","test.yaml","--Njobs",str(n_jobs),
+                    "--no-bundle","--no-profile","--seed-ledger",str(workdir/"seeds.json")],
+                   cwd=workdir,env={**os.environ,"PYTHONPATH":REPO},check=True,capture_output=True)
+    return glob.glob(str(workdir/"fourtops_condorrun_*"))[0]
+
+
+def run_job(directory, submit, cluster:int, process:int, macros:dict, returncode:int):
+
+    """
+    Writes what HTCondor leaves for one process of submit: its job log events
+    and, if it succeeded, its remapped outputs
+    """
+
+    settings = read_submit(os.path.join(directory,submit))
+    macros = {"cluster":cluster,"clusterid":cluster,"process":process,"procid":process,**macros}
+    with open(os.path.join(directory,expand(settings["log"],macros)),"a") as log:
+        log.write(_event("000",cluster,process,"Job submitted from host: <test>"))
+        log.write(_event("001",cluster,process,"Job executing on host: <test>"))
+        log.write(_event("005",cluster,process,"Job terminated.",f"\t(1) Normal termination (return value {returncode})\n"))
+    if returncode==0:
+        for template in output_templates(settings):
+            with uproot.recreate(os.path.join(directory,expand(template,macros))) as file:
+                file.mktree("Delphes",{"x":np.int64}).extend({"x":np.arange(10)})
+
+
+def test_resubmit_round_trip(tmp_path):
+    directory = generate(tmp_path,3)
+    for process in range(3):
+        run_job(directory,"submit.sub",40,process,{},1 if process==2 else 0)
+
+    jobs = harvest(directory,"submit.sub")
+    assert [jobs[p]["status"] for p in range(3)]==["done","done","failed"]
+
+    resubmit = write_resubmit(directory,"submit.sub",[2])
+    settings = read_submit(os.path.join(directory,resubmit))
+    assert "$(Cluster)" not in settings["transfer_output_remaps"] and "40" in settings["transfer_output_remaps"]
+    assert settings["queue_items"]==["2"]
+
+    # The resubmission runs as cluster 41 and keeps the names of cluster 40
+    run_job(directory,resubmit,41,0,item_values(settings["queue_variables"],settings["queue_items"][0]),0)
+    assert os.path.isfile(os.path.join(directory,"delphes_40_2.root"))
+    assert not glob.glob(os.path.join(directory,"*41*"))
+
+    jobs = harvest(directory,"submit.sub")
+    assert [jobs[p]["status"] for p in range(3)]==["done","done","done"]
+    assert jobs[2]["cluster"]==41 and jobs[2]["events"]==10
@@ -0,0 +1,173 @@
+import os
+import sys
+
+import numpy as np
+import pylhe
+import pytest
+import uproot
+import awkward as ak
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"lhe"))
+from LHEclass import LHEparse, parse_block, scan_ids, event_ranges, parse_range
+from lhe2root import lhe_files, natural_key
+
+HEADER = '<LesHouchesEvents version="3.0">\n<header>\n</header>\n<init>\n2212 2212 6.5e+03 6.5e+03 0 0 260000 260000 -4 1\n</init>\n'
+PARTICLE = "{:>9d} {:2d} 0 0 0 0 {:+.10e} {:+.10e} {:+.10e} {:.10e} 0.0 0.0 9.0\n"
+
+
+def write_lhe(path, events:list):
+
+    """
+    Writes events, each a list of particle IDs with made up momenta
+    """
+
+    rng = np.random.default_rng(2)
+    with open(path,"w") as f:
+        f.write(HEADER)
+        for ids in events:
+            f.write(f"<event>\n{len(ids)} 1 +1.0e+00 1.0e+02 7.5e-03 1.2e-01\n")
+            for pid in ids:
+                px, py, pz = rng.normal(0,50,3)
+                f.write(PARTICLE.format(pid,1,px,py,pz,np.sqrt(px**2+py**2+pz**2+1)))
+            f.write("</event>\n")
+        f.write("</LesHouchesEvents>\n")
+    return str(path)
+
+
+def read_tree(path):
+    return uproot.open(f"{path}:tree").arrays(library="ak")
+
+
+def test_streaming_keeps_late_species(tmp_path):
+
+    """
+    A species which only appears after the first batch is written when
+    streaming, as it is when the file is read at once
+    """
+
+    events = [[21,21,6,-6]]*5+[[21,21,6,-6,22]]
+    inname = write_lhe(tmp_path/"late.lhe",events)
+
+    whole = LHEparse(inname)
+    whole.build()
+    whole.write_kinematics_to_ROOT(str(tmp_path/"whole.root"),"tree")
+    LHEparse(inname,step_size=2).write_kinematics_to_ROOT(str(tmp_path/"stream.root"),"tree")
+
+    a, b = read_tree(tmp_path/"whole.root"), read_tree(tmp_path/"stream.root")
+    assert a.fields==b.fields and "photon_pt" in b.fields
+    assert all(ak.array_equal(a[f],b[f]) for f in a.fields)
+    assert ak.num(b["photon_pt"]).tolist()==[0,0,0,0,0,1]
+
+
+def test_explicit_species(tmp_path):
+    inname = write_lhe(tmp_path/"late.lhe",[[21,21,6,-6]]*3+[[21,21,6,-6,22]])
+    P = LHEparse(inname,step_size=2,species=["top",-6,22])
+    P.write_kinematics_to_ROOT(str(tmp_path/"stream.root"),"tree")
+    assert P.PDGID_filtered=={6.0:"top",-6.0:"anti_top",22.0:"photon"}
+    assert set(read_tree(tmp_path/"stream.root").fields)=={f"{s}_{v}" for s in ("top","anti_top","photon") for v in ("pt","eta","phi","e")}
+
+
+def test_scan_ids(tmp_path):
+    events = [[21,21,6,-6,5,-11,12],[2,-2,1000022,25]]
+    inname = write_lhe(tmp_path/"ids.lhe",events)
+    with open(inname,"rb") as f:
+        block = f.read()
+    assert scan_ids(inname,chunk_bytes=64).tolist()==sorted({i for e in events for i in e})
+    assert np.unique(ak.flatten(parse_block(block).particles.id)).tolist()==scan_ids(inname).tolist()
+
+
+# Two events with the comment lines, <mgrwt> and <rwgt> blocks MadGraph writes
+# after the particles
+REWEIGHTED = """<LesHouchesEvents version="3.0">
+<header>
+<initrwgt>
+<weightgroup name="scale" combine="envelope">
+<weight id="1"> mur=1.0 </weight>
+<weight id="2"> mur=2.0 </weight>
+</weightgroup>
+</initrwgt>
+</header>
+<init>
+2212 2212 6.5e+03 6.5e+03 0 0 260000 260000 -4 1
+5.0e+01 1.0e+00 5.0e+01 1
+</init>
+<event>
+ 3 1 +1.0e+00 1.0e+02 7.5e-03 1.2e-01
+       21 -1 0 0 501 502 +0.0e+00 +0.0e+00 +1.0e+03 1.0e+03 0.0 0.0 9.0
+        6  1 1 1 501 0 +1.0e+01 -2.0e+01 +3.0e+02 4.0e+02 1.73e+02 0.0 -1.0
+       -6  1 1 1 0 502 -1.0e+01 +2.0e+01 -3.0e+02 4.0e+02 1.73e+02 0.0 1.0
+#aMCatNLO 2 5 3 3 1 0.1 0.2 0 0 0
+<mgrwt>
+<rscale>  2 0.1E+03</rscale>
+<asrwt>0</asrwt>
+<pdfrwt beam="1">  1       21 0.1E+00 0.1E+03</pdfrwt>
+<pdfrwt beam="2">  1       21 0.1E+00 0.1E+03</pdfrwt>
+<totfact> 0.1E+00</totfact>
+</mgrwt>
+<rwgt>
+<wgt id='1'> +1.0e+00 </wgt>
+<wgt id='2'> +9.0e-01 </wgt>
+</rwgt>
+</event>
+<event>
+ 2 2 -2.0e+00 2.0e+02 7.5e-03 1.1e-01
+       22 -1 0 0 0 0 +0.0e+00 +0.0e+00 +5.0e+02 5.0e+02 0.0 0.0 9.0
+       25  2 1 0 0 0 +0.0e+00 +0.0e+00 +5.0e+02 5.0e+02 1.25e+02 0.0 9.0
+# a comment
+<rwgt>
+<wgt id='1'> -2.0e+00 </wgt>
+<wgt id='2'> -1.8e+00 </wgt>
+</rwgt>
+</event>
+</LesHouchesEvents>
+"""
+
+
+def test_parse_block_matches_pylhe(tmp_path):
+    inname = tmp_path/"reweighted.lhe"
+    inname.write_text(REWEIGHTED)
+    expected = pylhe.to_awkward(LHEparse.read_events(str(inname)))
+    events = parse_block(inname.read_bytes())
+
+    assert "weights" in expected.fields and "weights" not in events.fields
+    for record in ["eventinfo","particles"]:
+        assert expected[record].fields==events[record].fields
+        for field in expected[record].fields:
+            assert ak.array_equal(expected[record][field],events[record][field])
+            assert expected[record][field].type==events[record][field].type
+
+    assert "weights" in LHEparse(str(inname),fast=False).array.fields
+
+
+def test_no_events(tmp_path):
+    inname = write_lhe(tmp_path/"empty.lhe",[])
+    with pytest.raises(ValueError,match="No events"):
+        LHEparse(inname)
+
+
+@pytest.mark.parametrize("n_ranges",[1,2,3,7,50])
+def test_event_ranges(tmp_path, n_ranges):
+
+    """
+    The ranges cover every event once, also when they are found in chunks
+    smaller than a line
+    """
+
+    events = [[21,21,6,-6]]*9+[[21,21,6,-6,22]]*4
+    inname = write_lhe(tmp_path/"ranges.lhe",events)
+    ranges = event_ranges(inname,n_ranges,chunk_bytes=5)
+    assert len(ranges)<=n_ranges
+    parts = [p for p in (parse_range(inname,a,b) for a,b in ranges) if p is not None]
+    assert sum(len(p) for p in parts)==len(events)
+    assert ak.array_equal(ak.concatenate(parts),parse_range(inname))
+
+
+def test_file_order(tmp_path):
+    names = ["unweighted_events_1_10.lhe.gz","unweighted_events_1_2.lhe","unweighted_events_2_0.lhe.gz","unweighted_events_1_0.lhe"]
+    for name in names:
+        (tmp_path/name).write_text("")
+    expected = [str(tmp_path/n) for n in ["unweighted_events_1_0.lhe","unweighted_events_1_2.lhe",
+                                           "unweighted_events_1_10.lhe.gz","unweighted_events_2_0.lhe.gz"]]
+    assert lhe_files(str(tmp_path))==expected
+    assert lhe_files(str(tmp_path/"unweighted_events_1_*"))==expected[:3]
+    assert sorted(["run_10","run_9","run_1"],key=natural_key)==["run_1","run_9","run_10"]
@@ -0,0 +1,71 @@
+import numpy as np
+import awkward as ak
+import vector
+
+from delphes.matching import match_deltaR, deltaR_matrix
+
+vector.register_awkward()
+
+
+def objects(etas:list):
+
+    """
+    Momentum4D objects with the given eta per event and phi 0
+    """
+
+    counts = [len(e) for e in etas]
+    eta = np.array([x for e in etas for x in e],dtype=float)
+    flat = ak.zip({"pt":np.ones_like(eta),"eta":eta,"phi":np.zeros_like(eta),"mass":np.zeros_like(eta)},with_name="Momentum4D")
+    return ak.unflatten(flat,counts)
+
+
+def test_match():
+    a = objects([[0.,1.],[2.]])
+    b = objects([[1.1,0.1],[0.,2.2]])
+    index, best = match_deltaR(a,b)
+    assert index.tolist()==[[1,0],[1]]
+    assert np.allclose(ak.flatten(best),[0.1,0.1,0.2])
+
+
+def test_shared_nearest_candidate():
+
+    """
+    Both elements of a are nearest to the first element of b, which goes to
+    the second one since that minimises the summed delta-R
+    """
+
+    a = objects([[0.,0.1],[0.,0.1]])
+    b = objects([[0.08,-0.3],[0.05,1.]])
+    index, best = match_deltaR(a,b)
+    assert index.tolist()==[[1,0],[0,1]]
+    assert np.allclose(ak.flatten(best),[0.3,0.02,0.05,0.9])
+
+
+def test_more_elements_than_candidates():
+
+    """
+    With more elements in a than in b the extra ones are left unmatched
+    """
+
+    a = objects([[0.,1.,2.],[0.,0.1,3.]])
+    b = objects([[2.1,0.2],[0.08]])
+    index, best = match_deltaR(a,b)
+    assert index.tolist()==[[1,None,0],[None,0,None]]
+    assert np.allclose(ak.flatten(ak.drop_none(best)),[0.2,0.1,0.02])
+
+
+def test_no_candidates_in_any_event():
+
+    """
+    A batch in which b is empty in every event leaves all of a unmatched
+    """
+
+    a = objects([[0.,1.],[2.,3.]])
+    b = objects([[],[]])
+    index, best = match_deltaR(a,b)
+    assert index.tolist()==[[None,None],[None,None]]
+    assert best.tolist()==[[None,None],[None,None]]
+    assert deltaR_matrix(a,b).tolist()==[[[],[]],[[],[]]]
+
+    index, best = match_deltaR(b,a)
+    assert index.tolist()==[[],[]] and best.tolist()==[[],[]]
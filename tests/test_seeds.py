@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from condor.seeds import allocate_seeds, load_ledger, MAX_SEED
+
+
+def test_blocks_do_not_overlap(tmp_path):
+    ledger = str(tmp_path/"seeds.json")
+    first = [allocate_seeds(n,f"run{i}",path=ledger) for i,n in enumerate([5,100,1])]
+    assert first==[1,6,106]
+    assert load_ledger(ledger)["next"]==107
+
+
+def test_explicit_seed_overlap_warns(tmp_path):
+    ledger = str(tmp_path/"seeds.json")
+    allocate_seeds(10,"run0",path=ledger)
+    with pytest.warns(UserWarning,match="overlap"):
+        assert allocate_seeds(3,"run1",first=8,path=ledger)==8
+    # Explicit blocks do not move the next free seed
+    assert allocate_seeds(1,"run2",path=ledger)==11
+
+
+def test_wraps_when_exhausted(tmp_path):
+    ledger = tmp_path/"seeds.json"
+    ledger.write_text(json.dumps({"next":MAX_SEED-1,"productions":[]}))
+    with pytest.warns(UserWarning,match="handed out"):
+        assert allocate_seeds(5,"run0",path=str(ledger))==1
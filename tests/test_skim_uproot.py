@@ -0,0 +1,42 @@
+import uproot
+import awkward as ak
+
+from condor.skim_uproot import skim
+
+
+def test_counter_with_members(delphes_file, tmp_path):
+
+    """
+    A requested <collection>_size is written once, as the counter of the
+    grouped members
+    """
+
+    outname = str(tmp_path/"skim.root")
+    assert skim(delphes_file,outname,["Jet.PT","Jet_size"],threads=1)==200
+
+    skimmed = uproot.open(f"{outname}:Delphes")
+    original = uproot.open(f"{delphes_file}:Delphes")
+    assert set(skimmed.keys())=={"Jet_size","Jet.PT"}
+    assert ak.array_equal(skimmed["Jet_size"].array(),original["Jet_size"].array())
+    assert ak.array_equal(skimmed["Jet.PT"].array(),original["Jet.PT"].array())
+
+
+def test_counter_in_cut(delphes_file, tmp_path):
+    outname = str(tmp_path/"skim.root")
+    n_events = skim(delphes_file,outname,["Jet.PT","Jet_size"],threads=1,cuts=["Jet_size >= 4"])
+    jets = uproot.open(f"{outname}:Delphes")["Jet_size"].array()
+    assert len(jets)==n_events and ak.all(jets>=4)
+
+
+def test_several_inputs(delphes_file, tmp_path):
+
+    """
+    The inputs share one thread pool, which stays usable after the first
+    input is closed
+    """
+
+    outname = str(tmp_path/"skim.root")
+    assert skim([delphes_file,delphes_file],outname,["Jet.PT"],threads=2)==400
+    pt = uproot.open(f"{outname}:Delphes")["Jet.PT"].array()
+    original = uproot.open(f"{delphes_file}:Delphes")["Jet.PT"].array()
+    assert ak.array_equal(pt,ak.concatenate([original,original]))
@@ -1,10 +1,21 @@
 import awkward as ak 
-import uproot 
 import numpy as np
 import vector
 import h5py
 import sys
 
+from delphes.reader import ReaderConfig
+from delphes.profiling import Profiler
+from delphes.event_index import align, SOURCE
+
+# Columns read from the parsed Truth and Reco trees
+RECO_COLUMNS  = ["EventNumber",
+                 "jet_pt","jet_eta","jet_phi","jet_mass","jet_btag",
+                 "el_pt","el_eta","el_phi","el_charge",
+                 "mu_pt","mu_eta","mu_phi","mu_charge",
+                 "met_met","met_phi"]
+TRUTH_COLUMNS = ["EventNumber","W_decay_id","W_decay_pt","W_decay_eta","W_decay_phi"]
+
 
 def pad_variable(variable, max_len, pad_to = 0):
     padded_variable = ak.pad_none(variable, int(max_len), axis=1, clip=True)
@@ -17,10 +28,10 @@ def parse_jets(reco,selection):
     Build jet_data object
     """
     
-    jet_vectors = vector.zip({"pt":reco["jet_pt"].array(),
-                          "eta":reco["jet_eta"].array(),
-                          "phi":reco["jet_phi"].array(),
-                          "m":reco["jet_mass"].array()})[selection]
+    jet_vectors = vector.zip({"pt":reco["jet_pt"],
+                          "eta":reco["jet_eta"],
+                          "phi":reco["jet_phi"],
+                          "m":reco["jet_mass"]})[selection]
 
     jet_dt  = np.dtype([('pt', np.float32), 
                         ('eta', np.float32), 
@@ -28,7 +39,7 @@ def parse_jets(reco,selection):
                         ('energy', np.float32),
                         ('is_tagged', np.float32)])
     
-    max_jets = ak.max(ak.count(reco["jet_pt"].array(),axis=1))
+    max_jets = ak.max(ak.count(reco["jet_pt"],axis=1))
     jet_data = np.zeros((ak.count_nonzero(selection), max_jets), dtype=jet_dt)
 
     # Jets
@@ -36,7 +47,7 @@ def parse_jets(reco,selection):
     jet_data["eta"]         = pad_variable(jet_vectors.eta          , max_jets)
     jet_data["phi"]         = pad_variable(jet_vectors.phi          , max_jets)
     jet_data["energy"]      = pad_variable(jet_vectors.e            , max_jets)
-    jet_data["is_tagged"]   = pad_variable(reco["jet_btag"].array()[selection] , max_jets)
+    jet_data["is_tagged"]   = pad_variable(reco["jet_btag"][selection] , max_jets)
     
     jet_data = jet_data.astype([('pt', '<f4'), ('eta', '<f4'), ('phi', '<f4'), ('energy', '<f4'), ('is_tagged', '<?')])
 
@@ -48,21 +59,21 @@ def parse_leptons(reco,selection):
     Parses leptons - still needs the lepton type
     """
     
-    electron_vectors = vector.zip({"pt":reco["el_pt"].array(),
-                          "eta":reco["el_eta"].array(),
-                          "phi":reco["el_phi"].array(),
+    electron_vectors = vector.zip({"pt":reco["el_pt"],
+                          "eta":reco["el_eta"],
+                          "phi":reco["el_phi"],
                           "m":0.5110e-3})[selection]
 
-    muon_vectors = vector.zip({"pt":reco["mu_pt"].array(),
-                          "eta":reco["mu_eta"].array(),
-                          "phi":reco["mu_phi"].array(),
+    muon_vectors = vector.zip({"pt":reco["mu_pt"],
+                          "eta":reco["mu_eta"],
+                          "phi":reco["mu_phi"],
                           "m":105.66e-3})[selection]
     
     lepton_vectors = ak.concatenate([electron_vectors,muon_vectors],axis=1)
-    lepton_charge  = ak.concatenate([reco["el_charge"].array(),reco["mu_charge"].array()],axis=1)
-    lepton_type    = ak.concatenate([abs(reco["el_charge"].array())*0,abs(reco["mu_charge"].array())*1],axis=1)
+    lepton_charge  = ak.concatenate([reco["el_charge"],reco["mu_charge"]],axis=1)
+    lepton_type    = ak.concatenate([abs(reco["el_charge"])*0,abs(reco["mu_charge"])*1],axis=1)
 
-    lepton_pTs = ak.concatenate([reco["el_pt"].array(),reco["mu_pt"].array()],axis=1)[selection]
+    lepton_pTs = ak.concatenate([reco["el_pt"],reco["mu_pt"]],axis=1)[selection]
     sorted_indices =  ak.argsort(lepton_pTs,ascending=False)
     
     lepton_vectors = lepton_vectors[sorted_indices]
@@ -91,17 +102,17 @@ def parse_leptons(reco,selection):
 
 def parse_neutrinos(truth,selection):
     
-    truth_leptonic_mask = abs(truth["W_decay_id"].array())>10
-    up_type_mask        = truth["W_decay_id"].array()%2==0
+    truth_leptonic_mask = abs(truth["W_decay_id"])>10
+    up_type_mask        = truth["W_decay_id"]%2==0
     
-    neutrino_vectors = vector.zip({"pt":truth["W_decay_pt"].array(),
-                          "eta":truth["W_decay_eta"].array(),
-                          "phi":truth["W_decay_phi"].array(),
+    neutrino_vectors = vector.zip({"pt":truth["W_decay_pt"],
+                          "eta":truth["W_decay_eta"],
+                          "phi":truth["W_decay_phi"],
                           "m":0})[truth_leptonic_mask*up_type_mask]
     
     neutrino_vectors = neutrino_vectors[selection]
     
-    neutrino_ids = truth["W_decay_id"].array()[truth_leptonic_mask*up_type_mask][selection]
+    neutrino_ids = truth["W_decay_id"][truth_leptonic_mask*up_type_mask][selection]
     
     neutrino_ordering = ak.argsort(neutrino_ids,ascending=False) #This might break, it's to ensure the positive IDs come first (i.e.e the neutrinos produced alongside a negative lepton)
     
@@ -130,50 +141,63 @@ def parse_MET(reco,selection):
                              'formats':(np.float64, np.float64) } )
 
     met_data = np.zeros((ak.count_nonzero(selection)), dtype=met_dt)
-    met_data["MET"] = reco["met_met"].array().to_numpy()[selection][:,0]
-    met_data["phi"] = reco["met_phi"].array().to_numpy()[selection][:,0]
+    met_data["MET"] = reco["met_met"].to_numpy()[selection][:,0]
+    met_data["phi"] = reco["met_phi"].to_numpy()[selection][:,0]
     
     return met_data
     
 def parse_event_level(reco,selection):
     
     """
-    This assumes that the truth and reco trees are already matched
+    Expects the truth and reco trees aligned on EventNumber, see main
     """
     # Event-level data
-    njets  = ak.count(reco["jet_btag"].array()[selection],axis=1)
-    nbjets = ak.count_nonzero(reco["jet_btag"].array()[selection],axis=1)
-    eventNumber = reco["EventNumber"].array()[selection][:,0]
+    njets  = ak.count(reco["jet_btag"][selection],axis=1)
+    nbjets = ak.count_nonzero(reco["jet_btag"][selection],axis=1)
+    eventNumber = reco["EventNumber"][selection][:,0]
     
     return njets,nbjets,eventNumber
 
-def main(infile_name,outfile_name,split_ratio):
+def main(infile_name,outfile_name,split_ratio,config=None,profiler=None):
     
-    reco  = uproot.open(f"{infile_name}:Reco")
-    truth = uproot.open(f"{infile_name}:Truth")
+    config   = config or ReaderConfig()
+    profiler = profiler or Profiler(enabled=False)
+
+    profiler.start("load")
+    reco_tree  = config.open(infile_name,"Reco")
+    truth_tree = config.open(infile_name,"Truth")
+    # Merged outputs number the events of each input from 0, see delphes.batch
+    source = [SOURCE] if SOURCE in reco_tree.keys() and SOURCE in truth_tree.keys() else []
+    reco   = config.read(reco_tree,RECO_COLUMNS+source)
+    truth  = config.read(truth_tree,TRUTH_COLUMNS+source)
+
+    # Rows are matched by event number, so filtered or merged outputs line up
+    reco, truth = align(reco,truth)
         
-    Nelectrons = ak.count(reco["el_pt"].array(),axis=1)
-    Nmuons     = ak.count(reco["mu_pt"].array(),axis=1)
+    profiler.start("truth")
+    Nelectrons = ak.count(reco["el_pt"],axis=1)
+    Nmuons     = ak.count(reco["mu_pt"],axis=1)
 
     reco_1L_mask = (Nelectrons+Nmuons)==1
     reco_2L_mask = (Nelectrons+Nmuons)==2
     reco_3L_mask = (Nelectrons+Nmuons)==3
     reco_4L_mask = (Nelectrons+Nmuons)==4
 
-    truth_leptonic_mask = abs(truth["W_decay_id"].array())>10
+    truth_leptonic_mask = abs(truth["W_decay_id"])>10
 
-    truth_1L_mask = ak.count(truth["W_decay_id"].array()[truth_leptonic_mask],axis=1)==2
-    truth_2L_mask = ak.count(truth["W_decay_id"].array()[truth_leptonic_mask],axis=1)==4
-    truth_3L_mask = ak.count(truth["W_decay_id"].array()[truth_leptonic_mask],axis=1)==6
-    truth_4L_mask = ak.count(truth["W_decay_id"].array()[truth_leptonic_mask],axis=1)==8
+    truth_1L_mask = ak.count(truth["W_decay_id"][truth_leptonic_mask],axis=1)==2
+    truth_2L_mask = ak.count(truth["W_decay_id"][truth_leptonic_mask],axis=1)==4
+    truth_3L_mask = ak.count(truth["W_decay_id"][truth_leptonic_mask],axis=1)==6
+    truth_4L_mask = ak.count(truth["W_decay_id"][truth_leptonic_mask],axis=1)==8
 
-    tau_event_mask = ak.count_nonzero(abs(truth["W_decay_id"].array())==15,axis=1)!=0
+    tau_event_mask = ak.count_nonzero(abs(truth["W_decay_id"])==15,axis=1)!=0
 
     full_1L_event = reco_1L_mask*truth_1L_mask*~tau_event_mask
     full_2L_event = reco_2L_mask*truth_2L_mask*~tau_event_mask
     full_3L_event = reco_3L_mask*truth_3L_mask*~tau_event_mask
     full_4L_event = reco_4L_mask*truth_4L_mask*~tau_event_mask
 
+    profiler.start("reco")
     print("Parsing event-level data")
     njets , nbjets, eventNumber = parse_event_level(reco,full_1L_event)
     
@@ -183,15 +207,19 @@ def main(infile_name,outfile_name,split_ratio):
     print("Parsing lepton data")
     lepton_data   = parse_leptons(reco,full_1L_event)
     
+    profiler.start("truth")
     print("Parsing neutrino data")
     neutrino_data = parse_neutrinos(truth,full_1L_event)
     
+    profiler.start("reco")
     print("Parsing MET data")
     met_data      = parse_MET(reco,full_1L_event)
+    profiler.stop()
     
     if any([len(x)!=jet_data.shape[0] for x in [lepton_data,neutrino_data,met_data]]):
         raise ValueError("The arrays are of different length")
     
+    profiler.start("write")
     hf_train = h5py.File(f"{outfile_name}_train.h5", 'w')
     hf_test  = h5py.File(f"{outfile_name}_test.h5" , 'w')
     
@@ -221,8 +249,17 @@ def main(infile_name,outfile_name,split_ratio):
     
     hf_train["data"].create_dataset('eventNumber',data=eventNumber[train_mask])
     hf_test["data"].create_dataset('eventNumber',data=eventNumber[test_mask])
+
+    hf_train.close()
+    hf_test.close()
+    profiler.stop()
     
 if __name__ == "__main__":
+    # Optional fourth argument: JSON report of the time and memory of each stage
+    profiler = Profiler(sys.argv[1],enabled=len(sys.argv)>4)
     main(infile_name=sys.argv[1],
          outfile_name=sys.argv[2],
-         split_ratio=sys.argv[3])
\ No newline at end of file
+         split_ratio=int(sys.argv[3]),
+         profiler=profiler)
+    if profiler.enabled:
+        profiler.write(sys.argv[4])
\ No newline at end of file
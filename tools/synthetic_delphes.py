@@ -0,0 +1,381 @@
+"""
+Writes synthetic Delphes-shaped ROOT files, and the matching LHE files, for
+testing and benchmarking the parsers without a MadLAD production, e.g.
+
+    python -m tools.synthetic_delphes delphes_4tops.root -n 100000 -p 4tops
+    python -m tools.synthetic_delphes events_4tops.lhe.gz -n 100000 -p 4tops --lhe
+
+The Particle collection follows the Pythia record layout the parsers rely on:
+two incoming gluons (status 21), on-shell tops and Ws (status 22) with M1
+pointing at their mother, b quarks and W decay products (status 23), status 1
+copies of the decay products and a variable number of underlying-event pions.
+Jet, Electron, Muon and MissingET are filled independently of the truth.
+Branch names follow condor/delphes_branches.py.
+"""
+
+import gzip
+import argparse
+
+import numpy as np
+import awkward as ak
+import uproot
+
+from condor.delphes_branches import branches as DELPHES_BRANCHES
+
+# Final states understood by the generator: number of tops, extra W, extra jet
+PROCESSES = {"4tops": {"tops": 4, "extra_W": False, "extra_jet": False},
+             "3tW":   {"tops": 3, "extra_W": True,  "extra_jet": False},
+             "3tj":   {"tops": 3, "extra_W": False, "extra_jet": True}}
+
+TOP_MASS = 172.5
+W_MASS   = 80.4
+B_MASS   = 4.7
+
+# (up-type, down-type) W+ decay products, the W- decays are charge conjugates
+HADRONIC_DECAYS = [(2,-1),(4,-3)]
+LEPTONIC_DECAYS = [(-11,12),(-13,14),(-15,16)]
+
+# Pythia status -> LHE status of the hard-process particles
+LHE_STATUS = {21:-1, 22:2, 23:1}
+
+
+def _four_vector(pt,eta,phi,m):
+    px = pt*np.cos(phi)
+    py = pt*np.sin(phi)
+    pz = pt*np.sinh(eta)
+    e  = np.sqrt(px**2+py**2+pz**2+m**2)
+    return np.stack([px,py,pz,e],axis=-1)
+
+
+def _boost(p,parent):
+
+    """
+    Boosts four-vectors p from the rest frame of parent into the lab frame
+    """
+
+    b  = parent[...,:3]/parent[...,3:4]
+    b2 = np.sum(b**2,axis=-1,keepdims=True)
+    gamma = 1/np.sqrt(1-b2)
+    bp = np.sum(b*p[...,:3],axis=-1,keepdims=True)
+    gamma2 = np.where(b2>0,(gamma-1)/np.where(b2>0,b2,1),0)
+    xyz = p[...,:3] + gamma2*bp*b + gamma*b*p[...,3:4]
+    e   = gamma*(p[...,3:4]+bp)
+    return np.concatenate([xyz,e],axis=-1)
+
+
+def _two_body(parent,m_parent,m1,m2,rng):
+
+    """
+    Isotropic two-body decay of parent (lab-frame four-vectors)
+    """
+
+    n = parent.shape[:-1]
+    p = np.full(n,np.sqrt(max((m_parent**2-(m1+m2)**2)*(m_parent**2-(m1-m2)**2),0))/(2*m_parent))
+    cos_theta = rng.uniform(-1,1,n)
+    sin_theta = np.sqrt(1-cos_theta**2)
+    phi = rng.uniform(-np.pi,np.pi,n)
+    direction = np.stack([sin_theta*np.cos(phi),sin_theta*np.sin(phi),cos_theta],axis=-1)
+    d1 = np.concatenate([ p[...,None]*direction,np.sqrt(p**2+m1**2)[...,None]],axis=-1)
+    d2 = np.concatenate([-p[...,None]*direction,np.sqrt(p**2+m2**2)[...,None]],axis=-1)
+    return _boost(d1,parent), _boost(d2,parent)
+
+
+def _kinematics(p):
+    px,py,pz,e = p[...,0],p[...,1],p[...,2],p[...,3]
+    pt  = np.hypot(px,py)
+    eta = np.arcsinh(pz/np.where(pt>0,pt,1e-9))
+    phi = np.arctan2(py,px)
+    m   = np.sqrt(np.clip(e**2-px**2-py**2-pz**2,0,None))
+    return pt,eta,phi,e,m
+
+
+def hard_process(n_events,process,rng):
+
+    """
+    Builds the hard process of n_events: incoming gluons, tops, Ws, b quarks,
+    the extra W or jet, W decay products and their status 1 copies.
+    Returns a dictionary of (n_events, n_particles) arrays (PID, Status, M1,
+    M2, D1, D2 and the four-vectors p4) and the number of particles before
+    the status 1 copies, which is the LHE record.
+    """
+
+    spec   = PROCESSES[process]
+    n_tops = spec["tops"]
+    n_W    = n_tops + spec["extra_W"]
+
+    # Index layout of the hard process
+    i_tops   = 2 + np.arange(n_tops)
+    i_extraW = 2 + n_tops + np.arange(int(spec["extra_W"]))
+    i_topWs  = 2 + n_tops + len(i_extraW) + np.arange(n_tops)
+    i_Ws     = np.concatenate([i_extraW,i_topWs])
+    i_bs     = i_topWs[-1] + 1 + np.arange(n_tops)
+    i_jet    = i_bs[-1] + 1 + np.arange(int(spec["extra_jet"]))
+    i_decays = (i_jet[-1] if len(i_jet) else i_bs[-1]) + 1 + np.arange(2*n_W)
+    i_copies = i_decays[-1] + 1 + np.arange(n_tops+2*n_W)
+    n_hard   = i_copies[-1] + 1
+
+    pid    = np.zeros((n_events,n_hard),dtype=np.int32)
+    status = np.zeros((n_events,n_hard),dtype=np.int32)
+    m1     = np.full((n_events,n_hard),-1,dtype=np.int32)
+    m2     = np.full((n_events,n_hard),-1,dtype=np.int32)
+    d1     = np.full((n_events,n_hard),-1,dtype=np.int32)
+    d2     = np.full((n_events,n_hard),-1,dtype=np.int32)
+    p4     = np.zeros((n_events,n_hard,4))
+
+    # Incoming gluons
+    pid[:,:2]    = 21
+    status[:,:2] = 21
+    d1[:,:2]     = i_tops[0]
+    d2[:,:2]     = i_extraW[-1] if len(i_extraW) else i_tops[-1]
+    x = rng.uniform(0.05,0.5,(n_events,2))*6500.
+    p4[:,0] = np.stack([0*x[:,0],0*x[:,0], x[:,0],x[:,0]],axis=-1)
+    p4[:,1] = np.stack([0*x[:,1],0*x[:,1],-x[:,1],x[:,1]],axis=-1)
+
+    # Tops, alternating in sign
+    top_sign = np.where(np.arange(n_tops)%2==0,1,-1)
+    pid[:,i_tops]    = 6*top_sign
+    status[:,i_tops] = 22
+    m1[:,i_tops]     = 0
+    m2[:,i_tops]     = 1
+    d1[:,i_tops]     = i_topWs
+    d2[:,i_tops]     = i_bs
+    p4[:,i_tops]     = _four_vector(rng.exponential(120.,(n_events,n_tops))+20.,
+                                    rng.normal(0,1.5,(n_events,n_tops)),
+                                    rng.uniform(-np.pi,np.pi,(n_events,n_tops)),
+                                    TOP_MASS)
+
+    # Extra W from the hard process
+    if len(i_extraW):
+        W_sign = np.where(rng.uniform(size=n_events)<0.5,1,-1)
+        pid[:,i_extraW[0]]    = 24*W_sign
+        status[:,i_extraW[0]] = 22
+        m1[:,i_extraW[0]]     = 0
+        m2[:,i_extraW[0]]     = 1
+        p4[:,i_extraW[0]]     = _four_vector(rng.exponential(100.,n_events)+10.,
+                                             rng.normal(0,1.5,n_events),
+                                             rng.uniform(-np.pi,np.pi,n_events),
+                                             W_MASS)
+
+    # t -> W b
+    W_p4, b_p4 = _two_body(p4[:,i_tops],TOP_MASS,W_MASS,B_MASS,rng)
+    pid[:,i_topWs]    = 24*top_sign
+    status[:,i_topWs] = 22
+    m1[:,i_topWs]     = i_tops
+    m2[:,i_topWs]     = i_tops
+    p4[:,i_topWs]     = W_p4
+
+    pid[:,i_bs]    = 5*top_sign
+    status[:,i_bs] = 23
+    m1[:,i_bs]     = i_tops
+    m2[:,i_bs]     = i_tops
+    p4[:,i_bs]     = b_p4
+
+    # Extra light jet
+    if len(i_jet):
+        pid[:,i_jet[0]]    = rng.choice([1,-1,2,-2,3,-3,4,-4],n_events)
+        status[:,i_jet[0]] = 23
+        m1[:,i_jet[0]]     = 0
+        m2[:,i_jet[0]]     = 1
+        p4[:,i_jet[0]]     = _four_vector(rng.exponential(80.,n_events)+20.,
+                                          rng.normal(0,2.,n_events),
+                                          rng.uniform(-np.pi,np.pi,n_events),
+                                          0.)
+
+    # W -> f f'
+    all_decays = np.array(HADRONIC_DECAYS+LEPTONIC_DECAYS)
+    branching  = np.array([1/3,1/3,1/9,1/9,1/9])
+    choice     = rng.choice(len(all_decays),(n_events,n_W),p=branching)
+    W_charge   = np.sign(pid[:,i_Ws])
+    decay_ids  = all_decays[choice]*W_charge[...,None]
+    f1, f2 = _two_body(p4[:,i_Ws],W_MASS,0.,0.,rng)
+    i_first, i_second = i_decays[0::2], i_decays[1::2]
+    pid[:,i_first]     = decay_ids[...,0]
+    pid[:,i_second]    = decay_ids[...,1]
+    status[:,i_decays] = 23
+    m1[:,i_first]      = i_Ws
+    m1[:,i_second]     = i_Ws
+    m2[:,i_first]      = i_Ws
+    m2[:,i_second]     = i_Ws
+    d1[:,i_Ws]         = i_first
+    d2[:,i_Ws]         = i_second
+    p4[:,i_first]      = f1
+    p4[:,i_second]     = f2
+
+    # Status 1 copies of the b quarks and W decay products
+    originals = np.concatenate([i_bs,i_decays])
+    pid[:,i_copies]       = pid[:,originals]
+    status[:,i_copies]    = 1
+    m1[:,i_copies]        = originals
+    m2[:,i_copies]        = originals
+    d1[:,originals]       = i_copies
+    d2[:,originals]       = i_copies
+    p4[:,i_copies]        = p4[:,originals]
+
+    hard = {"PID":pid, "Status":status, "M1":m1, "M2":m2, "D1":d1, "D2":d2, "p4":p4}
+    return hard, int(i_copies[0])
+
+
+def build_particles(n_events,process,rng):
+
+    """
+    Builds the Particle collection for n_events of a given process
+    Returns a dictionary of jagged arrays keyed by the Particle member name
+    """
+
+    hard, _ = hard_process(n_events,process,rng)
+    n_hard  = hard["PID"].shape[1]
+
+    # Underlying-event pions, attached to the incoming gluons
+    n_ue    = rng.poisson(20,n_events)+1
+    ue_tot  = int(n_ue.sum())
+    ue_pid  = rng.choice([211,-211,111],ue_tot).astype(np.int32)
+    ue_p4   = _four_vector(rng.exponential(2.,ue_tot)+0.3,
+                           rng.uniform(-5,5,ue_tot),
+                           rng.uniform(-np.pi,np.pi,ue_tot),
+                           0.1396)
+
+    counts  = n_hard + n_ue
+    starts  = np.concatenate([[0],np.cumsum(counts)[:-1]])
+    hard_pos = (starts[:,None]+np.arange(n_hard)).ravel()
+    ue_mask = np.ones(int(counts.sum()),dtype=bool)
+    ue_mask[hard_pos] = False
+
+    def _join(hard,ue):
+        out = np.empty((len(ue_mask),*hard.shape[2:]),dtype=hard.dtype)
+        out[hard_pos] = hard.reshape(n_events*n_hard,*hard.shape[2:])
+        out[ue_mask]  = ue
+        return out
+
+    flat_p4 = _join(hard["p4"],ue_p4)
+    pt,eta,phi,e,mass = _kinematics(flat_p4)
+    pid = _join(hard["PID"],ue_pid)
+    # Integer charges only: charged leptons, Ws and charged pions
+    charge = np.select([np.isin(abs(pid),[11,13,15]),np.isin(abs(pid),[24,211])],[-np.sign(pid),np.sign(pid)],0)
+    flat = {"PID":      pid,
+            "Status":   _join(hard["Status"],np.ones(ue_tot,dtype=np.int32)),
+            "M1":       _join(hard["M1"],np.zeros(ue_tot,dtype=np.int32)),
+            "M2":       _join(hard["M2"],np.ones(ue_tot,dtype=np.int32)),
+            "D1":       _join(hard["D1"],np.full(ue_tot,-1,dtype=np.int32)),
+            "D2":       _join(hard["D2"],np.full(ue_tot,-1,dtype=np.int32)),
+            "Charge":   charge.astype(np.int32),
+            "Mass":     mass,
+            "E":        e,
+            "Px":       flat_p4[:,0],
+            "Py":       flat_p4[:,1],
+            "Pz":       flat_p4[:,2],
+            "P":        np.linalg.norm(flat_p4[:,:3],axis=1),
+            "PT":       pt,
+            "Eta":      eta,
+            "Phi":      phi,
+            "Rapidity": 0.5*np.log(np.clip(e+flat_p4[:,2],1e-9,None)/np.clip(e-flat_p4[:,2],1e-9,None))}
+    return {k: ak.unflatten(v,counts) for k,v in flat.items()}
+
+
+def _objects(n_events,mean,rng,fields):
+    counts = rng.poisson(mean,n_events)
+    total  = int(counts.sum())
+    out = {}
+    for name,sampler in fields.items():
+        out[name] = ak.unflatten(sampler(total),counts)
+    return out
+
+
+def build_reco(n_events,rng):
+
+    """
+    Builds the Jet, Electron, Muon and MissingET collections
+    """
+
+    def pt(n):  return rng.exponential(50.,n)+25.
+    def eta(n): return rng.uniform(-2.5,2.5,n)
+    def phi(n): return rng.uniform(-np.pi,np.pi,n)
+    def charge(n): return rng.choice([-1,1],n).astype(np.int32)
+
+    reco = {}
+    reco["Jet"]       = _objects(n_events,8,rng,{"PT":pt,"Eta":eta,"Phi":phi,
+                                                  "Mass":lambda n: rng.uniform(2.,20.,n),
+                                                  "BTag":lambda n: (rng.uniform(size=n)<0.3).astype(np.uint32)})
+    reco["Electron"]  = _objects(n_events,0.6,rng,{"PT":pt,"Eta":eta,"Phi":phi,"Charge":charge})
+    reco["Muon"]      = _objects(n_events,0.6,rng,{"PT":pt,"Eta":eta,"Phi":phi,"Charge":charge})
+    ones = np.ones(n_events,dtype=np.int64)
+    reco["MissingET"] = {"MET": ak.unflatten(rng.exponential(60.,n_events),ones),
+                         "Eta": ak.unflatten(rng.normal(0,2,n_events),ones),
+                         "Phi": ak.unflatten(rng.uniform(-np.pi,np.pi,n_events),ones)}
+    return reco
+
+
+def generate(outname:str,n_events:int,process:str="4tops",seed:int=0,chunk_size:int=10_000):
+
+    """
+    Writes n_events synthetic Delphes events of a given process to outname.
+    Each chunk of chunk_size events becomes one basket per branch, as in a
+    Delphes file.
+    """
+
+    rng = np.random.default_rng(seed)
+    with uproot.recreate(outname) as file:
+        for start in range(0,n_events,chunk_size):
+            n = min(chunk_size,n_events-start)
+            collections = {"Event":{"Number":ak.unflatten(np.arange(start,start+n,dtype=np.int64),np.ones(n,dtype=np.int64))},
+                           "Particle":build_particles(n,process,rng)}
+            collections.update(build_reco(n,rng))
+            if start==0:
+                for collection,members in collections.items():
+                    unknown = [m for m in members if f"{collection}.{m}" not in DELPHES_BRANCHES[collection]]
+                    assert not unknown, f"{unknown} are not {collection} branches in condor/delphes_branches.py"
+            chunk = {k: ak.zip(v) for k,v in collections.items()}
+            if start==0:
+                file.mktree("Delphes",{k:v.type for k,v in chunk.items()},
+                            counter_name=lambda counted: f"{counted}_size",
+                            field_name=lambda outer,inner: f"{outer}.{inner}")
+            file["Delphes"].extend(chunk)
+
+
+def generate_lhe(outname:str,n_events:int,process:str="4tops",seed:int=0,chunk_size:int=10_000):
+
+    """
+    Writes the hard process of n_events synthetic events as an LHE file,
+    gzipped if outname ends with .gz
+    """
+
+    rng = np.random.default_rng(seed)
+    opener = gzip.open if outname.endswith(".gz") else open
+    with opener(outname,"wt") as f:
+        f.write('<LesHouchesEvents version="3.0">\n<header>\n</header>\n<init>\n'
+                "2212 2212 6.500000e+03 6.500000e+03 0 0 260000 260000 -4 1\n"
+                "1.000000e+00 1.000000e-02 1.000000e+00 1\n</init>\n")
+        for start in range(0,n_events,chunk_size):
+            n = min(chunk_size,n_events-start)
+            hard, n_lhe = hard_process(n,process,rng)
+            status = np.vectorize(LHE_STATUS.get)(hard["Status"][:,:n_lhe])
+            # LHE mothers are 1-based, 0 for none
+            columns = [hard["PID"][:,:n_lhe], status, hard["M1"][:,:n_lhe]+1, hard["M2"][:,:n_lhe]+1,
+                       *[hard["p4"][:,:n_lhe,i] for i in range(4)], _kinematics(hard["p4"][:,:n_lhe])[4]]
+            rows = np.stack(columns,axis=-1)
+            event_header = f"<event>\n{n_lhe} 1 +1.0000000e+00 1.00000000e+02 7.54677100e-03 1.18000000e-01\n"
+            for event in rows:
+                f.write(event_header)
+                f.write("".join("%d %d %d %d 0 0 %.10e %.10e %.10e %.10e %.10e 0.0000e+00 9.0000e+00\n" % tuple(row) for row in event))
+                f.write("</event>\n")
+        f.write("</LesHouchesEvents>\n")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Write a synthetic Delphes ROOT file or LHE file")
+    parser.add_argument("outname", type=str)
+    parser.add_argument("-n","--Nevents", type=int, default=10_000)
+    parser.add_argument("-p","--process", type=str, default="4tops", choices=list(PROCESSES))
+    parser.add_argument("-s","--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="Events per basket")
+    parser.add_argument("--lhe", action="store_true", help="Write the hard process as an LHE file instead")
+
+    args = parser.parse_args()
+    if args.lhe:
+        generate_lhe(args.outname,args.Nevents,args.process,args.seed,args.chunk_size)
+    else:
+        generate(args.outname,args.Nevents,args.process,args.seed,args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()